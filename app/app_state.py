@@ -3,7 +3,8 @@
 Module to hold shared application state variables, now per-session.
 """
 import threading
-import queue  # For queue.Queue
+import time
+import itertools
 import collections  # For collections.deque
 import logging
 from copy import deepcopy
@@ -11,6 +12,12 @@ import uuid
 import flask  # Required for accessing Flask's session object
 from typing import Dict, Optional, Set, Deque, List, Any  # Import necessary types
 
+import config
+import lane_queue
+import row_diff
+import telemetry_store
+import track_projection
+
 # Logger for this module
 logger = logging.getLogger("F1App.AppState")
 
@@ -57,9 +64,29 @@ INITIAL_SESSION_TRACK_COORDINATES_CACHE: Dict[str, Any] = {
 INITIAL_RACE_CONTROL_LOG_MAXLEN: int = 50
 INITIAL_TEAM_RADIO_MESSAGES_MAXLEN: int = 20
 INITIAL_ACTIVE_YELLOW_SECTORS: Set[Any] = set()  # Example type hint
-INITIAL_TELEMETRY_DATA: Dict = {}
 INITIAL_DRIVER_STINT_DATA: Dict = {}
 INITIAL_DRIVER_INFO: Dict = {}
+# SessionState attributes written by the data processors (see data_processing.py).
+PROCESSED_STATE_FIELDS = (
+    "data_store", "timing_state", "lap_time_history", "track_status_data", "session_details",
+    "race_control_log", "team_radio_messages", "active_yellow_sectors", "driver_stint_data",
+    "driver_info", "extrapolated_clock_info", "qualifying_segment_state", "session_bests",
+    "live_standings", "practice_session_actual_start_utc", "practice_session_scheduled_duration_seconds",
+    "current_processed_feed_timestamp_utc_dt", "session_start_feed_timestamp_utc_dt",
+    "current_segment_scheduled_duration_seconds", "domain_versions",
+)
+# Display domains with their own change counter (see SessionState.bump_domain_versions)
+STATE_DOMAINS = (
+    "timing", "stints", "lap_history", "race_control", "weather", "track_status", "session", "team_radio",
+    "positions", "drivers",
+)
+# Shared by all sessions so a version value is never reused, e.g. after a seek restores older state
+_DOMAIN_VERSION_COUNTER = itertools.count(1)
+INITIAL_PROCESSING_METRICS: Dict[str, Any] = {
+    "batches": 0, "items": 0, "coalesced": 0,
+    "last_batch_size": 0, "max_batch_size": 0,
+    "last_batch_ms": 0.0, "avg_batch_ms": 0.0, "max_batch_ms": 0.0,
+}
 
 
 # --- Per-Session State Class ---
@@ -70,8 +97,12 @@ class SessionState:
 
         self.app_status: Dict[str, Any] = deepcopy(INITIAL_SESSION_APP_STATUS)
         self.stop_event: threading.Event = threading.Event()
+        # Refreshed by get_or_create_session_state(); read by the idle session reaper
+        self.last_access_monotonic: float = time.monotonic()
         # type: ignore[type-arg] # If using older queue version
-        self.data_queue: queue.Queue = queue.Queue()
+        self.data_queue: lane_queue.LaneQueue = lane_queue.LaneQueue(
+            config.DATA_QUEUE_LANES, config.DATA_QUEUE_DEFAULT_LANE,
+            config.DATA_QUEUE_MAX_LANE_DELAY_SECONDS)
         self.data_store: Dict[str, Any] = deepcopy(INITIAL_SESSION_DATA_STORE)
         self.timing_state: Dict[str, Any] = deepcopy(
             INITIAL_SESSION_TIMING_STATE)
@@ -89,11 +120,26 @@ class SessionState:
             INITIAL_SESSION_TRACK_COORDINATES_CACHE)
         self.active_yellow_sectors: Set[Any] = deepcopy(
             INITIAL_ACTIVE_YELLOW_SECTORS)
-        self.telemetry_data: Dict[str, Any] = deepcopy(INITIAL_TELEMETRY_DATA)
+        self.telemetry_data = telemetry_store.TelemetryStore()
+        # Every car's distance along the lap, projected from Position X/Y (track_projection.py)
+        self.track_positions = track_projection.TrackPositions()
         self.driver_stint_data: Dict[str, Any] = deepcopy(
             INITIAL_DRIVER_STINT_DATA)
         self.driver_info: Dict[str, Any] = deepcopy(INITIAL_DRIVER_INFO)
+        # Batch size / lock-hold latency of the data processing loop (see data_processing.py)
+        self.processing_metrics: Dict[str, Any] = deepcopy(INITIAL_PROCESSING_METRICS)
+        # Change counter per display domain; callbacks skip rendering while theirs is unchanged
+        self.domain_versions: Dict[str, int] = {}
+        self.bump_domain_versions()
+        # Latest read-only copy of the processed state for lock-free readers (see state_snapshot.py)
+        self.published_snapshot: Optional[Any] = None
+        self.snapshot_dirty: bool = False
+        self.last_snapshot_publish_monotonic: float = 0.0
         self.replay_speed: float = 1.0
+        # Index of the next frame this session will play from the shared replay timeline
+        self.replay_cursor: int = 0
+        # Pending seek for the replay thread, e.g. {"lap": 40} or {"offset_seconds": 1800.0}
+        self.replay_seek_request: Optional[Dict[str, Any]] = None
 
         # Assuming it's a file-like object, replace Any with actual type
         self.live_data_file: Optional[Any] = None
@@ -135,6 +181,8 @@ class SessionState:
         self.connection_thread: Optional[threading.Thread] = None  # CORRECTED
         # Replace Any with actual HubConnection type if available
         self.hub_connection: Optional[Any] = None
+        # payload_decoder.OrderedDecodeStage, created on the first feed message
+        self.decode_stage: Optional[Any] = None
         self.replay_thread: Optional[threading.Thread] = None  # CORRECTED
         # CORRECTED
         self.data_processing_thread: Optional[threading.Thread] = None
@@ -144,20 +192,41 @@ class SessionState:
         self.auto_connect_thread: Optional[threading.Thread] = None
         self.live_standings: Optional[dict] = None # <-- ADD THIS LINE
         self.track_data_fetch_thread: Optional[threading.Thread] = None # ADD THIS LINE
+        # Key of the shared live hub this browser session is subscribed to (None when using its own state)
+        self.live_hub_key: Optional[str] = None
+        # Timing table rows last sent to this browser, the base of its row-level patches
+        self.timing_table_emitted = row_diff.EmittedRows(config.TIMING_TABLE_EMISSIONS_KEPT)
 
         logger.info(
             f"Initialized new SessionState for session_id: {self.session_id}")
 
+    def bump_domain_versions(self, *domains: str):
+        """Marks the given display domains (all of them if none are given) as changed. Hold self.lock."""
+        version = next(_DOMAIN_VERSION_COUNTER)
+        for domain in domains or STATE_DOMAINS:
+            self.domain_versions[domain] = version
+
+    def take_live_recorder(self) -> Any:
+        """
+        Detaches the open recorder (None if there is none) and marks saving as inactive.
+        LiveRecorder.write() and close() can block for seconds while the buffer drains, so
+        callers finish the returned recorder after releasing self.lock.
+        """
+        with self.lock:
+            recorder = self.live_data_file
+            self.live_data_file = None
+            self.is_saving_active = False
+        return recorder if recorder is not None and not recorder.closed else None
+
     def reset_state_variables(self):
         # (Implementation of reset_state_variables as in Response #13)
         # Ensure all attributes are reset according to their types defined above
+        open_recorder = self.take_live_recorder()
         with self.lock:
             self.app_status = deepcopy(INITIAL_SESSION_APP_STATUS)
-            while not self.data_queue.empty():
-                try:
-                    self.data_queue.get_nowait()
-                except queue.Empty:
-                    break
+            if self.decode_stage is not None:
+                self.decode_stage.discard_pending()
+            self.data_queue.clear()
             self.data_store = deepcopy(INITIAL_SESSION_DATA_STORE)
             self.timing_state = deepcopy(INITIAL_SESSION_TIMING_STATE)
             self.lap_time_history = deepcopy(INITIAL_SESSION_LAP_TIME_HISTORY)
@@ -170,20 +239,17 @@ class SessionState:
                 INITIAL_SESSION_TRACK_COORDINATES_CACHE)
             self.active_yellow_sectors = deepcopy(
                 INITIAL_ACTIVE_YELLOW_SECTORS)
-            self.telemetry_data = deepcopy(INITIAL_TELEMETRY_DATA)
+            self.telemetry_data = telemetry_store.TelemetryStore()
+            self.track_positions = track_projection.TrackPositions()
             self.driver_stint_data = deepcopy(INITIAL_DRIVER_STINT_DATA)
             self.driver_info = deepcopy(INITIAL_DRIVER_INFO)
+            self.processing_metrics = deepcopy(INITIAL_PROCESSING_METRICS)
+            self.bump_domain_versions()
+            self.published_snapshot = None
+            self.snapshot_dirty = False
             self.replay_speed = 1.0
-            if self.live_data_file and not self.live_data_file.closed:
-                try:
-                    logger.warning(
-                        f"Session {self.session_id}: Found an open live_data_file during reset. Attempting to close.")
-                    self.live_data_file.close()
-                except Exception as e:
-                    logger.error(
-                        f"Session {self.session_id}: Error closing live_data_file during reset: {e}")
-            self.live_data_file = None
-            self.is_saving_active = False
+            self.replay_cursor = 0
+            self.replay_seek_request = None
             self.record_live_data = False
             self.current_recording_filename = None
             self.extrapolated_clock_info = deepcopy(
@@ -212,14 +278,27 @@ class SessionState:
             self.auto_connect_thread = None
             self.live_standings = None
             self.track_data_fetch_thread = None # ADD THIS LINE
+            self.live_hub_key = None
             logger.info(
                 f"Session {self.session_id}: State variables have been reset to defaults.")
+        if open_recorder is not None:  # Drained and joined outside the lock
+            try:
+                logger.warning(
+                    f"Session {self.session_id}: Found an open live_data_file during reset. Attempting to close.")
+                open_recorder.close()
+            except Exception as e:
+                logger.error(
+                    f"Session {self.session_id}: Error closing live_data_file during reset: {e}")
 
 
 # --- Global Session Management ---
 SESSIONS_STORE: Dict[str, SessionState] = {}  # Added type hint
 SESSIONS_STORE_LOCK: threading.Lock = threading.Lock()
 
+# Processed state owned by each shared live hub (see live_hub.py), keyed by hub key.
+LIVE_HUB_STATES: Dict[str, SessionState] = {}
+LIVE_HUB_STATES_LOCK: threading.Lock = threading.Lock()
+
 
 def get_current_session_id() -> Optional[str]:  # CORRECTED
     """
@@ -278,7 +357,35 @@ def get_or_create_session_state(session_id: Optional[str] = None) -> Optional[Se
                 f"Session_id '{resolved_session_id}' not in SESSIONS_STORE. Creating new SessionState.")
             SESSIONS_STORE[resolved_session_id] = SessionState(
                 resolved_session_id)
-        return SESSIONS_STORE[resolved_session_id]
+        session_state = SESSIONS_STORE[resolved_session_id]
+        # Idle sessions are evicted by session_lifecycle.py
+        session_state.last_access_monotonic = time.monotonic()
+        return session_state
+
+
+def get_data_state(session_state: Optional[SessionState]) -> Optional[SessionState]:
+    """
+    Resolves the state object holding the feed data a browser session should display.
+    Returns the shared live hub state when the session is subscribed to one, otherwise the session itself.
+    """
+    if session_state is None:
+        return None
+    hub_key = session_state.live_hub_key
+    if hub_key:
+        with LIVE_HUB_STATES_LOCK:
+            shared_state = LIVE_HUB_STATES.get(hub_key)
+        if shared_state is not None:
+            return shared_state
+    return session_state
+
+
+def get_display_state(session_id: Optional[str] = None) -> Optional[SessionState]:
+    """
+    Gets (or creates) the session for session_id and resolves it to the state its displays should read.
+    Per-browser fields (selected driver, preferences, replay controls) must still be read from
+    get_or_create_session_state().
+    """
+    return get_data_state(get_or_create_session_state(session_id))
 
 
 def remove_session_state(session_id: str):
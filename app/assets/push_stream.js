@@ -0,0 +1,83 @@
+// assets/push_stream.js
+// Server push for the dashboard (see push_stream.py). Merges pushed diffs into the Dash stores
+// and pauses the timing and car position polling while the stream is connected. If the stream
+// is unavailable (disabled, over the connection limit, old Dash without set_props) the
+// polling intervals simply keep running.
+
+if (!window.dash_clientside) { window.dash_clientside = {}; }
+if (!window.dash_clientside.clientside) {
+    window.dash_clientside.clientside = {};
+}
+
+Object.assign(window.dash_clientside.clientside, {
+    _pushSource: null,
+    _pushVersions: {},
+    _pushCars: {},
+
+    // Opens the stream on the dashboard page and closes it everywhere else
+    managePushStream: function(pathname, streamUrl) {
+        const funcName = 'managePushStream';
+        const ns = window.dash_clientside.clientside;
+        const setProps = window.dash_clientside.set_props;
+        if (typeof EventSource === 'undefined' || typeof setProps !== 'function') {
+            console.warn(`[JS ${funcName}] EventSource or dash_clientside.set_props unavailable, keeping polling.`);
+            return window.dash_clientside.no_update;
+        }
+        if (!streamUrl) {
+            return window.dash_clientside.no_update;
+        }
+        if (pathname !== '/') {
+            if (ns._pushSource) {
+                ns._pushSource.close();
+                ns._pushSource = null;
+            }
+            return {connected: false};
+        }
+        if (ns._pushSource) {
+            return window.dash_clientside.no_update;
+        }
+
+        const source = new EventSource(streamUrl);
+        ns._pushSource = source;
+        ns._pushVersions = {};
+        ns._pushCars = {};
+
+        source.onopen = function() {
+            setProps('push-status-store', {data: {connected: true}});
+        };
+        source.onerror = function() {
+            // EventSource reconnects by itself unless the server refused the stream (readyState CLOSED)
+            setProps('push-status-store', {data: {connected: false}});
+            if (source.readyState === EventSource.CLOSED && ns._pushSource === source) {
+                ns._pushSource = null;
+            }
+        };
+        source.addEventListener('versions', function(event) {
+            try {
+                Object.assign(ns._pushVersions, JSON.parse(event.data));
+                setProps('push-domain-versions-store', {data: Object.assign({}, ns._pushVersions)});
+            } catch (e) {
+                console.error(`[JS ${funcName}] Bad 'versions' event:`, e);
+            }
+        });
+        source.addEventListener('cars', function(event) {
+            try {
+                const diff = JSON.parse(event.data);
+                Object.assign(ns._pushCars, diff.cars || {});
+                (diff.removed || []).forEach(function(car) { delete ns._pushCars[car]; });
+                const storeData = {
+                    status: diff.status,
+                    timestamp: Date.now() / 1000,
+                    selected_driver: diff.selected_driver
+                };
+                if (diff.status === 'active') {
+                    storeData.cars = Object.assign({}, ns._pushCars);
+                }
+                setProps('car-positions-store', {data: storeData});
+            } catch (e) {
+                console.error(`[JS ${funcName}] Bad 'cars' event:`, e);
+            }
+        });
+        return window.dash_clientside.no_update;
+    }
+});
@@ -0,0 +1,238 @@
+# cache_warmer.py
+"""
+Command-line warmer of the historical data caches, for deployments.
+
+The FastF1 cache (FASTF1_CACHE_DIR) used to fill lazily: the first user to pick a
+session on the Historical Analysis page waited for its download. This loads every
+session of a season (or of selected events) ahead of time, across a process pool of
+--workers processes:
+
+  * the event schedule (main process),
+  * laps, results and, unless --no-telemetry, car/position telemetry of each session,
+    through fastf1 into its cache,
+  * our own derived data: the circuit geometry disk cache (circuit_geometry.py) of each
+    event, and a check that the historical analytics (historical_analytics.py) build
+    from the loaded laps.
+
+Progress is printed per session. Finished sessions are recorded in a state file next
+to the cache, so an interrupted run resumes where it stopped (--force reloads them);
+failed sessions are retried on the next run.
+
+For offline testing, --livetiming-url / --ergast-url / --circuit-api-url point the
+downloads at a local mirror, and --offline only reads an existing cache.
+
+Usage:
+    python cache_warmer.py 2024
+    python cache_warmer.py 2024 --events "Miami Grand Prix" "Emilia Romagna Grand Prix" --sessions Race Qualifying
+    python cache_warmer.py 2024 --workers 2 --cache-dir /data/ff1_cache --livetiming-url http://localhost:8000
+"""
+import json
+import logging
+import os
+import time
+import concurrent.futures
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional, List, Dict
+
+import config
+
+logger = logging.getLogger("F1App.CacheWarmer")
+
+STATE_FILE_NAME = "cache_warmer_state.json"
+_SESSION_COLUMNS = ['Session1', 'Session2', 'Session3', 'Session4', 'Session5']
+
+fastf1: Any = None  # Imported and configured by _init_worker, in every process
+
+
+# --- Worker process ---
+
+def _apply_mirror(fastf1_module: Any, livetiming_url: Optional[str], ergast_url: Optional[str]):
+    """Points fastf1's live timing and Ergast downloads at another server."""
+    if livetiming_url:
+        api_module = getattr(fastf1_module, '_api', None) or getattr(fastf1_module, 'api', None)
+        if api_module is not None and hasattr(api_module, 'base_url'):
+            api_module.base_url = livetiming_url.rstrip('/')
+        else:
+            logger.warning("This fastf1 version has no live timing base_url; --livetiming-url ignored.")
+    if ergast_url:
+        try:
+            from fastf1.ergast import interface as ergast_interface
+            ergast_interface.BASE_URL = ergast_url.rstrip('/')
+        except (ImportError, AttributeError):
+            logger.warning("This fastf1 version has no Ergast BASE_URL; --ergast-url ignored.")
+
+
+def _init_worker(options: Dict[str, Any]):
+    """Sets up fastf1 and our config in a pool process (and in the main process)."""
+    global fastf1
+    import fastf1
+    logging.basicConfig(level=options['log_level'], format=config.LOG_FORMAT_DEFAULT)
+    logging.getLogger('fastf1').setLevel(logging.WARNING)
+
+    cache_dir = Path(options['cache_dir'])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    config.FASTF1_CACHE_DIR = cache_dir
+    if options['geometry_cache_dir']:
+        config.CIRCUIT_GEOMETRY_CACHE_DIR = Path(options['geometry_cache_dir'])
+    if options['circuit_api_url']:
+        config.MULTIVIEWER_CIRCUIT_API_URL_TEMPLATE = options['circuit_api_url']
+    fastf1.Cache.enable_cache(str(cache_dir))
+    if options['offline']:
+        fastf1.Cache.offline_mode(True)
+    _apply_mirror(fastf1, options['livetiming_url'], options['ergast_url'])
+
+
+def _circuit_key(session: Any) -> Optional[str]:
+    try:
+        return str(session.session_info['Meeting']['Circuit']['Key'])
+    except (AttributeError, KeyError, TypeError):
+        return None
+
+
+def warm_session(year: int, event_name: str, session_name: str, telemetry: bool) -> Dict[str, Any]:
+    """Loads one session into the caches and returns what was warmed. Runs in a pool process."""
+    import circuit_geometry
+    import historical_analytics
+
+    started = time.monotonic()
+    session = fastf1.get_session(year, event_name, session_name)
+    session.load(laps=True, telemetry=telemetry, weather=False, messages=False)
+    analytics = historical_analytics.build_analytics(session.laps)
+
+    circuit_key = _circuit_key(session)
+    geometry_ok = circuit_key is not None and circuit_geometry.get_geometry(circuit_key, year) is not None
+    return {
+        "laps": len(session.laps),
+        "drivers": len(analytics.lap_options),
+        "stints": sum(len(stints) for stints in analytics.stints.values()),
+        "telemetry": telemetry,
+        "circuit_key": circuit_key,
+        "geometry": geometry_ok,
+        "seconds": round(time.monotonic() - started, 1),
+    }
+
+
+# --- Main process ---
+
+def _session_id(year: int, event_name: str, session_name: str, telemetry: bool) -> str:
+    return f"{year}|{event_name}|{session_name}|{'telemetry' if telemetry else 'laps'}"
+
+
+def load_state(state_path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(state_path.read_text())
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable warmer state {state_path}: {e}")
+        return {}
+
+
+def save_state(state_path: Path, state: Dict[str, Any]):
+    temp_path = state_path.with_suffix('.tmp')
+    temp_path.write_text(json.dumps(state, indent=1, sort_keys=True))
+    os.replace(temp_path, state_path)  # Atomic, so an interrupted run never leaves a torn file
+
+
+def plan_sessions(year: int, events: Optional[List[str]], sessions: Optional[List[str]]) -> List[Dict[str, str]]:
+    """Past sessions of the season's schedule, optionally limited to some events and session names."""
+    schedule = fastf1.get_event_schedule(year, include_testing=False)
+    now = datetime.now(timezone.utc)
+    wanted_events = {event.lower() for event in events} if events else None
+    wanted_sessions = {session.lower() for session in sessions} if sessions else None
+    planned = []
+    for _, event in schedule.iterrows():
+        event_name = event['EventName']
+        if wanted_events and event_name.lower() not in wanted_events:
+            continue
+        for column in _SESSION_COLUMNS:
+            session_name = event.get(column)
+            if not isinstance(session_name, str) or not session_name:
+                continue
+            if wanted_sessions and session_name.lower() not in wanted_sessions:
+                continue
+            session_start = event.get(f'{column}DateUtc')
+            if session_start is not None and session_start == session_start:  # Not NaT
+                if session_start.tzinfo is None:
+                    session_start = session_start.tz_localize('UTC')
+                if session_start > now:
+                    continue
+            planned.append({"event": event_name, "session": session_name})
+    if wanted_events:
+        missing = wanted_events - {entry["event"].lower() for entry in planned}
+        for event_name in sorted(missing):
+            logger.warning(f"No past sessions found for event '{event_name}' in {year}.")
+    return planned
+
+
+def run(year: int, options: Dict[str, Any], events: Optional[List[str]] = None,
+        sessions: Optional[List[str]] = None, telemetry: bool = True, workers: int = 4,
+        force: bool = False) -> Dict[str, int]:
+    """Warms every planned session with at most `workers` loads at a time. Returns counts."""
+    _init_worker(options)
+    state_path = Path(options['cache_dir']) / STATE_FILE_NAME
+    state = load_state(state_path)
+
+    planned = plan_sessions(year, events, sessions)
+    pending = [entry for entry in planned
+               if force or state.get(_session_id(year, entry["event"], entry["session"], telemetry), {}).get("status") != "done"]
+    print(f"{year}: {len(planned)} sessions, {len(planned) - len(pending)} already warm, {len(pending)} to load "
+          f"with {workers} worker(s).")
+
+    counts = {"done": 0, "failed": 0, "skipped": len(planned) - len(pending)}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker,
+                                                initargs=(options,)) as pool:
+        futures = {pool.submit(warm_session, year, entry["event"], entry["session"], telemetry): entry
+                   for entry in pending}
+        for finished, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            entry = futures[future]
+            session_id = _session_id(year, entry["event"], entry["session"], telemetry)
+            label = f"[{finished:>3}/{len(pending)}] {year} {entry['event']} - {entry['session']}"
+            try:
+                result = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                state[session_id] = {"status": "failed", "error": str(e)[:300]}
+                print(f"{label}: FAILED ({e})")
+            else:
+                counts["done"] += 1
+                state[session_id] = dict(result, status="done")
+                print(f"{label}: {result['laps']} laps, {result['drivers']} drivers, {result['stints']} stints, "
+                      f"geometry {'ok' if result['geometry'] else 'missing'} in {result['seconds']}s")
+            save_state(state_path, state)
+    print(f"{year}: {counts['done']} warmed, {counts['failed']} failed, {counts['skipped']} already warm.")
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Load a season's historical sessions into the FastF1 and app caches.")
+    parser.add_argument("year", type=int, help="Season to warm")
+    parser.add_argument("--events", nargs="+", default=None, help="Only these events (schedule EventName)")
+    parser.add_argument("--sessions", nargs="+", default=None, help="Only these session names, e.g. Race Qualifying")
+    parser.add_argument("--workers", type=int, default=config.CACHE_WARMER_WORKERS, help="Sessions loaded in parallel")
+    parser.add_argument("--no-telemetry", action="store_true", help="Load laps and results only")
+    parser.add_argument("--force", action="store_true", help="Reload sessions the state file marks as warm")
+    parser.add_argument("--cache-dir", type=Path, default=config.FASTF1_CACHE_DIR, help="FastF1 cache directory")
+    parser.add_argument("--geometry-cache-dir", type=Path, default=None, help="Circuit geometry cache directory")
+    parser.add_argument("--livetiming-url", default=None, help="Live timing archive mirror, e.g. http://localhost:8000")
+    parser.add_argument("--ergast-url", default=None, help="Ergast API mirror")
+    parser.add_argument("--circuit-api-url", default=None, help="Circuit API URL template with {circuit_key} and {year}")
+    parser.add_argument("--offline", action="store_true", help="Only use data already in the FastF1 cache")
+    parser.add_argument("--verbose", action="store_true", help="Log at INFO level")
+    cli_args = parser.parse_args()
+
+    warmer_options = {
+        "cache_dir": str(cli_args.cache_dir),
+        "geometry_cache_dir": str(cli_args.geometry_cache_dir) if cli_args.geometry_cache_dir else None,
+        "livetiming_url": cli_args.livetiming_url,
+        "ergast_url": cli_args.ergast_url,
+        "circuit_api_url": cli_args.circuit_api_url,
+        "offline": cli_args.offline,
+        "log_level": logging.INFO if cli_args.verbose else logging.WARNING,
+    }
+    warm_counts = run(cli_args.year, warmer_options, events=cli_args.events, sessions=cli_args.sessions,
+                      telemetry=not cli_args.no_telemetry, workers=cli_args.workers, force=cli_args.force)
+    sys.exit(1 if warm_counts["failed"] else 0)
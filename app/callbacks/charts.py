@@ -5,7 +5,6 @@ Callbacks for generating and updating all Plotly charts and graphs.
 import logging
 import time
 import inspect
-import copy
 from typing import Optional
 import json
 
@@ -15,14 +14,39 @@ from dash import dcc, html, dash_table, no_update, Patch
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
+import numpy as np
 
 from app_instance import app
 import app_state
 import config
+import state_snapshot
+import telemetry_store
 import utils
 
 logger = logging.getLogger(__name__)
 
+TELEMETRY_PLOT_CHANNELS = ['Speed', 'RPM', 'Throttle', 'Brake', 'Gear', 'DRS']
+
+
+def _telemetry_plot_columns(lap_views):
+    """
+    Valid-sample timestamps (datetime64) and float channel values (missing -> NaN) from a lap's
+    zero-copy views, copied once into the plot arrays. None if the lap has no valid timestamp.
+    """
+    timestamps_view = lap_views[telemetry_store.TIMESTAMP_KEY]
+    timestamps_ms = np.frombuffer(timestamps_view, dtype=timestamps_view.format)
+    valid_mask = timestamps_ms != telemetry_store.MISSING_VALUES[timestamps_view.format]
+    if not valid_mask.any():
+        return None
+    channel_values = {}
+    for channel in TELEMETRY_PLOT_CHANNELS:
+        channel_view = lap_views[channel]
+        values = np.frombuffer(channel_view, dtype=channel_view.format)[valid_mask].astype(float)
+        values[values == telemetry_store.MISSING_VALUES[channel_view.format]] = np.nan
+        channel_values[channel] = values
+    return timestamps_ms[valid_mask].astype('datetime64[ms]'), channel_values
+
+
 @app.callback(
     [Output('driver-details-output', 'children'),      # For basic driver Name/Team
      Output('lap-selector-dropdown', 'options'),       # For Telemetry Tab
@@ -42,7 +66,7 @@ logger = logging.getLogger(__name__)
 def update_driver_focus_content(selected_driver_number, active_tab_id, 
                                 selected_lap_for_telemetry, 
                                 current_telemetry_figure, current_stint_table_columns, session_prefs: Optional[dict]):
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     overall_callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START_OVERALL")
@@ -89,16 +113,17 @@ def update_driver_focus_content(selected_driver_number, active_tab_id,
     all_stints_for_driver = []
     available_telemetry_laps = []
 
-    # --- Initial Data Fetch (Locking for session_state access) ---
+    # --- Initial Data Fetch (timing and stints from the published snapshot; telemetry needs the lock) ---
+    snap = state_snapshot.get_snapshot(session_state)
+    driver_info_state = snap.timing_state.get(driver_num_str, {})
+    all_stints_for_driver = snap.driver_stint_data.get(driver_num_str, [])
     lock_acquisition_start_time = time.monotonic()
     with session_state.lock:
         lock_acquired_time = time.monotonic()
         logger.debug(f"Lock in '{func_name}' (Initial Fetch) - ACQUIRED. Wait: {lock_acquired_time - lock_acquisition_start_time:.4f}s")
         critical_section_start_time = time.monotonic()
         
-        driver_info_state = session_state.timing_state.get(driver_num_str, {}).copy()
-        all_stints_for_driver = copy.deepcopy(session_state.driver_stint_data.get(driver_num_str, []))
-        available_telemetry_laps = sorted(list(session_state.telemetry_data.get(driver_num_str, {}).keys()))
+        available_telemetry_laps = session_state.telemetry_data.laps(driver_num_str)
         
         logger.debug(f"Lock in '{func_name}' (Initial Fetch) - HELD for critical section: {time.monotonic() - critical_section_start_time:.4f}s")
 
@@ -137,55 +162,56 @@ def update_driver_focus_content(selected_driver_number, active_tab_id,
                     logger.debug(f"'{func_name}': Telemetry figure for {driver_num_str} Lap {telemetry_lap_value} already rendered, no_update on tab switch.")
                     fig_telemetry = no_update
                 else:
-                    lap_data = {}
+                    plot_columns = None
                     with session_state.lock:
-                        lap_data = copy.deepcopy(session_state.telemetry_data.get(driver_num_str, {}).get(telemetry_lap_value, {}))
-
-                    if lap_data:
-                        timestamps_str = lap_data.get('Timestamps', [])
-                        timestamps_dt = [utils.parse_iso_timestamp_safe(ts) for ts in timestamps_str]
-                        valid_indices = [i for i, dt_obj in enumerate(timestamps_dt) if dt_obj is not None]
-
-                        if valid_indices:
-                            timestamps_plot = [timestamps_dt[i] for i in valid_indices]
-                            channels = ['Speed', 'RPM', 'Throttle', 'Brake', 'Gear', 'DRS']
+                        # Zero-copy views, read straight into the plot arrays; released before the lock is
+                        lap_views = session_state.telemetry_data.view_lap(driver_num_str, telemetry_lap_value)
+                        if lap_views:
+                            try:
+                                plot_columns = _telemetry_plot_columns(lap_views)
+                            finally:
+                                for lap_view in lap_views.values():
+                                    lap_view.release()
+
+                    if plot_columns:
+                        timestamps_plot, channel_values = plot_columns
+                        channels = TELEMETRY_PLOT_CHANNELS
+                        
+                        subplot_titles = list(channels)
+                        if use_mph_pref:
+                            try:
+                                speed_index = subplot_titles.index('Speed')
+                                subplot_titles[speed_index] = 'Speed (MPH)'
+                            except ValueError:
+                                pass # 'Speed' not in channels, ignore
+
+                        fig_telemetry = make_subplots(
+                            rows=len(channels), cols=1, shared_xaxes=True,
+                            subplot_titles=subplot_titles, vertical_spacing=0.06
+                        )
+
+                        for i, channel in enumerate(channels):
+                            y_data_plot = channel_values[channel]
                             
-                            subplot_titles = list(channels)
-                            if use_mph_pref:
-                                try:
-                                    speed_index = subplot_titles.index('Speed')
-                                    subplot_titles[speed_index] = 'Speed (MPH)'
-                                except ValueError:
-                                    pass # 'Speed' not in channels, ignore
-
-                            fig_telemetry = make_subplots(
-                                rows=len(channels), cols=1, shared_xaxes=True,
-                                subplot_titles=subplot_titles, vertical_spacing=0.06
-                            )
-
-                            for i, channel in enumerate(channels):
-                                y_data_raw = lap_data.get(channel, [])
-                                y_data_plot = [(y_data_raw[idx] if idx < len(y_data_raw) else None) for idx in valid_indices]
-                                
-                                if channel == 'Speed' and use_mph_pref:
-                                    y_data_plot = utils.convert_kph_to_mph(y_data_plot)
-
-                                if channel == 'DRS':
-                                    drs_plot = [1 if val in [10, 12, 14] else 0 for val in y_data_plot]
-                                    fig_telemetry.add_trace(go.Scattergl(x=timestamps_plot, y=drs_plot, mode='lines', name=channel, line_shape='hv', connectgaps=False), row=i+1, col=1)
-                                    fig_telemetry.update_yaxes(fixedrange=True, tickvals=[0,1], ticktext=['Off','On'], range=[-0.1,1.1], row=i+1, col=1, title_text="", title_standoff=2, title_font_size=9, tickfont_size=8)
-                                else:
-                                    fig_telemetry.add_trace(go.Scattergl(x=timestamps_plot, y=y_data_plot, mode='lines', name=channel, connectgaps=False), row=i+1, col=1)
-                                    fig_telemetry.update_yaxes(fixedrange=True, row=i+1, col=1, title_text="", title_standoff=2, title_font_size=9, tickfont_size=8)
-                            
-                            fig_telemetry.update_layout(
-                                template='plotly_dark', height=config.TELEMETRY_WRAPPER_HEIGHT,
-                                hovermode="x unified", showlegend=False, margin=config.TELEMETRY_MARGINS_DATA,
-                                title_text=f"<b>{tla} - Lap {telemetry_lap_value} Telemetry</b>",
-                                title_x=0.5, title_y=0.98, title_font_size=12,
-                                uirevision=data_plot_uirevision_telemetry,
-                                annotations=[] 
-                            )
+                            if channel == 'Speed' and use_mph_pref:
+                                y_data_plot = y_data_plot * config.KPH_TO_MPH_FACTOR
+
+                            if channel == 'DRS':
+                                drs_plot = np.isin(y_data_plot, [10, 12, 14]).astype(int)
+                                fig_telemetry.add_trace(go.Scattergl(x=timestamps_plot, y=drs_plot, mode='lines', name=channel, line_shape='hv', connectgaps=False), row=i+1, col=1)
+                                fig_telemetry.update_yaxes(fixedrange=True, tickvals=[0,1], ticktext=['Off','On'], range=[-0.1,1.1], row=i+1, col=1, title_text="", title_standoff=2, title_font_size=9, tickfont_size=8)
+                            else:
+                                fig_telemetry.add_trace(go.Scattergl(x=timestamps_plot, y=y_data_plot, mode='lines', name=channel, connectgaps=False), row=i+1, col=1)
+                                fig_telemetry.update_yaxes(fixedrange=True, row=i+1, col=1, title_text="", title_standoff=2, title_font_size=9, tickfont_size=8)
+                        
+                        fig_telemetry.update_layout(
+                            template='plotly_dark', height=config.TELEMETRY_WRAPPER_HEIGHT,
+                            hovermode="x unified", showlegend=False, margin=config.TELEMETRY_MARGINS_DATA,
+                            title_text=f"<b>{tla} - Lap {telemetry_lap_value} Telemetry</b>",
+                            title_x=0.5, title_y=0.98, title_font_size=12,
+                            uirevision=data_plot_uirevision_telemetry,
+                            annotations=[] 
+                        )
 
     elif active_tab_id == "tab-stint-history":
         fig_telemetry = no_update
@@ -220,10 +246,12 @@ def update_current_session_id_for_map(n_intervals, existing_session_id_in_store)
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
-    with session_state.lock:
-        year = session_state.session_details.get('Year')
-        circuit_key = session_state.session_details.get('CircuitKey')
-        app_status_state = session_state.app_status.get("state", "Idle")
+    feed_state = app_state.get_data_state(session_state)
+    feed_session_details = state_snapshot.get_snapshot(feed_state).session_details
+    year = feed_session_details.get('Year')
+    circuit_key = feed_session_details.get('CircuitKey')
+    with feed_state.lock:
+        app_status_state = feed_state.app_status.get("state", "Idle")
 
     if not year or not circuit_key or app_status_state in ["Idle", "Stopped", "Error"]:
         if existing_session_id_in_store is not None:
@@ -250,8 +278,9 @@ def update_current_session_id_for_map(n_intervals, existing_session_id_in_store)
 @app.callback(
     Output('car-positions-store', 'data'),
     Input('clientside-update-interval', 'n_intervals'),
+    State('car-positions-store', 'data')
 )
-def update_car_data_for_clientside(n_intervals):
+def update_car_data_for_clientside(n_intervals, previous_car_data):
     session_state = app_state.get_or_create_session_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
@@ -259,52 +288,39 @@ def update_car_data_for_clientside(n_intervals):
     if n_intervals == 0: # Or check if None
         return dash.no_update
     
+    feed_state = app_state.get_data_state(session_state)
     lock_acquisition_start_time = time.monotonic()
-    with session_state.lock:
+    with feed_state.lock:
         lock_acquired_time = time.monotonic()
         logger.debug(f"Lock in '{func_name}' - ACQUIRED. Wait: {lock_acquired_time - lock_acquisition_start_time:.4f}s")
     
         critical_section_start_time = time.monotonic()
-        current_app_status = session_state.app_status.get("state", "Idle")
-        timing_state_snapshot = session_state.timing_state.copy()
-        # Get the currently selected driver for highlighting
-        selected_driver_rno = session_state.selected_driver_for_map_and_lap_chart
+        current_app_status = feed_state.app_status.get("state", "Idle")
         logger.debug(f"Lock in '{func_name}' - HELD for critical section: {time.monotonic() - critical_section_start_time:.4f}s")
+    feed_snap = state_snapshot.get_snapshot(feed_state)
+    timing_state_snapshot = feed_snap.timing_state
 
-    if current_app_status not in ["Live", "Replaying"] or not timing_state_snapshot:
-        # Ensure to include selected_driver even if inactive, so JS can clear highlight
-        return {'status': 'inactive', 'timestamp': time.time(), 'selected_driver': selected_driver_rno}
-
-
-    processed_car_data = {}
-    for car_num_str, driver_state in timing_state_snapshot.items():
-        if not isinstance(driver_state, dict):
-            continue
+    with session_state.lock:
+        # Get the currently selected driver for highlighting (per-browser, never on the shared hub state)
+        selected_driver_rno = session_state.selected_driver_for_map_and_lap_chart
 
-        pos_data = driver_state.get('PositionData')
-        if not pos_data or 'X' not in pos_data or 'Y' not in pos_data:
-            continue
+    # Car statuses change with the next Position message, so positions and the driver list are enough
+    version_key = (f"{state_snapshot.domain_version_key(feed_snap, 'positions', 'drivers')}|"
+                   f"{current_app_status}|{selected_driver_rno}")
+    if isinstance(previous_car_data, dict) and previous_car_data.get('version_key') == version_key:
+        return dash.no_update
 
-        try:
-            x_val = float(pos_data['X'])
-            y_val = float(pos_data['Y'])
-        except (TypeError, ValueError):
-            continue
+    if current_app_status not in ["Live", "Replaying"] or not timing_state_snapshot:
+        # Ensure to include selected_driver even if inactive, so JS can clear highlight
+        return {'status': 'inactive', 'timestamp': time.time(), 'selected_driver': selected_driver_rno,
+                'version_key': version_key}
 
-        team_colour_hex = driver_state.get('TeamColour', '808080')
-        if not team_colour_hex.startswith('#'):
-            team_colour_hex = '#' + team_colour_hex
 
-        processed_car_data[car_num_str] = {
-            'x': x_val,
-            'y': y_val,
-            'color': team_colour_hex,
-            'tla': driver_state.get('Tla', car_num_str),
-            'status': driver_state.get('Status', 'Unknown').lower()
-        }
+    processed_car_data = utils.build_car_positions(timing_state_snapshot)
 
     if not processed_car_data: # If after processing, there's nothing, send no update
-        return {'status': 'active_no_cars', 'timestamp': time.time(), 'selected_driver': selected_driver_rno}
+        return {'status': 'active_no_cars', 'timestamp': time.time(), 'selected_driver': selected_driver_rno,
+                'version_key': version_key}
 
 
     # Add the selected driver information to the output for JS
@@ -312,7 +328,8 @@ def update_car_data_for_clientside(n_intervals):
         'status': 'active', # Indicate data is active
         'timestamp': time.time(),
         'selected_driver': selected_driver_rno, # Pass the selected driver's racing number
-        'cars': processed_car_data
+        'cars': processed_car_data,
+        'version_key': version_key
     }
     logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
     return output_data
@@ -336,7 +353,7 @@ def initialize_track_map(n_intervals, expected_session_id, sidebar_toggled_signa
                          previous_rendered_yellow_key_from_store, current_pathname: str):
     if current_pathname != '/':
         return dash.no_update, dash.no_update, dash.no_update
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     overall_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
@@ -353,9 +370,10 @@ def initialize_track_map(n_intervals, expected_session_id, sidebar_toggled_signa
         
         critical_section_start_time = time.monotonic()
         cached_data = session_state.track_coordinates_cache.copy()
-        driver_list_snapshot = session_state.timing_state.copy() 
-        active_yellow_sectors_snapshot = set(session_state.active_yellow_sectors)
         logger.debug(f"Lock in '{func_name}' - HELD for critical section: {time.monotonic() - critical_section_start_time:.4f}s")
+    snap = state_snapshot.get_snapshot(session_state)
+    driver_list_snapshot = snap.timing_state
+    active_yellow_sectors_snapshot = snap.active_yellow_sectors
 
     if not expected_session_id or not isinstance(expected_session_id, str) or '_' not in expected_session_id:
         fig_empty = utils.create_empty_figure_with_message(config.TRACK_MAP_WRAPPER_HEIGHT, f"empty_map_init_{time.time()}", config.TEXT_TRACK_MAP_DATA_WILL_LOAD, config.TRACK_MAP_MARGINS)
@@ -582,40 +600,45 @@ def initialize_track_map(n_intervals, expected_session_id, sidebar_toggled_signa
 @app.callback(
     [Output('lap-time-driver-dropdown', 'options'),
      Output('lap-time-driver-dropdown-2', 'options'),
-     Output('driver-select-dropdown', 'options')], # Add second output
-    Input('interval-component-medium', 'n_intervals')
+     Output('driver-select-dropdown', 'options'), # Add second output
+     Output('driver-options-version-store', 'data')],
+    Input('interval-component-medium', 'n_intervals'),
+    State('driver-options-version-store', 'data')
 )
-def update_driver_dropdown_options(n_intervals):
+def update_driver_dropdown_options(n_intervals, last_version_key):
     """
     Periodically updates the driver dropdown options for both dropdowns
     based on the current driver list.
     """
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
     logger.debug("Attempting to update driver dropdown options...")
     options = config.DROPDOWN_NO_DRIVERS_OPTIONS # Use constant
+    snap = state_snapshot.get_snapshot(session_state)
+    version_key = state_snapshot.domain_version_key(snap, "drivers")
+    if version_key == last_version_key:
+        return no_update, no_update, no_update, no_update
     try:
-        with session_state.lock:
-            timing_state_copy = session_state.timing_state.copy()
+        timing_state_copy = snap.timing_state
 
         options = utils.generate_driver_options(timing_state_copy) # This helper already uses config constants for error states
         logger.debug(f"Updating driver dropdown options: {len(options)} options generated.")
     except Exception as e:
          logger.error(f"Error generating driver dropdown options: {e}", exc_info=True)
          options = config.DROPDOWN_ERROR_LOADING_DRIVERS_OPTIONS # Use constant
+         version_key = no_update
     logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
-    return options, options, options
+    return options, options, options, version_key
 
 @app.callback(
     Output('lap-time-driver-selector', 'options'),
     Input('interval-component-slow', 'n_intervals')
 )
 def update_lap_chart_driver_options(n_intervals):
-    session_state = app_state.get_or_create_session_state()
-    with session_state.lock:
-        timing_state_copy = session_state.timing_state.copy()
+    session_state = app_state.get_display_state()
+    timing_state_copy = state_snapshot.get_snapshot(session_state).timing_state
     # utils.generate_driver_options already handles empty/error cases with config constants
     options = utils.generate_driver_options(timing_state_copy) #
     return options
@@ -634,7 +657,7 @@ def update_lap_time_progression_chart(driver1_rno, driver2_rno, n_intervals, cur
     """
     Updates the lap time progression chart for one or two selected drivers.
     """
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     overall_callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START_OVERALL")
@@ -660,15 +683,19 @@ def update_lap_time_progression_chart(driver1_rno, driver2_rno, n_intervals, cur
     sorted_selection_key = "_".join(sorted(list(set(str(rno) for rno in selected_drivers_rnos))))
     data_plot_uirevision = f"lap_prog_data_{sorted_selection_key}"
 
-    with session_state.lock:
-        lock_acquired_time = time.monotonic()
-        lap_history_snapshot = {str(rno): list(session_state.lap_time_history.get(str(rno), [])) for rno in selected_drivers_rnos}
-        timing_state_snapshot = {str(rno): session_state.timing_state.get(str(rno), {}).copy() for rno in selected_drivers_rnos}
+    snap = state_snapshot.get_snapshot(session_state)
+    # Kept in the figure's layout.meta so an unchanged lap history needs no rebuild
+    render_key = f"{sorted_selection_key}|{state_snapshot.domain_version_key(snap, 'lap_history', 'drivers')}"
+    if current_figure_state and current_figure_state.get('layout', {}).get('meta') == render_key:
+        logger.debug(f"Callback '{func_name}' END_OVERALL (Lap history unchanged). Total Took: {time.monotonic() - overall_callback_start_time:.4f}s")
+        return no_update
+    lap_history_snapshot = {str(rno): snap.lap_time_history.get(str(rno), []) for rno in selected_drivers_rnos}
+    timing_state_snapshot = {str(rno): snap.timing_state.get(str(rno), {}) for rno in selected_drivers_rnos}
 
     python_and_plotly_prep_start_time = time.monotonic()
 
     fig_with_data = go.Figure(layout={
-        'template': 'plotly_dark', 'uirevision': data_plot_uirevision,
+        'template': 'plotly_dark', 'uirevision': data_plot_uirevision, 'meta': render_key,
         'height': config.LAP_PROG_WRAPPER_HEIGHT,
         'margin': config.LAP_PROG_MARGINS_DATA,
         'xaxis_title': 'Lap Number', 'yaxis_title': 'Lap Time (s)',
@@ -734,6 +761,7 @@ def update_lap_time_progression_chart(driver1_rno, driver2_rno, n_intervals, cur
     if not data_actually_plotted:
         fig_empty_lap_prog.layout.annotations[0].text = config.TEXT_LAP_PROG_NO_DATA
         fig_empty_lap_prog.layout.uirevision = data_plot_uirevision 
+        fig_empty_lap_prog.layout.meta = render_key
         logger.debug(f"Callback '{func_name}' END_OVERALL (No data plotted). Total Took: {time.monotonic() - overall_callback_start_time:.4f}s")
         return fig_empty_lap_prog
 
@@ -859,18 +887,25 @@ def update_lap_chart_driver_selection_from_map_click(click_data_json_str, lap_ch
     
 @app.callback(
     Output('tyre-strategy-graph', 'figure'),
-    Input('interval-component-slow', 'n_intervals') # Update every 5 seconds
+    Input('interval-component-slow', 'n_intervals'), # Update every 5 seconds
+    State('tyre-strategy-graph', 'figure')
 )
-def update_tyre_strategy_chart(n_intervals):
+def update_tyre_strategy_chart(n_intervals, current_figure_state):
     """Periodically updates the tyre strategy chart."""
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     if not session_state:
         return dash.no_update
 
-    with session_state.lock:
-        # Take a snapshot of the necessary data under lock
-        stint_data_snapshot = dict(session_state.driver_stint_data)
-        timing_state_snapshot = {k: {'Tla': v.get('Tla')} for k, v in session_state.timing_state.items()}
+    # Read-only data from the published snapshot
+    snap = state_snapshot.get_snapshot(session_state)
+    stint_data_snapshot = snap.driver_stint_data
+    timing_state_snapshot = {k: {'Tla': v.get('Tla')} for k, v in snap.timing_state.items()}
+    # Change key of the rendered figure, kept in its layout.meta
+    render_key = state_snapshot.domain_version_key(snap, 'stints', 'drivers')
+    if current_figure_state and current_figure_state.get('layout', {}).get('meta') == render_key:
+        return dash.no_update
 
     # Pass the snapshots to the figure generation function
-    return utils.create_tyre_strategy_figure(stint_data_snapshot, timing_state_snapshot)
\ No newline at end of file
+    fig = utils.create_tyre_strategy_figure(stint_data_snapshot, timing_state_snapshot)
+    fig.layout.meta = render_key
+    return fig
\ No newline at end of file
@@ -24,15 +24,18 @@ logger = logging.getLogger(__name__)
      Input('interval-component-fast', 'n_intervals')],
     [State('clientside-update-interval', 'disabled'),
      State('replay-file-selector', 'value'),
-     State("url", "pathname")]  # <<< ADDED: Get the current page's URL
+     State("url", "pathname"),  # <<< ADDED: Get the current page's URL
+     State('push-status-store', 'data')]
 )
 def toggle_clientside_interval(connect_clicks, replay_clicks,
                                stop_reset_clicks,
-                               fast_interval_tick, currently_disabled, selected_replay_file, current_pathname: str):
-    if current_pathname != '/':
+                               fast_interval_tick, currently_disabled, selected_replay_file, current_pathname: str,
+                               push_status):
+    if current_pathname != '/' or (push_status or {}).get('connected'):
+        # Off other pages, and while the push stream delivers car positions (see push_stream.py).
         # If the interval is not already disabled, disable it. Otherwise, do nothing.
         return True if not currently_disabled else dash.no_update
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     ctx = dash.callback_context
     triggered_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered and ctx.triggered[0] else None
 
@@ -143,4 +146,25 @@ app.clientside_callback(
     Input('clientside-click-poll-interval', 'n_intervals'),
     State('js-click-data-holder', 'children'),
     prevent_initial_call=True # Read the data JS wrote
-)
\ No newline at end of file
+)
+
+app.clientside_callback(
+    ClientsideFunction(
+        namespace='clientside',
+        function_name='managePushStream' # See assets/push_stream.js
+    ),
+    Output('push-status-store', 'data'),
+    Input('url', 'pathname'),
+    State('push-stream-url-store', 'data')
+)
+
+# Timing table updates are driven by pushed domain versions while the stream is connected
+app.clientside_callback(
+    """
+    function(pushStatus) {
+        return Boolean(pushStatus && pushStatus.connected);
+    }
+    """,
+    Output('interval-component-timing', 'disabled'),
+    Input('push-status-store', 'data')
+)
@@ -10,33 +10,40 @@ from typing import Optional
 from datetime import datetime, timezone
 
 from dash.dependencies import Input, Output, State
-from dash import dash_table, html, no_update, dash
+from dash import dash_table, html, no_update, dash, Patch
 
 from app_instance import app
 import app_state
 import config
+import row_diff
+import state_snapshot
 import utils
 
 logger = logging.getLogger(__name__)
 
 @app.callback(
     Output('timing-data-actual-table', 'columns'),
-    Input('interval-component-medium', 'n_intervals') # Trigger based on an interval
+    Output('timing-columns-version-store', 'data'),
+    Input('interval-component-medium', 'n_intervals'), # Trigger based on an interval
+    State('timing-columns-version-store', 'data')
     # Consider adding State('session-info-display', 'children') or a dcc.Store
     # if you want to trigger more specifically on session type changes,
     # but interval-component-medium should catch session updates.
 )
-def update_timing_table_columns(n_intervals):
+def update_timing_table_columns(n_intervals, last_version_key):
     """
     Dynamically sets the columns for the timing table based on the session type.
     The 'Pits' column is only shown for Race or Sprint sessions.
     """
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
-    with session_state.lock:
-        session_type = session_state.session_details.get('Type', None)
+    snap = state_snapshot.get_snapshot(session_state)
+    version_key = state_snapshot.domain_version_key(snap, "session")
+    if version_key == last_version_key:
+        return no_update, no_update
+    session_type = snap.session_details.get('Type', None)
 
     # Assuming config.TIMING_TABLE_COLUMNS_CONFIG is a list of dicts,
     # where each dict has at least an 'id' and 'name' key.
@@ -50,39 +57,44 @@ def update_timing_table_columns(n_intervals):
         columns_to_display = [
             col for col in all_columns if col.get('id') not in race_sprint_specific_column_ids
         ]
-        return columns_to_display
+        return columns_to_display, version_key
 
     if session_type in [config.SESSION_TYPE_RACE, config.SESSION_TYPE_SPRINT]:
         logger.debug(f"Session is '{session_type}', showing all relevant columns including Pits, Gap.")
-        return all_columns
+        return all_columns, version_key
     else:
         logger.debug(f"Session is '{session_type}', hiding Pits, Gap columns.")
         columns_to_display = [
             col for col in all_columns if col.get('id') not in race_sprint_specific_column_ids
         ]
-        return columns_to_display
+        return columns_to_display, version_key
         
 @app.callback(
     Output('team-radio-display', 'children'),
-    Input('interval-component-medium', 'n_intervals') # Update periodically
+    Output('team-radio-version-store', 'data'),
+    Input('interval-component-medium', 'n_intervals'), # Update periodically
+    State('team-radio-version-store', 'data')
 )
-def update_team_radio_display(n_intervals):
-    session_state = app_state.get_or_create_session_state()
+def update_team_radio_display(n_intervals, last_version_key):
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
     try:
-        with session_state.lock:
-            # Make a copy of the deque for safe iteration
-            radio_messages_snapshot = list(session_state.team_radio_messages)
-            session_path = session_state.session_details.get('Path') # Needed for the audio URL
+        snap = state_snapshot.get_snapshot(session_state)
+        # Re-rendering would also reset any audio player the user has started
+        version_key = state_snapshot.domain_version_key(snap, "team_radio", "session")
+        if version_key == last_version_key:
+            return no_update, no_update
+        radio_messages_snapshot = snap.team_radio_messages
+        session_path = snap.session_details.get('Path') # Needed for the audio URL
 
         if not radio_messages_snapshot:
-            return html.Em(config.TEXT_TEAM_RADIO_AWAITING, style={'color': 'grey'})
+            return html.Em(config.TEXT_TEAM_RADIO_AWAITING, style={'color': 'grey'}), version_key
 
         if not session_path:
             logger.warning("Team Radio: Session Path not found in session_details. Cannot build audio URLs.")
-            return html.Em(config.TEXT_TEAM_RADIO_NO_SESSION_PATH, style={'color': 'orange'})
+            return html.Em(config.TEXT_TEAM_RADIO_NO_SESSION_PATH, style={'color': 'orange'}), version_key
 
         # The base URL for audio files, constructed from config and session_path
         # Example: "https://livetiming.formula1.com/static/2023/2023-11-26_Abu_Dhabi_Grand_Prix/..."
@@ -151,14 +163,14 @@ def update_team_radio_display(n_intervals):
             display_elements.append(html.Div([timestamp_tla_span, audio_player], style=message_style))
 
         if not display_elements: # If after filtering, nothing is left
-             return html.Em(config.TEXT_TEAM_RADIO_AWAITING, style={'color': 'grey'})
+             return html.Em(config.TEXT_TEAM_RADIO_AWAITING, style={'color': 'grey'}), version_key
         
         logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
-        return html.Div(display_elements) # Wrap all messages in a parent Div
+        return html.Div(display_elements), version_key # Wrap all messages in a parent Div
 
     except Exception as e:
         logger.error(f"Error updating team radio display: {e}", exc_info=True)
-        return html.Em(config.TEXT_TEAM_RADIO_ERROR, style={'color': 'red'})
+        return html.Em(config.TEXT_TEAM_RADIO_ERROR, style={'color': 'red'}), no_update
         
 @app.callback(
     [Output('lap-counter', 'children'),
@@ -169,7 +181,7 @@ def update_team_radio_display(n_intervals):
     [Input('interval-component-fast', 'n_intervals')]
 )
 def update_lap_and_session_info(n_intervals):
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
@@ -181,48 +193,47 @@ def update_lap_and_session_info(n_intervals):
     session_timer_div_style = {'display': 'none'} #
 
     try:
+        snap = state_snapshot.get_snapshot(session_state)
+        lap_count_data_payload = snap.data_store.get('LapCount', {}) #
+        lap_count_data = lap_count_data_payload.get('data', {}) if isinstance(lap_count_data_payload, dict) else {} #
+        if not isinstance(lap_count_data, dict): lap_count_data = {} #
+        current_lap_from_feed = lap_count_data.get('CurrentLap') #
+        total_laps_from_feed = lap_count_data.get('TotalLaps') #
+
         lock_acquisition_start_time = time.monotonic()
-        with session_state.lock: #
+        with session_state.lock: # Only control fields and last_known_total_laps; feed data comes from the snapshot
             lock_acquired_time = time.monotonic()
             logger.debug(f"Lock in '{func_name}' - ACQUIRED. Wait: {lock_acquired_time - lock_acquisition_start_time:.4f}s")
-            critical_section_start_time = time.monotonic()
             current_app_overall_status = session_state.app_status.get("state", "Idle") #
-
-            if current_app_overall_status not in ["Live", "Replaying"]: #
-                return lap_value_str, lap_counter_div_style, session_timer_label_text, session_time_str, session_timer_div_style #
-
-            session_type_from_state = session_state.session_details.get('Type', "Unknown") #
-            current_session_feed_status = session_state.session_details.get('SessionStatus', 'Unknown') #
             current_replay_speed = session_state.replay_speed # Used for LIVE extrapolation, replay speed is inherent in feed pace #
-
-            lap_count_data_payload = session_state.data_store.get('LapCount', {}) #
-            lap_count_data = lap_count_data_payload.get('data', {}) if isinstance(lap_count_data_payload, dict) else {} #
-            if not isinstance(lap_count_data, dict): lap_count_data = {} #
-            current_lap_from_feed = lap_count_data.get('CurrentLap') #
-            total_laps_from_feed = lap_count_data.get('TotalLaps') #
             if total_laps_from_feed is not None and total_laps_from_feed != '-': #
                 try: session_state.last_known_total_laps = int(total_laps_from_feed) #
                 except (ValueError, TypeError): pass #
             actual_total_laps_to_display = session_state.last_known_total_laps if session_state.last_known_total_laps is not None else '--' #
-            current_lap_to_display = str(current_lap_from_feed) if current_lap_from_feed is not None else '-' #
 
-            session_type_lower = session_type_from_state.lower() #
+        if current_app_overall_status not in ["Live", "Replaying"]: #
+            return lap_value_str, lap_counter_div_style, session_timer_label_text, session_time_str, session_timer_div_style #
 
-            # q_state is for LIVE timer extrapolation and Q REPLAY pause states
-            q_state_live_anchor = session_state.qualifying_segment_state.copy() #
+        session_type_from_state = snap.session_details.get('Type', "Unknown") #
+        current_session_feed_status = snap.session_details.get('SessionStatus', 'Unknown') #
+        current_lap_to_display = str(current_lap_from_feed) if current_lap_from_feed is not None else '-' #
 
-            # For Practice LIVE timing
-            practice_start_utc_live = session_state.practice_session_actual_start_utc #
-            practice_overall_duration_s = session_state.practice_session_scheduled_duration_seconds #
+        session_type_lower = session_type_from_state.lower() #
 
-            # For REPLAY feed-paced timing (Practice and Q)
-            current_feed_ts_dt_replay = session_state.current_processed_feed_timestamp_utc_dt if current_app_overall_status == "Replaying" else None #
-            start_feed_ts_dt_replay = session_state.session_start_feed_timestamp_utc_dt if current_app_overall_status == "Replaying" else None #
-            segment_duration_s_replay = session_state.current_segment_scheduled_duration_seconds if current_app_overall_status == "Replaying" else None #
+        # q_state is for LIVE timer extrapolation and Q REPLAY pause states
+        q_state_live_anchor = snap.qualifying_segment_state #
 
-            session_name_from_details = session_state.session_details.get('Name', '') #
-            extrapolated_clock_remaining = session_state.extrapolated_clock_info.get("Remaining") if hasattr(session_state, 'extrapolated_clock_info') else None #
-            logger.debug(f"Lock in '{func_name}' - HELD for critical section: {time.monotonic() - critical_section_start_time:.4f}s")
+        # For Practice LIVE timing
+        practice_start_utc_live = snap.practice_session_actual_start_utc #
+        practice_overall_duration_s = snap.practice_session_scheduled_duration_seconds #
+
+        # For REPLAY feed-paced timing (Practice and Q)
+        current_feed_ts_dt_replay = snap.current_processed_feed_timestamp_utc_dt if current_app_overall_status == "Replaying" else None #
+        start_feed_ts_dt_replay = snap.session_start_feed_timestamp_utc_dt if current_app_overall_status == "Replaying" else None #
+        segment_duration_s_replay = snap.current_segment_scheduled_duration_seconds if current_app_overall_status == "Replaying" else None #
+
+        session_name_from_details = snap.session_details.get('Name', '') #
+        extrapolated_clock_remaining = snap.extrapolated_clock_info.get("Remaining") #
 
         # --- Logic for displaying session type specific info ---
 
@@ -358,7 +369,7 @@ def update_lap_and_session_info(n_intervals):
 )
 def update_connection_status(n, existing_status_text):
     """Updates the connection status indicator."""
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
@@ -410,16 +421,23 @@ def update_connection_status(n, existing_status_text):
     Output('weather-main-icon', 'children'),
     Output('prominent-weather-card', 'color'),
     Output('prominent-weather-card', 'inverse'),
-    Input('interval-component-slow', 'n_intervals')
+    Output('session-weather-version-store', 'data'),
+    Input('interval-component-slow', 'n_intervals'),
+    State('session-weather-version-store', 'data')
 )
-def update_session_and_weather_info(n):
-    session_state = app_state.get_or_create_session_state()
+def update_session_and_weather_info(n, last_version_key):
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
     session_info_str = config.TEXT_SESSION_INFO_AWAITING
     weather_details_spans = []
 
+    snap = state_snapshot.get_snapshot(session_state)
+    version_key = state_snapshot.domain_version_key(snap, "weather", "session")
+    if version_key == last_version_key:
+        return no_update, no_update, no_update, no_update, no_update, no_update
+
     with session_state.lock:
         # Overall condition state
         overall_condition = session_state.last_known_overall_weather_condition
@@ -437,12 +455,12 @@ def update_session_and_weather_info(n):
         # This specific rainfall value is primarily for the "RAIN" text logic
         rainfall_val_for_text = session_state.last_known_rainfall_val
 
-        # Get current session and new weather data payload
-        local_session_details = session_state.session_details.copy()
-        raw_weather_payload = session_state.data_store.get('WeatherData', {})
-        current_weather_data_payload = raw_weather_payload.get('data', {}) if isinstance(raw_weather_payload, dict) else {}
-        if not isinstance(current_weather_data_payload, dict):
-            current_weather_data_payload = {}
+    # Get current session and new weather data payload (published snapshot, read-only)
+    local_session_details = snap.session_details
+    raw_weather_payload = snap.data_store.get('WeatherData', {})
+    current_weather_data_payload = raw_weather_payload.get('data', {}) if isinstance(raw_weather_payload, dict) else {}
+    if not isinstance(current_weather_data_payload, dict):
+        current_weather_data_payload = {}
 
     # Initialize icon based on persisted overall state
     current_main_weather_icon = config.WEATHER_ICON_MAP.get(main_weather_icon_key, config.WEATHER_ICON_MAP["default"])
@@ -612,7 +630,7 @@ def update_session_and_weather_info(n):
             final_weather_display_children = weather_details_spans
         
         logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
-        return session_info_str, html.Div(children=final_weather_display_children), current_main_weather_icon, weather_card_color, weather_card_inverse
+        return session_info_str, html.Div(children=final_weather_display_children), current_main_weather_icon, weather_card_color, weather_card_inverse, version_key
 
     except Exception as e:
         logger.error(f"Session/Weather Display Error in callback: {e}", exc_info=True)
@@ -620,21 +638,27 @@ def update_session_and_weather_info(n):
                 config.TEXT_WEATHER_ERROR,
                 config.WEATHER_ICON_MAP["default"],
                 "light",
-                False)
+                False,
+                no_update)
                 
 @app.callback(
     Output('prominent-track-status-text', 'children'),
     Output('prominent-track-status-card', 'color'),
     Output('prominent-track-status-text', 'style'),
-    Input('interval-component-medium', 'n_intervals')
+    Output('track-status-version-store', 'data'),
+    Input('interval-component-medium', 'n_intervals'),
+    State('track-status-version-store', 'data')
 )
-def update_prominent_track_status(n):
-    session_state = app_state.get_or_create_session_state()
+def update_prominent_track_status(n, last_version_key):
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
-    with session_state.lock:
-        track_status_code = str(session_state.track_status_data.get('Status', '0'))
+    snap = state_snapshot.get_snapshot(session_state)
+    version_key = state_snapshot.domain_version_key(snap, "track_status")
+    if version_key == last_version_key:
+        return no_update, no_update, no_update, no_update
+    track_status_code = str(snap.track_status_data.get('Status', '0'))
 
     # Use TRACK_STATUS_STYLES from config
     status_info = config.TRACK_STATUS_STYLES.get(track_status_code, config.TRACK_STATUS_STYLES['DEFAULT'])
@@ -643,19 +667,52 @@ def update_prominent_track_status(n):
     text_style = {'fontWeight':'bold', 'padding':'2px 5px', 'borderRadius':'4px', 'color': status_info["text_color"]}
     
     logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
-    return label_to_display, status_info["card_color"], text_style
+    return label_to_display, status_info["card_color"], text_style, version_key
+
+def _timing_table_output(session_state, table_data: list, client_emission_id: Optional[int]):
+    """
+    The timing table 'data' output: a Patch of the cells that changed since the rows the
+    browser holds (client_emission_id), or the full rows on structural changes.
+    Returns (output, emission id of table_data).
+    """
+    browser_state = app_state.get_or_create_session_state()
+    if browser_state is None:
+        return table_data, None
+    emitted = browser_state.timing_table_emitted
+    previous_rows = emitted.get(client_emission_id, session_state.session_id) if config.TIMING_TABLE_PATCH_ENABLED else None
+    emission_id = emitted.remember(session_state.session_id, table_data)
+
+    changes = row_diff.diff_rows(previous_rows, table_data)
+    if changes is None:
+        return table_data, emission_id
+    if not changes:
+        return no_update, emission_id
+    total_cells = sum(len(row) for row in table_data)
+    if total_cells and row_diff.changed_cells(changes) > total_cells * config.TIMING_TABLE_PATCH_MAX_CHANGED_FRACTION:
+        return table_data, emission_id
+    table_patch = Patch()
+    for row_index, column, value in changes:
+        if column is None:
+            table_patch[row_index] = value
+        else:
+            table_patch[row_index][column] = value
+    logger.debug(f"Timing table: patched {len(changes)} change(s) of {len(table_data)} rows.")
+    return table_patch, emission_id
 
 @app.callback(
     [Output('other-data-display', 'children'),
      Output('timing-data-actual-table', 'data'),
-     Output('timing-data-timestamp', 'children')],
-    Input('interval-component-timing', 'n_intervals'),
+     Output('timing-data-timestamp', 'children'),
+     Output('timing-table-render-key-store', 'data')],
+    [Input('interval-component-timing', 'n_intervals'),
+     Input('push-domain-versions-store', 'data')], # Pushed domain versions replace the interval while connected
     [State("debug-mode-switch", "value"),
-     State('session-preferences-store', 'data')]
+     State('session-preferences-store', 'data'),
+     State('timing-table-render-key-store', 'data')]
 )
 # MODIFICATION: Added debug_mode_enabled
-def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Optional[dict]):
-    session_state = app_state.get_or_create_session_state()
+def update_main_data_displays(n, pushed_domain_versions, debug_mode_enabled: bool, session_prefs: Optional[dict], last_render_key: Optional[str]):
+    session_state = app_state.get_display_state()
     overall_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
@@ -687,38 +744,35 @@ def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Option
             "type": "NONE", "lower_pos": 0, "upper_pos": 0}
         
         initial_state_copy_start_time = time.monotonic()
-        lock_acquisition_start_time = time.monotonic()
+        # Feed data comes from the published snapshot (no lock, no copy); only control fields need the lock
+        snap = state_snapshot.get_snapshot(session_state)
         with session_state.lock:
-            lock_acquired_time = time.monotonic()
-            logger.debug(f"Lock in '{func_name}' - ACQUIRED. Wait: {lock_acquired_time - lock_acquisition_start_time:.4f}s")
-            critical_section_start_time = time.monotonic()
             app_overall_status = session_state.app_status.get("state", "Idle")
-            # Robustly get session type
-            session_type_from_state_str = (
-                session_state.session_details.get('Type') or "").lower()
-            # MODIFIED: Changed to debug
-            logger.debug(
-                f"UPDATE_MAIN_DISPLAYS_DEBUG: Read session_type_from_state_str as '{session_type_from_state_str}'")
-
-            q_state_snapshot_for_live = session_state.qualifying_segment_state.copy()
-            current_q_segment_from_state = q_state_snapshot_for_live.get(
-                "current_segment")
-            previous_q_segment_from_state = q_state_snapshot_for_live.get(
-                "old_segment")
             current_replay_speed_snapshot = session_state.replay_speed
-            session_feed_status_snapshot = (
-                session_state.session_details.get('SessionStatus') or 'Unknown')
 
-            if app_overall_status == "Replaying":
-                current_feed_ts_dt_replay_local = session_state.current_processed_feed_timestamp_utc_dt
-                start_feed_ts_dt_replay_local = session_state.session_start_feed_timestamp_utc_dt
-                segment_duration_s_replay_local = session_state.current_segment_scheduled_duration_seconds
-
-            timing_state_copy = session_state.timing_state.copy()
-            # MODIFICATION: Conditionally get data_store_copy only if debug mode is enabled
-            data_store_copy = session_state.data_store.copy() if debug_mode_enabled else {}
-            logger.debug(f"Lock in '{func_name}' - HELD for critical section: {time.monotonic() - critical_section_start_time:.4f}s")
-        logger.debug(f"'{func_name}' - Initial lock & state copy: {time.monotonic() - initial_state_copy_start_time:.4f}s")
+        # Robustly get session type
+        session_type_from_state_str = (
+            snap.session_details.get('Type') or "").lower()
+        # MODIFIED: Changed to debug
+        logger.debug(
+            f"UPDATE_MAIN_DISPLAYS_DEBUG: Read session_type_from_state_str as '{session_type_from_state_str}'")
+
+        q_state_snapshot_for_live = snap.qualifying_segment_state
+        current_q_segment_from_state = q_state_snapshot_for_live.get(
+            "current_segment")
+        previous_q_segment_from_state = q_state_snapshot_for_live.get(
+            "old_segment")
+        session_feed_status_snapshot = (
+            snap.session_details.get('SessionStatus') or 'Unknown')
+
+        if app_overall_status == "Replaying":
+            current_feed_ts_dt_replay_local = snap.current_processed_feed_timestamp_utc_dt
+            start_feed_ts_dt_replay_local = snap.session_start_feed_timestamp_utc_dt
+            segment_duration_s_replay_local = snap.current_segment_scheduled_duration_seconds
+
+        timing_state_copy = snap.timing_state
+        data_store_copy = snap.data_store
+        logger.debug(f"'{func_name}' - Snapshot v{snap.version} read: {time.monotonic() - initial_state_copy_start_time:.4f}s")
 
         # MODIFICATION: Conditionally prepare other_elements
         if debug_mode_enabled:
@@ -859,14 +913,25 @@ def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Option
                                                 config.QUALIFYING_ELIMINATED_Q2 + 1, "upper_pos": config.QUALIFYING_CARS_Q2}
         logger.debug(f"HighlightCheck: Seg='{current_q_segment_from_state}', Prev='{previous_q_segment_from_state}', DangerAppliesTo='{danger_zone_applies_to_segment}', RemSecForHighlight={current_segment_time_remaining_seconds:.1f}, Mode='{app_overall_status}', FeedStatus='{session_feed_status_snapshot}', ApplyDanger='{apply_danger_zone_highlight}', ApplyQ1Elim='{apply_q1_elimination_highlight}', ApplyQ2Elim='{apply_q2_elimination_highlight}'")  # MODIFIED: Changed to debug
 
-        # Use data_store_copy that was fetched within the lock if debug_mode_enabled, otherwise it's {}
-        # This check is now implicit as sorted_streams will be empty if data_store_copy is {}
-        # The original code fetched data_store_copy outside the debug_mode_enabled check.
-        # We've moved the copy of session_state.data_store inside the lock and made it conditional.
-        # However, timing_data_entry is still needed.
-        with session_state.lock:  # Re-acquire lock if needed for data_store if not copied before
-            timing_data_entry = session_state.data_store.get(
-                'TimingData', {}) if not debug_mode_enabled else data_store_copy.get('TimingData', {})
+        # The table only depends on the snapshot, the display preferences and the highlight rules
+        # (which can move with wall-clock time in live qualifying), so skip the rebuild if none changed.
+        # Rows with a running pit timer change every tick and are never skipped.
+        has_wall_clock_rows = any(
+            driver_state.get('InPit') or
+            (driver_state.get('final_live_pit_time_display_timestamp') and
+             current_time_for_callbacks - driver_state['final_live_pit_time_display_timestamp'] < 15)
+            for driver_state in timing_state_copy.values())
+        # Debug mode also lists the raw streams, which any message can change
+        data_key = snap.version if debug_mode_enabled else state_snapshot.domain_version_key(snap, "timing", "session")
+        render_key = (f"{data_key}|{bool(debug_mode_enabled)}|{hide_retired_pref}|"
+                      f"{active_segment_highlight_rule['type']}|{q1_eliminated_highlight_rule['type']}|"
+                      f"{q2_eliminated_highlight_rule['type']}{'|pit-timer' if has_wall_clock_rows else ''}")
+        last_render = last_render_key if isinstance(last_render_key, dict) else {}
+        if render_key == last_render.get("key") and not has_wall_clock_rows:
+            logger.debug(f"Callback '{func_name}' END. Timing unchanged ({data_key}), skipped.")
+            return no_update, no_update, no_update, no_update
+
+        timing_data_entry = data_store_copy.get('TimingData', {})
 
         timestamp_text = f"Timing TS: {timing_data_entry.get('timestamp', 'N/A')}" if timing_data_entry else config.TEXT_WAITING_FOR_DATA
         table_data_prep_start_time = time.monotonic()
@@ -995,14 +1060,6 @@ def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Option
                         pit_display_state_for_style = "SHOW_COMPLETED_DURATION"
                 # --- End of Pit Stop Display Logic ---
 
-                car_data = driver_state.get('CarData', {})
-                speed_val = car_data.get('Speed', '-')
-                gear = car_data.get('Gear', '-')
-                rpm = car_data.get('RPM', '-')
-                drs_val = car_data.get('DRS')
-                drs_map = {8: "E", 10: "On", 12: "On", 14: "ON"}
-                drs = drs_map.get(
-                    drs_val, 'Off') if drs_val is not None else 'Off'
                 is_overall_best_lap_flag = driver_state.get(
                     'IsOverallBestLap', False)
                 is_last_lap_personal_best_flag = utils.get_nested_state(
@@ -1048,7 +1105,8 @@ def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Option
                     'id': car_num, 'No.': racing_no, 'Car': tla, 'Pos': pos, 'Tyre': tyre,
                     'IntervalGap': interval_gap_markdown, 'Last Lap': last_lap_val, 'Best Lap': best_lap_val,
                     'S1': s1_val, 'S2': s2_val, 'S3': s3_val, 'Pits': pits_text_to_display,
-                    'Status': driver_status_raw, 'Speed': speed_val, 'Gear': gear, 'RPM': rpm, 'DRS': drs,
+                    # CarData (Speed/Gear/RPM/DRS) has no column and would change every row on every tick
+                    'Status': driver_status_raw,
                     'IsOverallBestLap_Str': "TRUE" if is_overall_best_lap_flag else "FALSE",
                     'IsOverallBestS1_Str': "TRUE" if is_overall_best_s1_flag else "FALSE",
                     'IsOverallBestS2_Str': "TRUE" if is_overall_best_s2_flag else "FALSE",
@@ -1075,39 +1133,45 @@ def update_main_data_displays(n, debug_mode_enabled: bool, session_prefs: Option
         if callback_duration > 0.1:  # Log if callback takes more than 100ms
             logger.warning(
                 f"update_main_data_displays callback took {callback_duration:.3f} seconds. Debug mode: {debug_mode_enabled}")
+        table_output, emission_id = _timing_table_output(session_state, table_data, last_render.get("emit"))
         logger.debug(f"Callback '{func_name}' END. Total time: {time.monotonic() - overall_start_time:.4f}s")
-        return other_elements, table_data, timestamp_text
+        return other_elements, table_output, timestamp_text, {"key": render_key, "emit": emission_id}
 
     except Exception as e_update:
         logger.error(
             f"Error in update_main_data_displays callback: {e_update}", exc_info=True)
-        return no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
         
 @app.callback(
     Output('race-control-log-display', 'value'),
-    Input('interval-component-medium', 'n_intervals') # Update periodically
+    Output('race-control-version-store', 'data'),
+    Input('interval-component-medium', 'n_intervals'), # Update periodically
+    State('race-control-version-store', 'data')
 )
-def update_race_control_display(n_intervals):
-    session_state = app_state.get_or_create_session_state()
+def update_race_control_display(n_intervals, last_version_key):
+    session_state = app_state.get_display_state()
     callback_start_time = time.monotonic()
     func_name = inspect.currentframe().f_code.co_name
     logger.debug(f"Callback '{func_name}' START")
     try:
-        with session_state.lock:
-            # The deque stores messages with newest first due to appendleft
-            # To display them chronologically (oldest at top), we reverse.
-            # Or, if you want newest at top, just join directly.
-            log_messages = list(session_state.race_control_log) # Get a snapshot
+        # The deque stores messages with newest first due to appendleft
+        # To display them chronologically (oldest at top), we reverse.
+        # Or, if you want newest at top, just join directly.
+        snap = state_snapshot.get_snapshot(session_state)
+        version_key = state_snapshot.domain_version_key(snap, "race_control")
+        if version_key == last_version_key:
+            return no_update, no_update
+        log_messages = snap.race_control_log # Read-only tuple
 
         if not log_messages:
-            return config.TEXT_RC_WAITING # Use constant
+            return config.TEXT_RC_WAITING, version_key # Use constant
 
         # To display newest messages at the top of the textarea:
         display_text = "\n".join(log_messages)
         # If you prefer oldest messages at the top (more traditional log):
         # display_text = "\n".join(reversed(log_messages))
         logger.debug(f"Callback '{func_name}' END. Took: {time.monotonic() - callback_start_time:.4f}s")
-        return display_text
+        return display_text, version_key
     except Exception as e:
         logger.error(f"Error updating race control display: {e}", exc_info=True)
-        return config.TEXT_RC_ERROR # Use constant
\ No newline at end of file
+        return config.TEXT_RC_ERROR, no_update # Use constant
\ No newline at end of file
@@ -8,11 +8,11 @@ import pandas as pd
 from dash.dependencies import Input, Output, State
 from dash import no_update, dcc, html
 import dash_bootstrap_components as dbc
-from io import StringIO
 
 import plotly.graph_objects as go
 
 from app_instance import app
+import laps_registry
 from historical_data_fetcher import load_historical_laps, load_historical_telemetry
 from utils import (
     create_lap_position_chart, 
@@ -120,9 +120,14 @@ def load_historical_data(n_clicks, year, event, session):
     if laps_df.empty:
         return dbc.Alert("Error: Could not load lap data for the selected session.", color="danger"), None
 
+    # The laps stay on the server; the browser only keeps the handle for the other callbacks.
+    # Registering also runs the one-shot analytics pass every tab below reads from.
+    laps_handle = laps_registry.register((year, event, session), laps_df)
+    dataset = laps_registry.get(laps_handle)
+
     # --- Create the components needed for all tabs ---
-    lap_chart_figure = create_lap_position_chart(laps_df, year)
-    driver_options = [{'label': tla, 'value': tla} for tla in sorted(laps_df['Driver'].unique())]
+    lap_chart_figure = create_lap_position_chart(dataset.analytics.position_traces)
+    driver_options = [{'label': tla, 'value': tla} for tla in dataset.drivers]
     empty_figure = go.Figure(layout={'template': 'plotly_dark'}) # Placeholder for empty graphs
 
     # --- Build the new tabbed layout ---
@@ -182,10 +187,7 @@ def load_historical_data(n_clicks, year, event, session):
         )
     ], className="mt-3")
 
-    # Store the lap data in the browser for other callbacks to use
-    json_laps = laps_df.to_json(date_format='iso', orient='split')
-
-    return tabbed_layout, json_laps
+    return tabbed_layout, laps_handle
 
 # 5. NEW: Callback to populate Stint dropdown
 @app.callback(
@@ -194,17 +196,15 @@ def load_historical_data(n_clicks, year, event, session):
     Input('historical-driver-dropdown', 'value'),
     State('historical-laps-data-store', 'data')
 )
-def update_stint_dropdown(selected_driver, laps_data_json):
-    if not selected_driver or not laps_data_json:
+def update_stint_dropdown(selected_driver, laps_handle):
+    if not selected_driver or not laps_handle:
         return [], True
 
-    # FIX: Wrap the JSON string in StringIO to avoid the FutureWarning
-    laps_df = pd.read_json(StringIO(laps_data_json), orient='split')
-    
-    driver_laps = laps_df[laps_df['Driver'] == selected_driver]
-    stints = sorted(driver_laps['Stint'].unique())
-    
-    stint_options = [{'label': f'Stint {int(s)}', 'value': s} for s in stints]
+    dataset = laps_registry.get(laps_handle)
+    if dataset is None:
+        return [], True
+
+    stint_options = dataset.analytics.stint_options(selected_driver)
     return stint_options, False
 
 # 6. NEW: Callback to generate and display the degradation chart
@@ -214,38 +214,25 @@ def update_stint_dropdown(selected_driver, laps_data_json):
     [State('historical-driver-dropdown', 'value'),
      State('historical-laps-data-store', 'data')]
 )
-def update_tyre_degradation_chart(selected_stint, selected_driver, laps_data_json):
-    if not all([selected_stint, selected_driver, laps_data_json]):
+def update_tyre_degradation_chart(selected_stint, selected_driver, laps_handle):
+    if not all([selected_stint, selected_driver, laps_handle]):
         return go.Figure(layout={'template': 'plotly_dark', 'annotations': [{'text': 'Select a driver and stint to view analysis.', 'showarrow': False}]})
 
-    # FIX 1: Wrap the JSON string in StringIO
-    laps_df = pd.read_json(StringIO(laps_data_json), orient='split')
+    dataset = laps_registry.get(laps_handle)
+    if dataset is None:
+        return go.Figure(layout={'template': 'plotly_dark', 'annotations': [{'text': 'Session data expired. Please load the session again.', 'showarrow': False}]})
     
-    stint_df = laps_df[(laps_df['Driver'] == selected_driver) & (laps_df['Stint'] == selected_stint)]
-    
-    # FIX 2: Convert to seconds and remove outliers on a new DataFrame to avoid the SettingWithCopyWarning
-    clean_stint_df = stint_df.copy()
-    clean_stint_df['LapTime'] = pd.to_timedelta(clean_stint_df['LapTime']).dt.total_seconds()
-    
-    q1 = clean_stint_df['LapTime'].quantile(0.25)
-    q3 = clean_stint_df['LapTime'].quantile(0.75)
-    iqr = q3 - q1
-    
-    # Filter by creating a new DataFrame slice
-    clean_stint_df = clean_stint_df[~((clean_stint_df['LapTime'] < (q1 - 1.5 * iqr)) |(clean_stint_df['LapTime'] > (q3 + 1.5 * iqr)))]
+    return create_tyre_degradation_chart(dataset.analytics.stint(selected_driver, selected_stint))
 
-    return create_tyre_degradation_chart(clean_stint_df)
-
-def _populate_lap_options(selected_driver, laps_data_json):
+def _populate_lap_options(selected_driver, laps_handle):
     """Helper function to generate lap options for a driver."""
-    if not selected_driver or not laps_data_json:
+    if not selected_driver or not laps_handle:
         return [], True, None # options, disabled, value
 
-    laps_df = pd.read_json(StringIO(laps_data_json), orient='split')
-    driver_laps = laps_df[laps_df['Driver'] == selected_driver].sort_values(by="LapNumber")
-
-    lap_options = [{'label': f"Lap {int(lap['LapNumber'])} ({lap['LapTime']})", 'value': int(lap['LapNumber'])} 
-                   for _, lap in driver_laps.iterrows() if pd.notna(lap.get('LapTime'))]
+    dataset = laps_registry.get(laps_handle)
+    if dataset is None:
+        return [], True, None
+    lap_options = dataset.analytics.lap_options.get(selected_driver, [])
     
     return lap_options, False, None if not lap_options else lap_options[-1]['value']
 
@@ -257,8 +244,8 @@ def _populate_lap_options(selected_driver, laps_data_json):
     Input('historical-driver-1-dropdown', 'value'),
     State('historical-laps-data-store', 'data')
 )
-def update_lap_dropdown_1(selected_driver, laps_data_json):
-    return _populate_lap_options(selected_driver, laps_data_json)
+def update_lap_dropdown_1(selected_driver, laps_handle):
+    return _populate_lap_options(selected_driver, laps_handle)
 
 
 @app.callback(
@@ -268,8 +255,8 @@ def update_lap_dropdown_1(selected_driver, laps_data_json):
     Input('historical-driver-2-dropdown', 'value'),
     State('historical-laps-data-store', 'data')
 )
-def update_lap_dropdown_2(selected_driver, laps_data_json):
-    return _populate_lap_options(selected_driver, laps_data_json)
+def update_lap_dropdown_2(selected_driver, laps_handle):
+    return _populate_lap_options(selected_driver, laps_handle)
 
 
 @app.callback(
@@ -22,8 +22,9 @@ import app_state
 import config
 import replay
 import signalr_client
+import state_snapshot
 import utils
-import data_processing
+import live_hub
 from schedule_page import get_current_year_schedule_with_sessions
 
 logger = logging.getLogger(__name__)
@@ -61,13 +62,14 @@ def auto_connect_monitor_session_actual_target(session_state: app_state.SessionS
             if current_s_app_status == "Live" and s_auto_connected_event_id and not s_current_replay_file:
                 s_current_session_feed_status = "Unknown"
                 current_live_event_details_id = None
-                with session_state.lock:
-                    s_current_session_feed_status = session_state.session_details.get(
+                feed_state = app_state.get_data_state(session_state)
+                with feed_state.lock:
+                    s_current_session_feed_status = feed_state.session_details.get(
                         'SessionStatus', 'Unknown')
-                    live_year = session_state.session_details.get('Year')
-                    live_event_name = session_state.session_details.get(
+                    live_year = feed_state.session_details.get('Year')
+                    live_event_name = feed_state.session_details.get(
                         'EventName')
-                    live_session_name = session_state.session_details.get(
+                    live_session_name = feed_state.session_details.get(
                         'SessionName')
                     if live_year and live_event_name and live_session_name:
                         current_live_event_details_id = f"{live_year}_{live_event_name}_{live_session_name}"
@@ -86,8 +88,7 @@ def auto_connect_monitor_session_actual_target(session_state: app_state.SessionS
                                 datetime.now(pytz.utc) >= (s_auto_session_end_detected_utc + timedelta(minutes=config.AUTO_DISCONNECT_AFTER_SESSION_END_MINUTES)): # Use config
                             logger_s_auto_connect.info(
                                 f"Disconnect timer expired for F1 session '{s_auto_connected_event_id}'. Disconnecting user session.")
-                            signalr_client.stop_connection_session(
-                                session_state)
+                            live_hub.detach_session(session_state)
                             with session_state.lock:
                                 session_state.app_status["auto_connected_session_identifier"] = None
                                 session_state.app_status["auto_connected_session_end_detected_utc"] = None
@@ -175,6 +176,8 @@ def auto_connect_monitor_session_actual_target(session_state: app_state.SessionS
                             'SessionName': next_f1_session_to_connect['session_name'],
                             'SessionStartTimeUTC': next_f1_session_to_connect['start_time_utc'].isoformat(),
                             'Type': next_f1_session_to_connect['session_type']})
+                        session_state.bump_domain_versions("session")
+                        session_state.snapshot_dirty = True
                         session_state.app_status.update({
                             "state": "Initializing", "connection": config.TEXT_SIGNALR_SOCKET_CONNECTING_STATUS,
                             "auto_connected_session_identifier": f1_session_unique_id,
@@ -182,43 +185,19 @@ def auto_connect_monitor_session_actual_target(session_state: app_state.SessionS
                             "current_replay_file": None})
                         session_state.stop_event.clear()
 
-                    websocket_url, ws_headers = signalr_client.build_connection_url(
-                        config.NEGOTIATE_URL_BASE, config.HUB_NAME) # Ensure config is imported
-
                     if session_state.stop_event.is_set():
                         logger_s_auto_connect.info(
-                            "Stop event after negotiation. Aborting connection start for this cycle.")
-                    elif websocket_url and ws_headers:
-                        if session_state.record_live_data:
-                            if not replay.init_live_file_session(session_state): # Ensure replay is imported
-                                logger_s_auto_connect.error(
-                                    f"Failed to initialize live recording file for session {session_state.session_id}.")
-
-                        sess_id_log = session_state.session_id[:8]
-                        conn_thread = threading.Thread( # Ensure threading is imported
-                            target=signalr_client.run_connection_session,
-                            args=(session_state, websocket_url, ws_headers),
-                            name=f"SigRConn_Sess_{sess_id_log}", daemon=True)
-
-                        dp_thread = threading.Thread(
-                            target=data_processing.data_processing_loop_session, # Ensure data_processing is imported
-                            args=(session_state,),
-                            name=f"DataProc_Sess_{sess_id_log}", daemon=True)
-
-                        with session_state.lock:
-                            session_state.connection_thread = conn_thread
-                            session_state.data_processing_thread = dp_thread
-
-                        conn_thread.start()
-                        dp_thread.start()
+                            "Stop event set before attaching. Aborting connection start for this cycle.")
+                    elif live_hub.attach_session(session_state, record_live_data=session_state.record_live_data):
                         logger_s_auto_connect.info(
-                            "Session-specific SignalR connection and Data Processing threads initiated by auto-connect.")
+                            "Session attached to the shared live hub by auto-connect.")
                         if session_state.stop_event.wait(timeout=config.AUTO_CONNECT_ACTIVE_POLL_INTERVAL_SECONDS): # Use config
                             break
                         continue
                     else:
                         logger_s_auto_connect.error(
                             f"Negotiation failed for F1 session {f1_session_unique_id}. Will retry scan.")
+                        live_hub.detach_session(session_state)
                         with session_state.lock:
                             session_state.app_status.update({"state": "Error", "connection": "Negotiation Failed (Auto)",
                                                              "auto_connected_session_identifier": None})
@@ -308,6 +287,7 @@ def handle_control_clicks(connect_clicks, replay_clicks, stop_reset_clicks,
             logger.info(f"LiveConnSess {sess_id_log}: No active replay thread found to stop; proceeding directly to live connection setup.")
     
         # --- Phase 2: Prepare and set state for the new live connection ---
+        live_hub.detach_session(session_state) # Drop any stale hub subscription before resetting
         with session_state.lock:
             # Re-check current state, as stop_replay_session might have changed it or taken time
             current_s_state = session_state.app_status["state"]
@@ -334,50 +314,18 @@ def handle_control_clicks(connect_clicks, replay_clicks, stop_reset_clicks,
             # Reset track map specific states (important if switching from a replay)
             session_state.track_coordinates_cache = app_state.INITIAL_SESSION_TRACK_COORDINATES_CACHE.copy()
             session_state.session_details['SessionKey'] = None 
+            session_state.bump_domain_versions("session")
+            session_state.snapshot_dirty = True
             session_state.selected_driver_for_map_and_lap_chart = None
             logger.debug(f"LiveConnSess {sess_id_log}: Map-related states in session_state reset.")
         # --- Lock released after state setup ---
     
-        logger.info(f"LiveConnSess {sess_id_log}: Attempting to build connection URL (network operation outside lock)...")
-        websocket_url, ws_headers = signalr_client.build_connection_url(config.NEGOTIATE_URL_BASE, config.HUB_NAME)
-        
-        if websocket_url and ws_headers:
-            logger.info(f"LiveConnSess {sess_id_log}: Connection URL built. Record preference: {session_state.record_live_data}. Starting threads.")
-            
-            # Check recording preference again, as it might be based on checkbox state not yet reflected if reset cleared it without re-reading
-            # The `session_record_pref` from the callback State should be reliable here.
-            if record_pref: # Use the state of the checkbox when the button was clicked
-                logger.info(f"LiveConnSess {sess_id_log}: Initializing live recording file based on checkbox state ({record_pref:}).")
-                if not replay.init_live_file_session(session_state): # init_live_file_session uses session_state.record_live_data
-                    logger.error(f"LiveConnSess {sess_id_log}: Failed to initialize live recording file.")
-                else:
-                    logger.info(f"LiveConnSess {sess_id_log}: Live recording file initialized successfully.")
-            else:
-                logger.info(f"LiveConnSess {sess_id_log}: Live recording not requested ({record_pref}).")
-    
-            logger.info(f"LiveConnSess {sess_id_log}: Creating SignalR connection and Data Processing threads for live session.")
-            conn_thread = threading.Thread(
-                target=signalr_client.run_connection_session, 
-                args=(session_state, websocket_url, ws_headers), 
-                name=f"SigRConn_Sess_{sess_id_log}", daemon=True
-            )
-            dp_thread = threading.Thread(
-                target=data_processing.data_processing_loop_session, 
-                args=(session_state,),
-                name=f"DataProc_Live_{sess_id_log}", daemon=True 
-            )
-            with session_state.lock: # Brief lock to store thread handles
-                session_state.connection_thread = conn_thread
-                session_state.data_processing_thread = dp_thread
-            
-            conn_thread.start()
-            logger.info(f"LiveConnSess {sess_id_log}: SignalR connection thread STARTED: {conn_thread.name}")
-            dp_thread.start()
-            logger.info(f"LiveConnSess {sess_id_log}: Data Processing thread for live STARTED: {dp_thread.name}")
-        else: 
-            logger.error(f"LiveConnSess {sess_id_log}: Negotiation failed. WebSocket URL or headers are None.")
-            with session_state.lock: # Lock to update error status
-                session_state.app_status.update({"state": "Error", "connection": "Negotiation Failed (handle_control_clicks)"})
+        # --- Phase 3: Subscribe to the shared live hub (one upstream connection for all viewers) ---
+        logger.info(f"LiveConnSess {sess_id_log}: Attaching to shared live hub. Record preference: {record_pref}.")
+        if live_hub.attach_session(session_state, record_live_data=record_pref):
+            logger.info(f"LiveConnSess {sess_id_log}: Attached to shared live hub.")
+        else:
+            logger.error(f"LiveConnSess {sess_id_log}: Shared live hub failed to start (negotiation failed).")
         
         track_map_output = utils.create_empty_figure_with_message(config.TRACK_MAP_WRAPPER_HEIGHT, f"map_connect_{time.time()}", config.TEXT_TRACK_MAP_LOADING, config.TRACK_MAP_MARGINS)
         car_pos_store_output = {'status': 'reset_map_display', 'timestamp': time.time()}
@@ -401,6 +349,7 @@ def handle_control_clicks(connect_clicks, replay_clicks, stop_reset_clicks,
             _conn_thread = session_state.connection_thread
             _repl_thread = session_state.replay_thread
 
+        live_hub.detach_session(session_state)
         if _conn_thread and _conn_thread.is_alive():
             logger.info(f"ReplaySess {sess_id_log}: Stopping active live connection (from handle_control_clicks) to start replay.")
             signalr_client.stop_connection_session(session_state) # This function should handle its own join and lock release.
@@ -452,6 +401,7 @@ def handle_control_clicks(connect_clicks, replay_clicks, stop_reset_clicks,
         # Stop live connection (if any)
         # signalr_client.stop_connection_session should handle its DP thread.
         logger.info(f"Session {sess_id_log}: Stopping SignalR connection (if any)...")
+        live_hub.detach_session(session_state)
         signalr_client.stop_connection_session(session_state) 
     
         # Stop replay (if any)
@@ -744,12 +694,36 @@ def update_replay_speed_state(new_speed_value: Optional[float]) -> Patch:
 
         # Update the in-memory state and prepare the patch for the store
         session_state.replay_speed = new_speed
+        session_state.bump_domain_versions("session", "timing")
+        session_state.snapshot_dirty = True
         patched_prefs = Patch()
         patched_prefs['replay_speed'] = new_speed
         logger.debug(f"Replay speed updated in session_state and store to: {new_speed}")
 
+    # Re-anchored timers must reach the display callbacks right away
+    state_snapshot.publish_if_due(session_state, force=True)
     return patched_prefs
     
+@app.callback(
+    Output('dummy-output-for-controls', 'children', allow_duplicate=True),
+    Input('replay-seek-button', 'n_clicks'),
+    State('replay-seek-lap-input', 'value'),
+    prevent_initial_call=True
+)
+def handle_replay_seek(n_clicks: Optional[int], lap_value: Optional[int]):
+    """Jumps the running replay to the start of the requested lap."""
+    if not n_clicks or lap_value is None:
+        return no_update
+    try:
+        target_lap = int(lap_value)
+    except (ValueError, TypeError):
+        return no_update
+    session_state = app_state.get_or_create_session_state()
+    if not session_state:
+        return no_update
+    replay.seek_replay_session(session_state, lap=target_lap)
+    return no_update
+
 @app.callback(
     Output('replay-speed-slider', 'value'),
     Input('session-preferences-store', 'data'),
@@ -847,13 +821,12 @@ def export_timing_data_to_csv(n_clicks):
     Handles the click event for the export button.
     Gathers the current timing data, formats it as a CSV, and sends it for download.
     """
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     if not session_state:
         return dash.no_update
 
-    with session_state.lock:
-        # Create a snapshot of the timing state to avoid holding the lock
-        timing_state_snapshot = dict(session_state.timing_state)
+    # Published snapshot of the timing state (read-only, no lock needed)
+    timing_state_snapshot = state_snapshot.get_snapshot(session_state).timing_state
 
     if not timing_state_snapshot:
         logger.warning("Export to CSV clicked, but no timing data is available.")
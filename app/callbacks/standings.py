@@ -20,6 +20,7 @@ import dash_bootstrap_components as dbc
 from app_instance import app
 import app_state
 import config
+import state_snapshot
 import utils
 from schedule_page import get_championship_standings, get_constructor_standings
 
@@ -42,12 +43,12 @@ def update_standings_tables(pathname, active_tab, n_intervals):
     if pathname != '/standings':
         return [], [], None
 
-    session_state = app_state.get_or_create_session_state()
+    session_state = app_state.get_display_state()
     if not session_state:
         return [], [], None
 
     is_live_session = session_state.app_status.get("state") == "Live"
-    live_standings_data = session_state.live_standings
+    live_standings_data = state_snapshot.get_snapshot(session_state).live_standings
 
     # --- Use Live Data if session is active AND live data has been received ---
     if is_live_session and live_standings_data:
@@ -0,0 +1,348 @@
+# circuit_geometry.py
+"""
+Process-wide cache of circuit geometry for the track map, keyed by (circuit_key, year).
+
+Every browser session used to fetch the MultiViewer circuit API, rebuild the Shapely
+LineString and recompute the marshal sector segments on each SessionInfo change, keeping
+the result only in its own track_coordinates_cache. Geometry now comes from three tiers:
+
+  memory  built once per process and shared (read-only) by every session
+  disk    the raw API response, stored as CIRCUIT_GEOMETRY_CACHE_DIR/<circuit>_<year>.json
+          (next to the FastF1 cache), so a circuit once seen also works offline
+  API     fetched at most once at a time per circuit and year; a failed fetch is not retried
+          for CIRCUIT_GEOMETRY_RETRY_SECONDS and falls back to another year of the same
+          circuit on disk
+
+Each geometry carries a TrackGeometry: the outline as a numpy array with a KD-tree (SciPy,
+installed with FastF1) or vectorised brute force behind it, answering nearest-track-point
+queries for many points at once. Marshal sector starts, corners and lights are located in
+one such query; other point-to-track lookups can reuse geometry['track_geometry'].
+
+prewarm_season() fills the cache for every meeting of a season's live timing index
+(the feed's own schedule, which carries the circuit keys SessionInfo reports). main.py
+runs it after the schedule warm-up.
+"""
+import logging
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Any, Optional, List, Dict, Tuple
+
+import requests
+
+import config
+
+# Shapely and numpy are for track map processing
+try:
+    from shapely.geometry import LineString
+    import numpy as np
+except ImportError:
+    logging.warning(
+        "Shapely or NumPy not found. Track map features will be limited.")
+    LineString = None  # type: ignore
+    np = None  # type: ignore
+
+# Optional KD-tree (SciPy is installed with FastF1); without it queries are vectorised brute force
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None  # type: ignore
+
+logger = logging.getLogger("F1App.CircuitGeometry")
+
+GeometryKey = Tuple[str, str]
+
+_GEOMETRY: Dict[GeometryKey, Dict[str, Any]] = {}
+_GEOMETRY_LOCK = threading.Lock()
+_FETCH_LOCKS: Dict[GeometryKey, threading.Lock] = {}
+_FAILED_AT: Dict[GeometryKey, float] = {}
+
+
+def _key(circuit_key: Any, year: Any) -> GeometryKey:
+    return str(circuit_key), str(year)
+
+
+def _disk_path(key: GeometryKey) -> Path:
+    return config.CIRCUIT_GEOMETRY_CACHE_DIR / f"{key[0]}_{key[1]}.json"
+
+
+# --- Building ---
+
+class TrackGeometry:
+    """
+    Track outline as an (N, 2) float array with a spatial index built once, for
+    nearest-track-point lookups of any number of points in one call.
+    """
+    # Query points per brute-force block when no KD-tree is available (block x N distances)
+    BRUTE_FORCE_BLOCK = 256
+
+    def __init__(self, track_x: List[float], track_y: List[float]):
+        self.points = np.column_stack((np.asarray(track_x, dtype=float), np.asarray(track_y, dtype=float)))
+        self._tree = cKDTree(self.points) if cKDTree is not None else None
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def nearest_indices(self, query_x: List[Optional[float]], query_y: List[Optional[float]]) -> 'np.ndarray':
+        """Index of the closest track point for every query point; -1 where a coordinate is missing."""
+        queries = np.column_stack((np.asarray(query_x, dtype=float), np.asarray(query_y, dtype=float))) \
+            if len(query_x) else np.empty((0, 2))
+        indices = np.full(len(queries), -1, dtype=np.int64)
+        valid = ~np.isnan(queries).any(axis=1)
+        valid_queries = queries[valid]
+        if not len(valid_queries) or not len(self.points):
+            return indices
+        if self._tree is not None:
+            _, nearest = self._tree.query(valid_queries)
+        else:
+            nearest = np.concatenate([
+                np.argmin(((block[:, None, :] - self.points[None, :, :]) ** 2).sum(axis=2), axis=1)
+                for block in (valid_queries[start:start + self.BRUTE_FORCE_BLOCK]
+                              for start in range(0, len(valid_queries), self.BRUTE_FORCE_BLOCK))
+            ])
+        indices[valid] = nearest
+        return indices
+
+    def nearest_index(self, point_x: float, point_y: float) -> Optional[int]:
+        index = int(self.nearest_indices([point_x], [point_y])[0])
+        return index if index >= 0 else None
+
+
+def _coordinates(items: List[Dict[str, Any]]) -> Tuple[List[Optional[float]], List[Optional[float]]]:
+    """x and y lists of track positions, None (NaN in the query) where not numeric."""
+    xs, ys = [], []
+    for item in items:
+        x, y = item.get('x'), item.get('y')
+        numeric = isinstance(x, (int, float)) and isinstance(y, (int, float))
+        xs.append(float(x) if numeric else None)
+        ys.append(float(y) if numeric else None)
+    return xs, ys
+
+
+def _marshal_sector_segments(track_length: int, sector_start_indices: Dict[int, int]) -> Dict[int, Tuple[int, int]]:
+    """Track point index range (start, end) of every marshal sector from the sectors' start points."""
+    segments = {}
+    sorted_starts = sorted(sector_start_indices.items())
+    if len(sorted_starts) == 1:
+        segments[sorted_starts[0][0]] = (0, track_length - 1)
+    elif len(sorted_starts) > 1:
+        for position_index, (sector_number, start_index) in enumerate(sorted_starts):
+            end_index = (max(start_index, sorted_starts[position_index + 1][1] - 1)
+                         if position_index + 1 < len(sorted_starts) else track_length - 1)
+            segments[sector_number] = (start_index, end_index) if start_index <= end_index else (start_index, start_index)
+    return segments
+
+
+def _track_positions(items: Any) -> Optional[List[Dict[str, Any]]]:
+    if not isinstance(items, list):
+        return None
+    return [{'number': item['number'], 'x': item['trackPosition'].get('x'), 'y': item['trackPosition'].get('y')}
+            for item in items if isinstance(item, dict) and 'number' in item and isinstance(item.get('trackPosition'), dict)]
+
+
+def build_geometry(map_api_data: Dict[str, Any], label: str = "") -> Dict[str, Any]:
+    """
+    Track map cache fields (everything in INITIAL_SESSION_TRACK_COORDINATES_CACHE but
+    session_key, plus the LineString and TrackGeometry) from a MultiViewer circuit API
+    response. Corners and marshal lights get the 'track_index' of their closest track point.
+    """
+    track_x, track_y, track_linestring, x_range, y_range = [None] * 5
+    api_x = [float(p) for p in map_api_data.get('x', [])]
+    api_y = [float(p) for p in map_api_data.get('y', [])]
+    if api_x and api_y and len(api_x) == len(api_y) and len(api_x) > 1 and LineString and np:
+        api_linestring = LineString(zip(api_x, api_y))
+        if api_linestring.length > 0:
+            track_x, track_y, track_linestring = api_x, api_y, api_linestring
+            x_min, x_max = min(track_x), max(track_x)
+            y_min, y_max = min(track_y), max(track_y)
+            pad_x = (x_max - x_min) * 0.05
+            pad_y = (y_max - y_min) * 0.05
+            x_range = [x_min - pad_x, x_max + pad_x]
+            y_range = [y_min - pad_y, y_max + pad_y]
+        else:
+            logger.warning(f"Circuit {label}: zero-length main track line.")
+    else:
+        logger.warning(f"Circuit {label}: no valid x/y for main track line or LineString/np missing.")
+
+    marshal_sector_points = map_api_data.get('marshalSectors') if isinstance(map_api_data.get('marshalSectors'), list) else None
+    corners_data = _track_positions(map_api_data.get('corners'))
+    marshal_lights_data = _track_positions(map_api_data.get('marshalLights'))
+    track_geometry = TrackGeometry(track_x, track_y) if track_x and track_y else None
+
+    marshal_sector_segments = None
+    if track_geometry is not None:
+        # Marshal sector starts, corners and lights located on the track in one query
+        marshal_sectors = [{'number': ms['number'], **ms['trackPosition']}
+                           for ms in (marshal_sector_points or [])
+                           if isinstance(ms, dict) and ms.get('number') is not None and isinstance(ms.get('trackPosition'), dict)]
+        located = marshal_sectors + (corners_data or []) + (marshal_lights_data or [])
+        track_indices = track_geometry.nearest_indices(*_coordinates(located))
+        for item, track_index in zip(located[len(marshal_sectors):], track_indices[len(marshal_sectors):]):
+            item['track_index'] = int(track_index) if track_index >= 0 else None
+        if marshal_sector_points is not None:
+            marshal_sector_segments = _marshal_sector_segments(len(track_geometry), {
+                sector['number']: int(track_index)
+                for sector, track_index in zip(marshal_sectors, track_indices[:len(marshal_sectors)]) if track_index >= 0
+            })
+
+    return {
+        'x': track_x, 'y': track_y, 'linestring': track_linestring, 'range_x': x_range, 'range_y': y_range,
+        'track_geometry': track_geometry,
+        'corners_data': corners_data,
+        'marshal_lights_data': marshal_lights_data,
+        'marshal_sector_points': marshal_sector_points,
+        'marshal_sector_segments': marshal_sector_segments,
+        'rotation': map_api_data.get('rotation'),
+    }
+
+
+# --- Tiers ---
+
+def _load_from_disk(key: GeometryKey) -> Optional[Dict[str, Any]]:
+    path = _disk_path(key)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable circuit cache file {path.name}: {e}")
+        return None
+
+
+def _save_to_disk(key: GeometryKey, map_api_data: Dict[str, Any]):
+    path = _disk_path(key)
+    try:
+        config.CIRCUIT_GEOMETRY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(map_api_data, f)
+        temp_path.replace(path)
+    except OSError as e:
+        logger.warning(f"Could not write circuit cache file {path.name}: {e}")
+
+
+def _fetch_from_api(key: GeometryKey) -> Optional[Dict[str, Any]]:
+    api_url = config.MULTIVIEWER_CIRCUIT_API_URL_TEMPLATE.format(circuit_key=key[0], year=key[1])
+    logger.info(f"Fetching circuit geometry: {api_url}")
+    try:
+        response = requests.get(api_url, headers={'User-Agent': config.MULTIVIEWER_API_USER_AGENT},
+                                timeout=config.REQUESTS_TIMEOUT_SECONDS, verify=False)  # Consider verify=True for production
+        response.raise_for_status()
+        map_api_data = response.json()
+        return map_api_data if isinstance(map_api_data, dict) else None
+    except Exception as e:
+        logger.error(f"Circuit geometry fetch FAILED for circuit {key[0]} ({key[1]}): {e}")
+        return None
+
+
+def _other_year_on_disk(key: GeometryKey) -> Optional[Tuple[GeometryKey, Dict[str, Any]]]:
+    """The newest cached year of the same circuit, for when key itself cannot be fetched."""
+    try:
+        years = sorted((path.stem.split('_', 1)[1] for path in config.CIRCUIT_GEOMETRY_CACHE_DIR.glob(f"{key[0]}_*.json")),
+                       reverse=True)
+    except OSError:
+        return None
+    for year in years:
+        map_api_data = _load_from_disk((key[0], year))
+        if map_api_data is not None:
+            return (key[0], year), map_api_data
+    return None
+
+
+def peek_geometry(circuit_key: Any, year: Any) -> Optional[Dict[str, Any]]:
+    """The in-memory geometry, or None. Never does I/O."""
+    with _GEOMETRY_LOCK:
+        return _GEOMETRY.get(_key(circuit_key, year))
+
+
+def get_geometry(circuit_key: Any, year: Any) -> Optional[Dict[str, Any]]:
+    """
+    Shared geometry for a circuit and year from memory, disk or the API (in that order).
+    The returned dict and its lists are shared by all sessions and must not be modified.
+    """
+    if not circuit_key or not year:
+        return None
+    key = _key(circuit_key, year)
+    geometry = peek_geometry(*key)
+    if geometry is not None:
+        return geometry
+    with _GEOMETRY_LOCK:
+        fetch_lock = _FETCH_LOCKS.setdefault(key, threading.Lock())
+    with fetch_lock:  # One build per key; concurrent callers wait for it
+        geometry = peek_geometry(*key)
+        if geometry is not None:
+            return geometry
+        source, stand_in = "disk", False
+        map_api_data = _load_from_disk(key)
+        if map_api_data is None:
+            failed_at = _FAILED_AT.get(key)
+            if failed_at is None or time.monotonic() - failed_at >= config.CIRCUIT_GEOMETRY_RETRY_SECONDS:
+                source = "API"
+                map_api_data = _fetch_from_api(key)
+                if map_api_data is not None:
+                    _save_to_disk(key, map_api_data)
+                    _FAILED_AT.pop(key, None)
+                else:
+                    _FAILED_AT[key] = time.monotonic()
+        if map_api_data is None:
+            fallback = _other_year_on_disk(key)
+            if fallback is None:
+                return None
+            logger.warning(f"Circuit {key[0]} ({key[1]}) unavailable; using cached {fallback[0][1]} geometry.")
+            source, stand_in = f"disk ({fallback[0][1]})", True
+            map_api_data = fallback[1]
+        build_start = time.monotonic()
+        try:
+            geometry = build_geometry(map_api_data, f"{key[0]} ({key[1]})")
+        except Exception as e:
+            logger.error(f"Circuit {key[0]} ({key[1]}): could not build geometry from {source}: {e}", exc_info=True)
+            return None
+        logger.info(f"Circuit {key[0]} ({key[1]}) geometry built from {source} in "
+                    f"{(time.monotonic() - build_start) * 1000:.1f}ms ({len(geometry['x'] or [])} points).")
+        if stand_in:
+            return geometry  # Not kept in memory, so the real year is retried later
+        with _GEOMETRY_LOCK:
+            _GEOMETRY[key] = geometry
+        return geometry
+
+
+def session_cache(geometry: Dict[str, Any], session_key: str) -> Dict[str, Any]:
+    """A session's track_coordinates_cache: the shared geometry tagged with its session key."""
+    cache = dict(geometry)
+    cache['session_key'] = session_key
+    return cache
+
+
+# --- Prewarming ---
+
+def _season_circuit_keys(year: int) -> List[str]:
+    """Circuit keys of the meetings in the live timing index of a season."""
+    index_url = f"https://{config.F1_LIVETIMING_BASE_URL}/static/{year}/Index.json"
+    response = requests.get(index_url, timeout=config.REQUESTS_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    index_data = json.loads(response.content.decode('utf-8-sig'))  # The archive serves a BOM
+    circuit_keys = []
+    for meeting in index_data.get('Meetings', []):
+        circuit_key = (meeting.get('Circuit') or {}).get('Key') if isinstance(meeting, dict) else None
+        if circuit_key is not None and str(circuit_key) not in circuit_keys:
+            circuit_keys.append(str(circuit_key))
+    return circuit_keys
+
+
+def prewarm_season(year: Optional[int] = None):
+    """Loads (fetching if needed) the geometry of every circuit of a season's schedule."""
+    if not config.CIRCUIT_GEOMETRY_PREWARM:
+        return
+    year = year or time.gmtime().tm_year
+    try:
+        circuit_keys = _season_circuit_keys(year)
+    except Exception as e:
+        logger.warning(f"Circuit geometry prewarm: could not read the {year} live timing index: {e}")
+        return
+    loaded = sum(1 for circuit_key in circuit_keys if get_geometry(circuit_key, year) is not None)
+    logger.info(f"Circuit geometry prewarm: {loaded}/{len(circuit_keys)} circuits of {year} ready.")
+
+
+print("DEBUG: circuit_geometry module loaded")
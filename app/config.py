@@ -25,6 +25,8 @@ _SCRIPT_DIR = Path(__file__).parent.resolve()
 REPLAY_DIR = Path(os.environ.get('REPLAY_DIR', _SCRIPT_DIR / 'replays'))
 TARGET_SAVE_DIRECTORY = Path(os.environ.get('TARGET_SAVE_DIRECTORY', REPLAY_DIR))
 FASTF1_CACHE_DIR = Path(os.environ.get('FASTF1_CACHE_DIR', _SCRIPT_DIR / 'ff1_cache'))
+# Raw circuit API responses for the shared track geometry cache (see circuit_geometry.py)
+CIRCUIT_GEOMETRY_CACHE_DIR = Path(os.environ.get('CIRCUIT_GEOMETRY_CACHE_DIR', FASTF1_CACHE_DIR.parent / 'circuit_cache'))
 
 QUALIFYING_ELIMINATION_COUNT = {
     "Q1": 5, "SQ1": 5,
@@ -128,6 +130,47 @@ CHANNEL_MAP = {
     '5': 'Brake',
     '45': 'DRS'
 }
+# array typecodes for the columnar telemetry store (see telemetry_store.py)
+TELEMETRY_CHANNEL_TYPECODES = {
+    'RPM': 'h',       # int16
+    'Speed': 'h',     # int16
+    'Gear': 'b',      # int8
+    'Throttle': 'B',  # uint8
+    'Brake': 'B',     # uint8
+    'DRS': 'B'        # uint8
+}
+TELEMETRY_TIMESTAMP_TYPECODE = 'q'  # int64 epoch milliseconds
+
+# --- Circuit Geometry ---
+# Fetch the geometry of every circuit of the current season at startup
+CIRCUIT_GEOMETRY_PREWARM = os.environ.get('CIRCUIT_GEOMETRY_PREWARM', 'true').lower() == 'true'
+# A circuit whose fetch failed is not fetched again for this long
+CIRCUIT_GEOMETRY_RETRY_SECONDS = 60
+
+# --- Historical Sessions ---
+# Memory cap of the shared cache of loaded fastf1 sessions (fastf1_sessions.py)
+HISTORICAL_SESSION_CACHE_MB = int(os.environ.get('HISTORICAL_SESSION_CACHE_MB', 1024))
+# Laps datasets of the Historical Analysis page kept server-side (laps_registry.py)
+LAPS_REGISTRY_MAX_DATASETS = int(os.environ.get('LAPS_REGISTRY_MAX_DATASETS', 32))
+LAPS_REGISTRY_IDLE_TTL_SECONDS = int(os.environ.get('LAPS_REGISTRY_IDLE_TTL_SECONDS', 3600))
+# Samples per trace of the telemetry comparison chart (downsample.py); 0 keeps full resolution
+TELEMETRY_CHART_MAX_POINTS = int(os.environ.get('TELEMETRY_CHART_MAX_POINTS', 800))
+# Draw the telemetry comparison chart with WebGL (Scattergl) traces
+TELEMETRY_CHART_WEBGL = os.environ.get('TELEMETRY_CHART_WEBGL', 'true').lower() == 'true'
+# Sessions loaded in parallel by the cache_warmer.py CLI
+CACHE_WARMER_WORKERS = int(os.environ.get('CACHE_WARMER_WORKERS', 4))
+
+# --- Track Projection ---
+# Position/track X/Y units per metre (the feed and the circuit API use decimetres)
+TRACK_COORDINATE_UNITS_PER_METRE = 10.0
+# Equal-length mini sectors timed per car by track_projection.TrackPositions
+TRACK_MINI_SECTORS = int(os.environ.get('TRACK_MINI_SECTORS', 25))
+
+# --- Telemetry Retention ---
+# Most recent laps per driver kept at full resolution (0 keeps every lap at full resolution)
+TELEMETRY_FULL_RES_LAPS = int(os.environ.get('TELEMETRY_FULL_RES_LAPS', 5))
+# Older laps keep a min/max envelope: 2 samples per this many (~4 Hz CarData: 8 samples ~ 2 s)
+TELEMETRY_ENVELOPE_BUCKET_SAMPLES = int(os.environ.get('TELEMETRY_ENVELOPE_BUCKET_SAMPLES', 8))
 
 # --- Constants for Auto-Connect (can also be in config.py) ---
 # How often to check schedule when idle
@@ -139,6 +182,128 @@ AUTO_CONNECT_LEAD_TIME_MINUTES = 5    # Connect X minutes before session start
 INITIAL_SESSION_AUTO_CONNECT_DELAY_SECONDS = 5
 AUTO_DISCONNECT_AFTER_SESSION_END_MINUTES = 10
 
+# --- Payload Decoding ---
+# Threads decoding compressed (.z) feed payloads off the websocket thread (0 = decode inline)
+PAYLOAD_DECODE_WORKERS = int(os.environ.get('PAYLOAD_DECODE_WORKERS', 2))
+# Messages a session may have submitted but not yet delivered before new ones are dropped
+PAYLOAD_DECODE_MAX_PENDING = 20000
+PAYLOAD_DECODE_METRICS_EMA_ALPHA = 0.1
+
+# --- Data Queue Lanes ---
+# SessionState.data_queue serves lanes by priority (lowest first), FIFO within a lane (see lane_queue.py).
+# Overflow policy per lane: 'drop_oldest', 'drop_newest' or 'never_drop'.
+DATA_QUEUE_LANES = {
+    "control": {"priority": 0, "capacity": 2000, "policy": "never_drop",
+                "streams": ["SessionInfo", "SessionData", "SessionStatus", "TrackStatus", "RaceControlMessages",
+                            "DriverList", "LapCount", "ExtrapolatedClock", "TeamRadio"]},
+    "timing": {"priority": 1, "capacity": 10000, "policy": "never_drop",
+               "streams": ["TimingData", "TimingAppData", "TimingStats", "TopThree", "Heartbeat", "WeatherData",
+                           "PitLaneTimeCollection", "ChampionshipPrediction"]},
+    # Each Position frame carries every car, so older frames are superseded
+    "positions": {"priority": 2, "capacity": int(os.environ.get('DATA_QUEUE_POSITIONS_CAPACITY', 500)),
+                  "policy": "drop_oldest", "streams": ["Position"]},
+    "telemetry": {"priority": 2, "capacity": int(os.environ.get('DATA_QUEUE_TELEMETRY_CAPACITY', 2000)),
+                  "policy": "drop_oldest", "streams": ["CarData"]},
+}
+DATA_QUEUE_DEFAULT_LANE = "timing"
+# Queued items older than this are served in arrival order regardless of lane priority
+DATA_QUEUE_MAX_LANE_DELAY_SECONDS = float(os.environ.get('DATA_QUEUE_MAX_LANE_DELAY_SECONDS', 0.5))
+
+# --- Data Processing ---
+# The processing loop drains up to this many queued items and applies them under one lock.
+DATA_PROCESSING_MAX_BATCH_SIZE = int(os.environ.get('DATA_PROCESSING_MAX_BATCH_SIZE', 200))
+# Streams whose message fully replaces the previous one (or is only kept as the latest raw
+# payload), so only the last message of each in a batch needs to be applied.
+DATA_PROCESSING_COALESCE_STREAMS = {
+    "Heartbeat", "WeatherData", "LapCount", "TopThree", "TimingStats",
+    "PitLaneTimeCollection", "ChampionshipPrediction",
+}
+DATA_PROCESSING_METRICS_LOG_INTERVAL_SECONDS = 60
+# Smoothing factor for the running average batch latency
+DATA_PROCESSING_METRICS_EMA_ALPHA = 0.1
+# Display domains (app_state.STATE_DOMAINS) changed by every message of a stream. Lap history,
+# stints, race control and track status are bumped by their processors only on real changes.
+STATE_DOMAINS_BY_STREAM = {
+    "DriverList": ("timing", "drivers"),
+    "TimingData": ("timing",),
+    "TimingAppData": ("timing",),
+    "CarData": ("timing",),
+    "Position": ("positions",),
+    "WeatherData": ("weather",),
+    "TeamRadio": ("team_radio",),
+    "SessionInfo": ("session",),
+    "SessionData": ("session", "timing"),
+    "ExtrapolatedClock": ("session",),
+    "LapCount": ("session",),
+}
+# Minimum time between two published state snapshots (see state_snapshot.py); matches the fastest UI interval
+SNAPSHOT_PUBLISH_MIN_INTERVAL_SECONDS = float(os.environ.get('SNAPSHOT_PUBLISH_MIN_INTERVAL_SECONDS', 0.1))
+
+# --- Session Lifecycle ---
+# Browser sessions not accessed for this long are stopped and dropped (see session_lifecycle.py)
+SESSION_IDLE_TTL_SECONDS = int(os.environ.get('SESSION_IDLE_TTL_SECONDS', 30 * 60))
+# Estimated memory all sessions may hold before the reaper sheds some (0 disables)
+SESSION_MEMORY_BUDGET_MB = int(os.environ.get('SESSION_MEMORY_BUDGET_MB', 512))
+SESSION_SHED_ORDER = os.environ.get('SESSION_SHED_ORDER', 'lru')  # 'lru' or 'largest'
+SESSION_REAPER_INTERVAL_SECONDS = 60
+SESSION_EVICT_JOIN_TIMEOUT_SECONDS = 5.0
+# Never evict sessions that are recording or have auto-connect enabled
+SESSION_EVICT_KEEP_RECORDING = os.environ.get('SESSION_EVICT_KEEP_RECORDING', 'true').lower() == 'true'
+
+# --- Shared Live Hub ---
+# All browser sessions watching the live feed subscribe to one hub per key, so the
+# upstream SignalR connection and data processing run once per live source.
+LIVE_HUB_DEFAULT_KEY = os.environ.get('LIVE_HUB_DEFAULT_KEY', 'f1-live-timing')
+LIVE_HUB_STOP_JOIN_TIMEOUT_SECONDS = 5.0
+
+# --- Live Recording ---
+# Recordings are written by a background thread (see live_recorder.py)
+RECORDER_COMPRESSION = os.environ.get('RECORDER_COMPRESSION', 'gzip')  # 'gzip', 'zstd' (needs zstandard) or 'none'
+RECORDER_GZIP_LEVEL = 6
+RECORDER_ZSTD_LEVEL = 10
+# Messages buffered for the recorder thread before new ones are dropped
+RECORDER_BUFFER_MAX_MESSAGES = 100000
+RECORDER_BATCH_MAX_MESSAGES = 2000
+RECORDER_FLUSH_INTERVAL_SECONDS = 2.0
+RECORDER_FSYNC_INTERVAL_SECONDS = 30.0
+# Start a new part file after this many bytes on disk / seconds (0 disables)
+RECORDER_ROTATE_MAX_BYTES = int(os.environ.get('RECORDER_ROTATE_MAX_BYTES', 512 * 1024 * 1024))
+RECORDER_ROTATE_MAX_SECONDS = int(os.environ.get('RECORDER_ROTATE_MAX_SECONDS', 0))
+RECORDER_CLOSE_TIMEOUT_SECONDS = 10.0
+
+# --- Shared Replay Timelines ---
+# Decoded replay files kept in memory and shared by every session replaying them.
+REPLAY_TIMELINE_CACHE_MAX_FILES = int(os.environ.get('REPLAY_TIMELINE_CACHE_MAX_FILES', 3))
+
+# --- Binary Replay Container ---
+# Converted recordings (see replay_container.py) are preferred over the .data.txt they came from.
+REPLAY_CONTAINER_SUFFIX = ".f1r"
+REPLAY_CONTAINER_CHUNK_FRAMES = 256
+REPLAY_CONTAINER_COMPRESSION_LEVEL = 9
+
+# --- Replay Keyframes (Seek) ---
+# Processed-state snapshots taken every N seconds of feed time while walking a replay
+# timeline once; a seek restores the nearest one and fast-applies the frames after it.
+REPLAY_KEYFRAME_INTERVAL_SECONDS = float(os.environ.get('REPLAY_KEYFRAME_INTERVAL_SECONDS', 60))
+REPLAY_KEYFRAME_COMPRESSION_LEVEL = 1
+REPLAY_KEYFRAMES_PREBUILD = os.environ.get('REPLAY_KEYFRAMES_PREBUILD', 'true').lower() == 'true'
+# Max time a seek waits for the data processing thread to finish its in-flight item
+REPLAY_SEEK_DRAIN_TIMEOUT_SECONDS = 2.0
+
+# --- Server Push (SSE) ---
+# Browsers subscribe to an event stream (see push_stream.py) that sends domain version changes
+# and car position diffs when the processed state changes, replacing the fastest polling intervals.
+# Every open stream holds one WSGI worker thread, so keep the cap below the server's thread count.
+PUSH_STREAM_ENABLED = os.environ.get('PUSH_STREAM_ENABLED', 'true').lower() == 'true'
+PUSH_STREAM_ROUTE = "/push/stream"
+PUSH_STREAM_MAX_CONNECTIONS = int(os.environ.get('PUSH_STREAM_MAX_CONNECTIONS', 16))
+# How often a stream checks the published snapshot (in-process, no HTTP)
+PUSH_STREAM_CHECK_INTERVAL_SECONDS = 0.1
+PUSH_STREAM_KEEPALIVE_SECONDS = 15.0
+# Streams are closed after this long; EventSource reconnects on its own, which frees worker threads
+PUSH_STREAM_MAX_SECONDS = float(os.environ.get('PUSH_STREAM_MAX_SECONDS', 600))
+PUSH_STREAM_RETRY_MS = 3000
+
 
 # --- Content Area Definition ---
 # (CONTENT_STYLE_FULL_WIDTH, CONTENT_STYLE_WITH_SIDEBAR remain unchanged)
@@ -189,6 +354,14 @@ TIMING_TABLE_COLUMNS_CONFIG = [
     # The individual 'Interval' and 'Gap' columns have been removed.
 ]
 
+# --- Timing Table Updates ---
+# Send only changed cells/rows of the timing table (dash.Patch) once a browser holds a full table
+TIMING_TABLE_PATCH_ENABLED = os.environ.get('TIMING_TABLE_PATCH_ENABLED', 'true').lower() == 'true'
+# Above this fraction of changed cells a full table is sent instead
+TIMING_TABLE_PATCH_MAX_CHANGED_FRACTION = 0.5
+# Emitted row lists remembered per browser session (a few, for overlapping callbacks and tabs)
+TIMING_TABLE_EMISSIONS_KEPT = 4
+
 # --- UI Constants: Text & Messages ---
 # General
 APP_TITLE = "F1 Timing Dashboard"
@@ -272,6 +445,7 @@ REPLAY_STATUS_ERROR_FILE_NOT_FOUND = "Error - File Not Found"
 REPLAY_STATUS_ERROR_RUNTIME = "Error - Runtime"
 REPLAY_STATUS_CONNECTION_REPLAY_ENDED = "Disconnected (Replay Ended)"
 REPLAY_STATUS_CONNECTION_REPLAY_STOPPED = "Disconnected (Replay Stopped)"
+TEXT_REPLAY_SEEK_LAP_PLACEHOLDER = "Lap"
 
 # SignalR Client
 TEXT_SIGNALR_NEGOTIATION_TIMEOUT = "Negotiation timeout."
@@ -289,6 +463,7 @@ TEXT_SIGNALR_CONNECTED_SUBSCRIBED_STATUS = "Connected & Subscribed"
 TEXT_SIGNALR_DISCONNECTING_STATUS = "Disconnecting"
 TEXT_SIGNALR_DISCONNECTED_STATUS = "Disconnected"
 TEXT_SIGNALR_DISCONNECTED_THREAD_END_STATUS = "Disconnected / Thread End"
+TEXT_LIVE_HUB_ATTACHED_STATUS = "Attached to shared live feed"
 
 
 # Driver/Telemetry Display
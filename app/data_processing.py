@@ -10,13 +10,15 @@ import queue  # Needed for queue.Empty exception
 import threading  # For type hint if needed, and if starting threads from here
 from datetime import datetime, timezone
 from copy import deepcopy
-from typing import Dict, Any, List, Tuple  # For type hints
+from typing import Dict, Any, List, Tuple, Optional  # For type hints
 
 # Import shared state definition (for SessionState type hint) and config
 import app_state  # For app_state.SessionState
+import circuit_geometry
 import utils
 import config
 import replay
+import state_snapshot
 
 # Module-level logger
 logger = logging.getLogger("F1App.DataProcessing")
@@ -238,6 +240,7 @@ def _process_race_control(session_state: app_state.SessionState, data: Dict[str,
                 time_str = timestamp
         log_entry = f"[{time_str} L{lap_num_str}]: {message_text_from_feed}"
         session_state.race_control_log.appendleft(log_entry)
+        session_state.bump_domain_versions("race_control")
         new_messages_added_to_log += 1
 
         category = msg_dict.get('Category')
@@ -250,6 +253,7 @@ def _process_race_control(session_state: app_state.SessionState, data: Dict[str,
                     sector_int = int(sector_number)  # type: ignore
                     if sector_int not in session_state.active_yellow_sectors:
                         session_state.active_yellow_sectors.add(sector_int)
+                        session_state.bump_domain_versions("track_status")
                         logger.info(
                             f"Session {sess_id_log}: YELLOW: Sector {sector_int} added. Current: {session_state.active_yellow_sectors}")
                 except ValueError:
@@ -259,6 +263,7 @@ def _process_race_control(session_state: app_state.SessionState, data: Dict[str,
                     sector_int = int(sector_number)  # type: ignore
                     if sector_int in session_state.active_yellow_sectors:
                         session_state.active_yellow_sectors.discard(sector_int)
+                        session_state.bump_domain_versions("track_status")
                         logger.info(
                             f"Session {sess_id_log}: CLEAR: Sector {sector_int} removed. Current: {session_state.active_yellow_sectors}")
                 except ValueError:
@@ -268,6 +273,7 @@ def _process_race_control(session_state: app_state.SessionState, data: Dict[str,
                     logger.info(
                         f"Session {sess_id_log}: GREEN/TRACK CLEAR: Clearing all yellows. Was: {session_state.active_yellow_sectors}")
                     session_state.active_yellow_sectors.clear()
+                    session_state.bump_domain_versions("track_status")
 
 
 def _process_weather_data(session_state: app_state.SessionState, data: Dict[str, Any]):
@@ -410,6 +416,7 @@ def _update_driver_stint_data(session_state: app_state.SessionState, driver_rno_
             # logger.debug(f"Session {sess_id_log} StintUpdate: Added NEW Stint {stint_num_hist} for {driver_rno_str} (FK {stint_feed_key})")
     session_state.driver_stint_data[driver_rno_str] = sorted(
         driver_stints_history, key=lambda x: x['stint_number'])
+    session_state.bump_domain_versions("stints")
 
 
 def _process_timing_app_data(session_state: app_state.SessionState, data: Dict[str, Any]):
@@ -562,8 +569,9 @@ def _process_driver_list(session_state: app_state.SessionState, data: Dict[str,
 
         if is_new_driver:  # Initialize history lists for new drivers
             session_state.lap_time_history[driver_num_str] = []
-            session_state.telemetry_data[driver_num_str] = {}
+            session_state.telemetry_data.reset_car(driver_num_str)
             session_state.driver_stint_data[driver_num_str] = []
+            session_state.bump_domain_versions("lap_history", "stints")
         else:
             updated_count += 1  # Count as updated if not new
 
@@ -723,6 +731,7 @@ def _process_timing_data(session_state: app_state.SessionState, data: Dict[str,
                                 {'lap_number': lap_num_for_hist, 'lap_time_seconds': llt_s,
                                     'compound': compound, 'is_valid': is_valid_hist}
                             )
+                            session_state.bump_domain_versions("lap_history")
         # Post-loop update for overall best flags
         overall_best_lap_holder = session_state.session_bests["OverallBestLapTime"]["DriverNumber"]
         overall_best_sector_holders = [
@@ -760,6 +769,7 @@ def _process_track_status(session_state: app_state.SessionState, data: Dict[str,
     if session_state.track_status_data.get('Status') != new_status or session_state.track_status_data.get('Message') != new_message:
         session_state.track_status_data['Status'] = new_status
         session_state.track_status_data['Message'] = new_message
+        session_state.bump_domain_versions("track_status")
         logger.info(
             f"Session {sess_id_log}: Track Status Update: Status={new_status}, Message='{new_message}'")
 
@@ -918,7 +928,15 @@ def _process_session_info(session_state: app_state.SessionState, data: Dict[str,
         if reset_flags.get("clear_track_cache"):
             session_state.track_coordinates_cache = deepcopy(app_state.INITIAL_SESSION_TRACK_COORDINATES_CACHE)  # Use app_state for INITIAL
 
+        shared_geometry = None
         if fetch_thread_init_info:
+            fetch_session_key, fetch_year, fetch_circuit_key = fetch_thread_init_info["args_tuple"]
+            shared_geometry = circuit_geometry.peek_geometry(fetch_circuit_key, fetch_year)
+        if shared_geometry is not None:
+            # Already built by another session (or prewarmed): no fetch thread needed
+            session_state.track_coordinates_cache = circuit_geometry.session_cache(shared_geometry, fetch_session_key)
+            session_state._pending_background_fetch = None
+        elif fetch_thread_init_info:
             # Store for main loop to action
             session_state._pending_background_fetch = fetch_thread_init_info
         else:
@@ -989,6 +1007,174 @@ def _process_championship_prediction(session_state: app_state.SessionState, data
 # --- Main Processing Loop (Session-Aware) ---
 
 
+def apply_queue_item(session_state: app_state.SessionState, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Applies one {"stream", "data", "timestamp"} queue item to session_state.
+    Returns the background fetch the item asked for (if any) so the caller can start it
+    outside the lock with start_background_fetch.
+    """
+    sess_id_log = session_state.session_id[:8]
+    stream_name = item['stream']
+    actual_data = item['data']
+    timestamp = item.get('timestamp')
+
+    if timestamp:
+        msg_dt = utils.parse_iso_timestamp_safe(timestamp)
+        if msg_dt:
+            with session_state.lock:
+                session_state.current_processed_feed_timestamp_utc_dt = msg_dt
+
+    with session_state.lock:  # Main lock for processing a message
+        session_state.data_store[stream_name] = {
+            "data": actual_data, "timestamp": timestamp}
+        session_state._pending_background_fetch = None
+
+        try:
+            if stream_name == "Heartbeat":
+                session_state.app_status["last_heartbeat"] = timestamp
+            elif stream_name == "DriverList":
+                _process_driver_list(session_state, actual_data) # type: ignore
+            elif stream_name == "TimingData":
+                _process_timing_data(session_state, actual_data)  # type: ignore
+            elif stream_name == "SessionInfo":
+                _process_session_info(session_state, actual_data) # type: ignore
+            elif stream_name == "SessionData":
+                _process_session_data(session_state, actual_data)  # type: ignore
+            elif stream_name == "TimingAppData":
+                _process_timing_app_data(session_state, actual_data) # type: ignore
+            elif stream_name == "TrackStatus":
+                _process_track_status(session_state, actual_data)  # type: ignore
+            elif stream_name == "WeatherData":
+                _process_weather_data(session_state, actual_data) # type: ignore
+            elif stream_name == "RaceControlMessages":
+                _process_race_control(session_state, actual_data)  # type: ignore
+            elif stream_name == "TeamRadio":
+                _process_team_radio(session_state, actual_data) # type: ignore
+            elif stream_name == "ChampionshipPrediction":
+                    _process_championship_prediction(session_state, actual_data)
+            elif stream_name == "ExtrapolatedClock":
+                _process_extrapolated_clock(session_state, actual_data, timestamp)  # type: ignore
+            elif stream_name == "Position":
+                # Position data prep uses a snapshot, so get snapshot then call prepare
+                current_timing_state_snapshot_for_pos = {k: {'PositionData': v.get('PositionData', {}), 'PreviousPositionData': v.get('PreviousPositionData', {}) } 
+                                                         for k, v in session_state.timing_state.items()}
+                position_batch_updates = utils.prepare_position_data_updates(
+                    actual_data, current_timing_state_snapshot_for_pos)  # type: ignore
+                for car_n_str, updates in position_batch_updates.items():
+                    if car_n_str in session_state.timing_state:
+                        session_state.timing_state[car_n_str]['PreviousPositionData'] = updates['PreviousPositionData']
+                        session_state.timing_state[car_n_str]['PositionData'] = updates['PositionData']
+                _project_positions(session_state, position_batch_updates)
+            elif stream_name == "CarData":
+                current_timing_state_snapshot_for_car = {k: {'NumberOfLaps': v.get('NumberOfLaps', -1)}
+                                                         for k, v in session_state.timing_state.items()}
+                car_specific_updates, telemetry_updates = utils.prepare_car_data_updates(
+                    actual_data, current_timing_state_snapshot_for_car)  # type: ignore
+                for car_n_str, updates in car_specific_updates.items():
+                    if car_n_str in session_state.timing_state:
+                        if 'CarData' in updates:
+                            session_state.timing_state[car_n_str].setdefault(
+                                'CarData', {}).update(updates['CarData'])
+                for (car_n_str, lap_n), telem_upd in telemetry_updates.items():
+                    session_state.telemetry_data.extend(
+                        car_n_str, lap_n, telem_upd['Timestamps'], telem_upd)
+        except Exception as proc_ex:
+            logger.error(
+                f"Session {sess_id_log}: ERROR processing stream '{stream_name}': {proc_ex}", exc_info=True)
+
+        # Streams that feed a display domain wholesale; finer domains are bumped by the processors
+        stream_domains = config.STATE_DOMAINS_BY_STREAM.get(stream_name)
+        if stream_domains:
+            session_state.bump_domain_versions(*stream_domains)
+
+        pending_fetch_info = getattr(
+            session_state, '_pending_background_fetch', None)
+        session_state._pending_background_fetch = None
+    return pending_fetch_info
+
+
+def _project_positions(session_state: app_state.SessionState, position_batch_updates: Dict[str, Dict[str, Any]]):
+    """Projects the cars of a processed Position message onto the circuit, one pass per frame timestamp."""
+    track_geometry = session_state.track_coordinates_cache.get('track_geometry')
+    if track_geometry is None:
+        return
+    frames: Dict[Optional[str], List[Tuple[str, Dict[str, Any]]]] = {}
+    for car_n_str, updates in position_batch_updates.items():
+        position_data = updates['PositionData']
+        frames.setdefault(position_data.get('Timestamp'), []).append((car_n_str, position_data))
+    for timestamp_str, cars in frames.items():
+        session_state.track_positions.update(
+            track_geometry, [car_n_str for car_n_str, _ in cars],
+            [position_data.get('X') for _, position_data in cars],
+            [position_data.get('Y') for _, position_data in cars],
+            utils.convert_utc_str_to_epoch_ms(timestamp_str))
+
+
+def start_background_fetch(session_state: app_state.SessionState, pending_fetch_info: Dict[str, Any]):
+    """Starts the background track data fetch requested by a processed SessionInfo message."""
+    sess_id_log = session_state.session_id[:8]
+    logger.info(
+        f"Session {sess_id_log}: Initiating background track data fetch for {pending_fetch_info['args_tuple'][0]}.")
+    # The target function name is resolved to the actual function here
+    target_func = getattr(
+        utils, pending_fetch_info["target_func_name"], None)
+    if target_func:
+        # Add session_state to the arguments for the thread target
+        thread_args = pending_fetch_info["args_tuple"] + \
+            (session_state,)
+        fetch_thread = threading.Thread(target=target_func, args=thread_args, daemon=True,
+                                        name=f"TrackFetch_Sess_{sess_id_log}_{pending_fetch_info['args_tuple'][0]}")
+        fetch_thread.start()
+    else:
+        logger.error(
+            f"Session {sess_id_log}: Could not find target function '{pending_fetch_info['target_func_name']}' in utils for background fetch.")
+
+
+def _coalesce_batch(items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Drops items superseded by a later item of the same stream in the batch, for streams listed
+    in config.DATA_PROCESSING_COALESCE_STREAMS. The order of the remaining items is kept.
+    Returns (items to apply, number of items dropped).
+    """
+    last_index_by_stream: Dict[str, int] = {}
+    for idx, item in enumerate(items):
+        if item['stream'] in config.DATA_PROCESSING_COALESCE_STREAMS:
+            last_index_by_stream[item['stream']] = idx
+    if not last_index_by_stream:
+        return items, 0
+    kept = [item for idx, item in enumerate(items)
+            if last_index_by_stream.get(item['stream'], idx) == idx]
+    return kept, len(items) - len(kept)
+
+
+def apply_queue_batch(session_state: app_state.SessionState, items: List[Dict[str, Any]]) -> Tuple[Optional[Dict[str, Any]], int]:
+    """
+    Coalesces and applies a batch of queue items under a single lock acquisition.
+    Returns (last background fetch requested by the batch, number of items coalesced away).
+    """
+    items_to_apply, coalesced_count = _coalesce_batch(items)
+    pending_fetch_info = None
+    with session_state.lock:
+        for item in items_to_apply:
+            pending_fetch_info = apply_queue_item(session_state, item) or pending_fetch_info
+    return pending_fetch_info, coalesced_count
+
+
+def _record_batch_metrics(session_state: app_state.SessionState, batch_size: int, coalesced_count: int, batch_ms: float):
+    alpha = config.DATA_PROCESSING_METRICS_EMA_ALPHA
+    with session_state.lock:
+        metrics = session_state.processing_metrics
+        metrics["avg_batch_ms"] = batch_ms if metrics["batches"] == 0 else \
+            (1 - alpha) * metrics["avg_batch_ms"] + alpha * batch_ms
+        metrics["batches"] += 1
+        metrics["items"] += batch_size
+        metrics["coalesced"] += coalesced_count
+        metrics["last_batch_size"] = batch_size
+        metrics["max_batch_size"] = max(metrics["max_batch_size"], batch_size)
+        metrics["last_batch_ms"] = batch_ms
+        metrics["max_batch_ms"] = max(metrics["max_batch_ms"], batch_ms)
+
+
 def data_processing_loop_session(session_state: app_state.SessionState):
     sess_id_log = session_state.session_id[:8]
     logger.info(f"Data processing thread started for session: {sess_id_log}")
@@ -997,129 +1183,76 @@ def data_processing_loop_session(session_state: app_state.SessionState):
     last_log_time = time.monotonic()
 
     while not session_state.stop_event.is_set():
-        item = None
+        batch: List[Any] = []
         try:
-            item = session_state.data_queue.get(
-                block=True, timeout=0.1)  # Shorter timeout
-            processed_count += 1
-
-            if not isinstance(item, dict) or 'stream' not in item or 'data' not in item:
-                logger.warning(
-                    f"Session {sess_id_log}: Skipping queue item with unexpected structure: {type(item)}")
-                if hasattr(session_state.data_queue, 'task_done'):
-                    session_state.data_queue.task_done()
-                continue
+            batch.append(session_state.data_queue.get(
+                block=True, timeout=0.1))  # Shorter timeout
+        except queue.Empty:
+            # Publish changes held back by the snapshot interval once the feed goes quiet
+            state_snapshot.publish_if_due(session_state)
+            continue
 
-            stream_name = item['stream']
-            actual_data = item['data']
-            timestamp = item.get('timestamp')
+        # Drain whatever else is already queued so a burst costs one lock acquisition
+        while len(batch) < config.DATA_PROCESSING_MAX_BATCH_SIZE:
+            try:
+                batch.append(session_state.data_queue.get_nowait())
+            except queue.Empty:
+                break
 
-            if timestamp:
-                msg_dt = utils.parse_iso_timestamp_safe(timestamp)
-                if msg_dt:
-                    with session_state.lock:
-                        session_state.current_processed_feed_timestamp_utc_dt = msg_dt
+        try:
+            valid_items = []
+            for item in batch:
+                if not isinstance(item, dict) or 'stream' not in item or 'data' not in item:
+                    logger.warning(
+                        f"Session {sess_id_log}: Skipping queue item with unexpected structure: {type(item)}")
+                    continue
+                valid_items.append(item)
 
-            with session_state.lock:  # Main lock for processing a message
-                session_state.data_store[stream_name] = {
-                    "data": actual_data, "timestamp": timestamp}
-                session_state._pending_background_fetch = None
-
-                try:
-                    if stream_name == "Heartbeat":
-                        session_state.app_status["last_heartbeat"] = timestamp
-                    elif stream_name == "DriverList":
-                        _process_driver_list(session_state, actual_data) # type: ignore
-                    elif stream_name == "TimingData":
-                        _process_timing_data(session_state, actual_data)  # type: ignore
-                    elif stream_name == "SessionInfo":
-                        _process_session_info(session_state, actual_data) # type: ignore
-                    elif stream_name == "SessionData":
-                        _process_session_data(session_state, actual_data)  # type: ignore
-                    elif stream_name == "TimingAppData":
-                        _process_timing_app_data(session_state, actual_data) # type: ignore
-                    elif stream_name == "TrackStatus":
-                        _process_track_status(session_state, actual_data)  # type: ignore
-                    elif stream_name == "WeatherData":
-                        _process_weather_data(session_state, actual_data) # type: ignore
-                    elif stream_name == "RaceControlMessages":
-                        _process_race_control(session_state, actual_data)  # type: ignore
-                    elif stream_name == "TeamRadio":
-                        _process_team_radio(session_state, actual_data) # type: ignore
-                    elif stream_name == "ChampionshipPrediction":
-                            _process_championship_prediction(session_state, actual_data)
-                    elif stream_name == "ExtrapolatedClock":
-                        _process_extrapolated_clock(session_state, actual_data, timestamp)  # type: ignore
-                    elif stream_name == "Position":
-                        # Position data prep uses a snapshot, so get snapshot then call prepare
-                        current_timing_state_snapshot_for_pos = {k: {'PositionData': v.get('PositionData', {}), 'PreviousPositionData': v.get('PreviousPositionData', {}) } 
-                                                                 for k, v in session_state.timing_state.items()}
-                        position_batch_updates = utils.prepare_position_data_updates(
-                            actual_data, current_timing_state_snapshot_for_pos)  # type: ignore
-                        for car_n_str, updates in position_batch_updates.items():
-                            if car_n_str in session_state.timing_state:
-                                session_state.timing_state[car_n_str]['PreviousPositionData'] = updates['PreviousPositionData']
-                                session_state.timing_state[car_n_str]['PositionData'] = updates['PositionData']
-                    elif stream_name == "CarData":
-                        current_timing_state_snapshot_for_car = {k: {'NumberOfLaps': v.get('NumberOfLaps', -1)}
-                                                                 for k, v in session_state.timing_state.items()}
-                        car_specific_updates, telemetry_updates = utils.prepare_car_data_updates(
-                            actual_data, current_timing_state_snapshot_for_car)  # type: ignore
-                        for car_n_str, updates in car_specific_updates.items():
-                            if car_n_str in session_state.timing_state:
-                                if 'CarData' in updates:
-                                    session_state.timing_state[car_n_str].setdefault(
-                                        'CarData', {}).update(updates['CarData'])
-                        for (car_n_str, lap_n), telem_upd in telemetry_updates.items():
-                            session_state.telemetry_data.setdefault(car_n_str, {}).setdefault(
-                                lap_n, {'Timestamps': [], **{k_map: [] for k_map in config.CHANNEL_MAP.values()}})
-                            session_state.telemetry_data[car_n_str][lap_n]['Timestamps'].extend(
-                                telem_upd['Timestamps'])
-                            for ch_key_map in config.CHANNEL_MAP.values():
-                                session_state.telemetry_data[car_n_str][lap_n][ch_key_map].extend(
-                                    telem_upd[ch_key_map])
-                except Exception as proc_ex:
-                    logger.error(
-                        f"Session {sess_id_log}: ERROR processing stream '{stream_name}': {proc_ex}", exc_info=True)
-
-                pending_fetch_info = getattr(
-                    session_state, '_pending_background_fetch', None)
+            batch_start_time = time.perf_counter()
+            pending_fetch_info, coalesced_count = apply_queue_batch(session_state, valid_items)
+            _record_batch_metrics(session_state, len(batch), coalesced_count,
+                                  (time.perf_counter() - batch_start_time) * 1000)
+            processed_count += len(batch)
+            with session_state.lock:
+                session_state.snapshot_dirty = True
+            state_snapshot.publish_if_due(session_state)
 
             # Start background thread OUTSIDE the main lock
             if pending_fetch_info:
-                logger.info(
-                    f"Session {sess_id_log}: Initiating background track data fetch for {pending_fetch_info['args_tuple'][0]}.")
-                # The target function name is resolved to the actual function here
-                target_func = getattr(
-                    utils, pending_fetch_info["target_func_name"], None)
-                if target_func:
-                    # Add session_state to the arguments for the thread target
-                    thread_args = pending_fetch_info["args_tuple"] + \
-                        (session_state,)
-                    fetch_thread = threading.Thread(target=target_func, args=thread_args, daemon=True,
-                                                    name=f"TrackFetch_Sess_{sess_id_log}_{pending_fetch_info['args_tuple'][0]}")
-                    fetch_thread.start()
-                else:
-                    logger.error(
-                        f"Session {sess_id_log}: Could not find target function '{pending_fetch_info['target_func_name']}' in utils for background fetch.")
+                start_background_fetch(session_state, pending_fetch_info)
 
-                with session_state.lock:
-                    session_state._pending_background_fetch = None
-
-            if hasattr(session_state.data_queue, 'task_done'):
-                session_state.data_queue.task_done()
-
-        except queue.Empty:
-            continue
         except Exception as e:
             logger.error(
                 f"Session {sess_id_log}: Unhandled exception in data_processing_loop_session: {e}", exc_info=True)
-            if item is not None and hasattr(session_state.data_queue, 'task_done'):
+            time.sleep(0.1)
+        finally:
+            for _ in batch:
                 try:
                     session_state.data_queue.task_done()
                 except ValueError:
-                    pass 
-            time.sleep(0.1)
+                    pass
+
+        if time.monotonic() - last_log_time >= config.DATA_PROCESSING_METRICS_LOG_INTERVAL_SECONDS:
+            with session_state.lock:
+                metrics = dict(session_state.processing_metrics)
+                decode_stage = session_state.decode_stage
+            logger.debug(
+                f"Session {sess_id_log}: Processed {processed_count} items. Batches: {metrics['batches']}, "
+                f"last size {metrics['last_batch_size']} (max {metrics['max_batch_size']}), "
+                f"avg {metrics['avg_batch_ms']:.2f}ms (max {metrics['max_batch_ms']:.2f}ms), coalesced {metrics['coalesced']}.")
+            lane_summary = ", ".join(
+                f"{lane} {stats['depth']} (max {stats['max_depth']}, dropped {stats['dropped']}, overflow {stats['overflow']})"
+                for lane, stats in session_state.data_queue.lane_stats().items())
+            logger.debug(f"Session {sess_id_log}: Queue lanes: {lane_summary}.")
+            if decode_stage is not None:
+                decode_metrics = decode_stage.metrics_snapshot()
+                logger.debug(
+                    f"Session {sess_id_log}: Decoded {decode_metrics['decoded']} payloads "
+                    f"(failed {decode_metrics['failed']}, dropped {decode_metrics['dropped']}, "
+                    f"pending {decode_metrics['pending']}). Decode avg {decode_metrics['avg_decode_ms']:.2f}ms "
+                    f"(max {decode_metrics['max_decode_ms']:.2f}ms), latency avg {decode_metrics['avg_latency_ms']:.2f}ms "
+                    f"(max {decode_metrics['max_latency_ms']:.2f}ms).")
+            last_log_time = time.monotonic()
 
     logger.info(
         f"Data processing thread for session {sess_id_log} finished. Stop_event: {session_state.stop_event.is_set()}")
@@ -0,0 +1,102 @@
+# downsample.py
+"""
+Shape-preserving downsampling of chart traces to a point budget.
+
+Each function returns the sorted indices of the samples to keep, so the same selection
+can be applied to x, y and any other per-sample array:
+
+  * lttb_indices: Largest-Triangle-Three-Buckets, for continuous channels (speed,
+    throttle, RPM, time delta). Keeps the visual shape of peaks and troughs.
+  * minmax_indices: the minimum and maximum of every x bucket (one bucket per pixel
+    column), fully vectorised. Keeps every extreme; used when LTTB would be too slow.
+  * step_indices: the change points of a step signal (gear, DRS, brake) drawn with
+    line shape 'hv', which is exact; falls back to minmax_indices over budget.
+
+x must be sorted ascending (e.g. lap distance).
+"""
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+logger = logging.getLogger("F1App.Downsample")
+
+# Above this many samples LTTB's per-bucket loop is replaced by the vectorised min/max
+LTTB_MAX_INPUT_SAMPLES = 200_000
+
+
+def _all_indices(count: int) -> 'np.ndarray':
+    return np.arange(count, dtype=np.intp)
+
+
+def lttb_indices(x: 'np.ndarray', y: 'np.ndarray', max_points: int) -> 'np.ndarray':
+    """Indices of at most max_points samples chosen by Largest-Triangle-Three-Buckets."""
+    count = len(x)
+    if max_points >= count or max_points < 3:
+        return _all_indices(count)
+    if count > LTTB_MAX_INPUT_SAMPLES:
+        return minmax_indices(x, y, max_points // 2)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # Buckets 0..max_points-3 split samples 1..count-2; first and last samples are always kept
+    edges = (np.arange(max_points - 1) * (count - 2) / (max_points - 2)).astype(np.intp) + 1
+    edges[-1] = count - 1
+    # Mean point of every bucket (and of the last sample, as the bucket after the final one)
+    x_sums = np.add.reduceat(x[1:count - 1], edges[:-1] - 1)
+    y_sums = np.add.reduceat(y[1:count - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    mean_x = np.append(x_sums / sizes, x[-1])
+    mean_y = np.append(y_sums / sizes, y[-1])
+
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x, next_y = mean_x[bucket + 1], mean_y[bucket + 1]
+        # Twice the triangle area (previous kept point, candidate, next bucket's mean)
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(x: 'np.ndarray', y: 'np.ndarray', buckets: int) -> 'np.ndarray':
+    """Indices of the first, last, and minimum and maximum sample of each of `buckets` equal x ranges."""
+    count = len(x)
+    if buckets <= 0 or 2 * buckets + 2 >= count:
+        return _all_indices(count)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    span = x[-1] - x[0]
+    if not span > 0:
+        return _all_indices(count)
+    bucket_of = np.clip(((x - x[0]) / span * buckets).astype(np.intp), 0, buckets - 1)
+    valid = ~np.isnan(y)
+    candidates = np.flatnonzero(valid)
+    # Sort valid samples by (bucket, y): each bucket's run starts at its min and ends at its max
+    order = candidates[np.lexsort((y[candidates], bucket_of[candidates]))]
+    run_starts = np.flatnonzero(np.diff(bucket_of[order], prepend=-1))
+    run_ends = np.append(run_starts[1:], len(order)) - 1
+    keep = np.concatenate((order[run_starts], order[run_ends], [0, count - 1]))
+    return np.unique(keep)
+
+
+def step_indices(y: 'np.ndarray', max_points: int, x: 'np.ndarray' = None) -> 'np.ndarray':
+    """Indices where a step signal changes value (plus first and last), exact for line shape 'hv'."""
+    count = len(y)
+    if max_points <= 0 or count <= max_points:
+        return _all_indices(count)
+    y = np.asarray(y)
+    changes = np.flatnonzero(y[1:] != y[:-1]) + 1
+    keep = np.unique(np.concatenate(([0], changes, [count - 1])))
+    if len(keep) > max_points and x is not None:
+        return minmax_indices(x, y, max_points // 2)
+    return keep
+
+
+print("DEBUG: downsample module loaded")
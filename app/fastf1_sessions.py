@@ -0,0 +1,153 @@
+# fastf1_sessions.py
+"""
+Process-wide cache of loaded fastf1 Session objects for the Historical Analysis page.
+
+Loading a session (fastf1.get_session(...).load(...)) takes seconds even with the
+fastf1 HTTP cache, and a telemetry-enabled load far longer. Every Load and every
+"Compare Laps" click used to do it again. Sessions are now loaded once per
+(year, event, session) and shared by all users:
+
+  * concurrent requests for the same session and load flags wait for one load (per-key lock),
+  * a session cached for laps only is upgraded to telemetry when telemetry is first asked
+    for: a telemetry-enabled Session is loaded and replaces the laps-only entry, and from
+    then on serves laps-only requests too (a telemetry load includes the laps),
+  * load() is never re-run on a cached Session object, so the laps frame readers (and
+    laps_registry datasets) already hold from the laps-only session stays valid,
+  * entries are evicted least recently used first once their estimated memory
+    exceeds HISTORICAL_SESSION_CACHE_MB (the entry just requested is always kept).
+
+Loaded sessions are treated as read-only by their users.
+"""
+import logging
+import threading
+import collections
+from typing import Any, Dict, Tuple
+
+import fastf1
+
+import config
+
+logger = logging.getLogger("F1App.FastF1Sessions")
+
+# (year, event, session, telemetry loaded)
+SessionKey = Tuple[int, str, str, bool]
+
+
+class _CachedSession:
+    __slots__ = ("session", "bytes")
+
+    def __init__(self, session: Any):
+        self.session = session
+        self.bytes = 0
+
+
+_LOCK = threading.Lock()
+_SESSIONS: 'collections.OrderedDict[SessionKey, _CachedSession]' = collections.OrderedDict()
+_LOAD_LOCKS: Dict[SessionKey, threading.Lock] = {}
+
+
+def _frame_bytes(frame: Any) -> int:
+    try:
+        return int(frame.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+def _estimate_bytes(session: Any, telemetry: bool) -> int:
+    """Approximate memory of a loaded session: laps and results, plus car and position data if loaded."""
+    total = 0
+    for attribute in ("laps", "results"):
+        try:
+            total += _frame_bytes(getattr(session, attribute))
+        except Exception:  # fastf1 raises DataNotLoadedError for data that was not loaded
+            pass
+    if telemetry:
+        for attribute in ("car_data", "pos_data"):
+            try:
+                total += sum(_frame_bytes(frame) for frame in getattr(session, attribute).values())
+            except Exception:
+                pass
+    return total
+
+
+def _evict_over_budget(keep: SessionKey):
+    """Drops least recently used sessions until the cache fits its budget. Hold _LOCK."""
+    budget_bytes = config.HISTORICAL_SESSION_CACHE_MB * 1024 * 1024
+    total_bytes = sum(entry.bytes for entry in _SESSIONS.values())
+    for key in list(_SESSIONS):
+        if total_bytes <= budget_bytes:
+            break
+        if key == keep:
+            continue
+        total_bytes -= _SESSIONS.pop(key).bytes
+        logger.info(f"Evicted historical session {key} from the session cache "
+                    f"({total_bytes / 1e6:.0f}/{budget_bytes / 1e6:.0f} MB).")
+
+
+def _cached(keys: Tuple[SessionKey, ...]) -> Any:
+    """The session of the first of keys that is cached, marked as recently used, or None. Hold _LOCK."""
+    for key in keys:
+        entry = _SESSIONS.get(key)
+        if entry is not None:
+            _SESSIONS.move_to_end(key)
+            return entry.session
+    return None
+
+
+def get_session(year: int, event_name: str, session_identifier: str, telemetry: bool = False) -> Any:
+    """
+    A loaded fastf1 Session (laps and results; car and position telemetry if telemetry is
+    set), from the cache or loaded now. Load errors propagate and nothing is cached.
+    """
+    session_id = (int(year), str(event_name), str(session_identifier))
+    key: SessionKey = session_id + (bool(telemetry),)
+    laps_key: SessionKey = session_id + (False,)
+    telemetry_key: SessionKey = session_id + (True,)
+    # A telemetry entry also satisfies a laps-only request
+    acceptable_keys = (telemetry_key,) if telemetry else (laps_key, telemetry_key)
+    with _LOCK:
+        session = _cached(acceptable_keys)
+        if session is not None:
+            return session
+        load_lock = _LOAD_LOCKS.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _LOCK:
+            session = _cached(acceptable_keys)  # Loaded while we waited
+        if session is not None:
+            return session
+
+        logger.info(f"Loading historical session {session_id} (telemetry={telemetry})...")
+        session = fastf1.get_session(*session_id)
+        session.load(laps=True, telemetry=telemetry, weather=False, messages=False)
+        entry = _CachedSession(session)
+        entry.bytes = _estimate_bytes(session, telemetry)
+
+        with _LOCK:
+            if not telemetry and telemetry_key in _SESSIONS:  # Upgraded while we loaded
+                _SESSIONS.move_to_end(telemetry_key)
+                return _SESSIONS[telemetry_key].session
+            _SESSIONS[key] = entry
+            _SESSIONS.move_to_end(key)
+            if telemetry and _SESSIONS.pop(laps_key, None) is not None:
+                logger.info(f"Upgraded historical session {session_id} to telemetry; dropped its laps-only entry.")
+            _evict_over_budget(keep=key)
+        logger.info(f"Cached historical session {session_id} (~{entry.bytes / 1e6:.0f} MB, telemetry={telemetry}).")
+        return session
+
+
+def cache_info() -> Dict[str, Any]:
+    """Cached sessions with their estimated size, least recently used first."""
+    with _LOCK:
+        entries = [{"session": list(key[:3]), "telemetry": key[3], "mb": round(entry.bytes / 1e6, 1)}
+                   for key, entry in _SESSIONS.items()]
+    return {"sessions": entries, "total_mb": round(sum(entry["mb"] for entry in entries), 1),
+            "budget_mb": config.HISTORICAL_SESSION_CACHE_MB}
+
+
+def clear():
+    with _LOCK:
+        _SESSIONS.clear()
+
+
+print("DEBUG: fastf1_sessions module loaded")
@@ -0,0 +1,169 @@
+# headless_replay.py
+"""
+Unpaced, headless replay: pushes a recording straight through the data processors as
+fast as the CPU allows, without Dash, threads or the data queue. Used for regression
+checks (compare the final-state summary against a saved one) and for measuring
+processing throughput.
+
+Usage:
+    python headless_replay.py replays/Miami_Grand_Prix_Race_20250504_211828.data.txt
+    python headless_replay.py replays/Race.data.txt --summary-out race_summary.json
+    python headless_replay.py replays/Race.data.txt --compare race_summary.json
+"""
+import logging
+import json
+import time
+import collections
+from pathlib import Path
+from typing import Any, Optional, Dict
+
+import app_state
+import config
+import data_processing
+import replay_timeline
+
+logger = logging.getLogger("F1App.HeadlessReplay")
+
+
+def create_headless_state(name: str) -> app_state.SessionState:
+    """A SessionState that is not registered in SESSIONS_STORE and processes as a replay."""
+    state = app_state.SessionState(name)
+    with state.lock:
+        # Processors branch on the app mode (e.g. replay timer anchoring)
+        state.app_status.update({"state": "Replaying", "current_replay_file": name})
+    return state
+
+
+class HeadlessReplayResult:
+    def __init__(self, state: app_state.SessionState, filepath: Path):
+        self.state = state
+        self.filepath = filepath
+        self.frames: int = 0
+        self.messages: int = 0
+        self.load_seconds: float = 0.0
+        self.process_seconds: float = 0.0
+        self.stream_counts: Dict[str, int] = collections.Counter()
+        self.stream_seconds: Dict[str, float] = collections.defaultdict(float)
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.messages / self.process_seconds if self.process_seconds > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "file": self.filepath.name,
+            "frames": self.frames,
+            "messages": self.messages,
+            "load_seconds": round(self.load_seconds, 3),
+            "process_seconds": round(self.process_seconds, 3),
+            "messages_per_second": round(self.messages_per_second, 1),
+            "telemetry": self.state.telemetry_data.memory_footprint(),
+            "streams": {
+                stream: {"messages": count, "seconds": round(self.stream_seconds[stream], 3)}
+                for stream, count in self.stream_counts.most_common()
+            },
+        }
+
+
+def run_headless_replay(filepath: Path, session_state: Optional[app_state.SessionState] = None,
+                        max_frames: Optional[int] = None) -> HeadlessReplayResult:
+    """
+    Applies every frame of a replay file to session_state (a fresh headless state by default)
+    with no pacing. Background track fetches requested by SessionInfo are not started.
+    Returns the final state together with throughput statistics.
+    """
+    state = session_state or create_headless_state(f"headless_{filepath.name}")
+    result = HeadlessReplayResult(state, filepath)
+
+    load_start = time.perf_counter()
+    timeline = replay_timeline.get_timeline(filepath)
+    if timeline is None:
+        raise RuntimeError(f"Could not decode replay timeline for {filepath}")
+    result.load_seconds = time.perf_counter() - load_start
+
+    frames = timeline.frames if max_frames is None else timeline.frames[:max_frames]
+    stream_counts = result.stream_counts
+    stream_seconds = result.stream_seconds
+    perf_counter = time.perf_counter
+    process_start = perf_counter()
+    with state.lock:
+        for frame in frames:
+            for item in frame.items:
+                item_start = perf_counter()
+                data_processing.apply_queue_item(state, item)
+                stream_name = item["stream"]
+                stream_seconds[stream_name] += perf_counter() - item_start
+                stream_counts[stream_name] += 1
+            state.replay_cursor += 1
+    result.process_seconds = perf_counter() - process_start
+    result.frames = len(frames)
+    result.messages = sum(stream_counts.values())
+    logger.info(
+        f"Headless replay {filepath.name}: {result.messages} messages in {result.process_seconds:.2f}s "
+        f"({result.messages_per_second:,.0f} msg/s), decode {result.load_seconds:.2f}s.")
+    return result
+
+
+def summarize_state(state: app_state.SessionState) -> Dict[str, Any]:
+    """Deterministic, JSON-serialisable digest of the processed state for regression comparisons."""
+    with state.lock:
+        drivers = {}
+        for car_num, driver_state in sorted(state.timing_state.items(), key=lambda kv: kv[0]):
+            drivers[car_num] = {
+                "Tla": driver_state.get("Tla"),
+                "Position": driver_state.get("Position"),
+                "NumberOfLaps": driver_state.get("NumberOfLaps"),
+                "BestLapTime": (driver_state.get("BestLapTime") or {}).get("Value"),
+                "LastLapTime": (driver_state.get("LastLapTime") or {}).get("Value"),
+                "Stints": len(state.driver_stint_data.get(car_num, [])),
+                "LapHistory": len(state.lap_time_history.get(car_num, [])),
+                "TelemetryLaps": len(state.telemetry_data.laps(car_num)),
+            }
+        return {
+            "session_key": state.session_details.get("SessionKey"),
+            "session_type": state.session_details.get("Type"),
+            "session_status": state.session_details.get("SessionStatus"),
+            "track_status": state.track_status_data.get("Status"),
+            "last_feed_timestamp": state.current_processed_feed_timestamp_utc_dt.isoformat()
+            if state.current_processed_feed_timestamp_utc_dt else None,
+            "session_bests": json.loads(json.dumps(state.session_bests, default=str)),
+            "race_control_messages": len(state.race_control_log),
+            "team_radio_messages": len(state.team_radio_messages),
+            "drivers": drivers,
+        }
+
+
+def _diff_summaries(expected: Any, actual: Any, path: str = "") -> list:
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        diffs = []
+        for key in sorted(set(expected) | set(actual)):
+            diffs.extend(_diff_summaries(expected.get(key), actual.get(key), f"{path}/{key}"))
+        return diffs
+    return [] if expected == actual else [f"{path or '/'}: expected {expected!r}, got {actual!r}"]
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Process a replay recording unpaced, without the dashboard.")
+    parser.add_argument("file", type=Path, help="Replay recording (.data.txt or container)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Only process the first N frames")
+    parser.add_argument("--summary-out", type=Path, default=None, help="Write the final-state summary as JSON")
+    parser.add_argument("--compare", type=Path, default=None, help="Compare the final-state summary with a saved one")
+    parser.add_argument("--verbose", action="store_true", help="Log processor output at INFO level")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if cli_args.verbose else logging.WARNING,
+                        format=config.LOG_FORMAT_DEFAULT)
+    replay_result = run_headless_replay(cli_args.file, max_frames=cli_args.max_frames)
+    print(json.dumps(replay_result.stats(), indent=2))
+
+    final_summary = summarize_state(replay_result.state)
+    if cli_args.summary_out:
+        cli_args.summary_out.write_text(json.dumps(final_summary, indent=2, sort_keys=True))
+    if cli_args.compare:
+        differences = _diff_summaries(json.loads(cli_args.compare.read_text()), final_summary)
+        for difference in differences:
+            print(f"MISMATCH {difference}")
+        print(f"{len(differences)} difference(s) against {cli_args.compare.name}")
+        sys.exit(1 if differences else 0)
@@ -29,7 +29,7 @@ def create_historical_layout():
     )
 
     display_area = html.Div([
-        dcc.Store(id='historical-laps-data-store'), # To hold the main laps DataFrame
+        dcc.Store(id='historical-laps-data-store'), # Handle of the laps dataset held server-side (laps_registry.py)
         dcc.Store(id='historical-telemetry-data-store'), # <-- ADD THIS LINE
          dbc.Spinner(
             html.Div(id='historical-charts-display-area'), # The content will be rendered here
@@ -0,0 +1,171 @@
+# historical_analytics.py
+"""
+Derived views of a historical session's laps, computed once when the session is loaded.
+
+The Historical Analysis tabs used to rebuild their views from the raw laps on every
+interaction: a boolean scan per driver for the position chart, a scan, an IQR filter and
+a polyfit per stint selection, and an iterrows() per lap dropdown. build_analytics() now
+does all of it in one grouped pass over the laps frame, and the tabs look the results up:
+
+  * position_traces: per driver (in legend order) lap numbers and positions,
+  * stints: per driver and stint the IQR-filtered (tyre life, lap time) points and the
+    linear degradation fit (closed-form least squares from grouped sums),
+  * lap_options: per driver the lap dropdown options,
+  * fastest_laps / session_fastest: each driver's and the session's fastest lap.
+
+laps_registry builds the analytics of a dataset when it is registered.
+"""
+import logging
+from typing import Any, Optional, List, Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("F1App.HistoricalAnalytics")
+
+_STINT_KEYS = ['Driver', 'Stint']
+
+
+def format_lap_time(total_seconds: float) -> str:
+    minutes, seconds = divmod(total_seconds, 60)
+    return f"{int(minutes)}:{seconds:06.3f}"
+
+
+def _nullable_list(values: np.ndarray) -> List[Any]:
+    """Floats as a list with None for NaN (gaps in plotly traces)."""
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def _text(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) else None
+
+
+def _column(laps: pd.DataFrame, name: str, numeric: bool = False) -> pd.Series:
+    if name not in laps.columns:
+        return pd.Series(np.nan if numeric else None, index=laps.index)
+    column = laps[name]
+    return pd.to_numeric(column, errors='coerce') if numeric else column
+
+
+class HistoricalAnalytics:
+    """Lookup tables of one session's laps. Treat as read-only."""
+    __slots__ = ("position_traces", "stints", "lap_options", "fastest_laps", "session_fastest")
+
+    def __init__(self):
+        self.position_traces: List[Dict[str, Any]] = []
+        self.stints: Dict[str, Dict[float, Dict[str, Any]]] = {}
+        self.lap_options: Dict[str, List[Dict[str, Any]]] = {}
+        self.fastest_laps: Dict[str, Dict[str, Any]] = {}
+        self.session_fastest: Optional[Dict[str, Any]] = None
+
+    def stint_options(self, driver: str) -> List[Dict[str, Any]]:
+        return [{'label': f'Stint {int(stint)}', 'value': stint} for stint in self.stints.get(driver, {})]
+
+    def stint(self, driver: str, stint: Any) -> Optional[Dict[str, Any]]:
+        try:
+            return self.stints.get(driver, {}).get(float(stint))
+        except (TypeError, ValueError):
+            return None
+
+
+def build_analytics(laps: pd.DataFrame) -> HistoricalAnalytics:
+    """All derived views of a laps frame (fastf1 Laps or any frame with its columns)."""
+    analytics = HistoricalAnalytics()
+    if laps is None or laps.empty or 'Driver' not in laps.columns:
+        return analytics
+
+    frame = pd.DataFrame({
+        'Driver': laps['Driver'],
+        'Team': _column(laps, 'Team'),
+        'Compound': _column(laps, 'Compound'),
+        'LapNumber': _column(laps, 'LapNumber', numeric=True),
+        'Position': _column(laps, 'Position', numeric=True),
+        'Stint': _column(laps, 'Stint', numeric=True),
+        'TyreLife': _column(laps, 'TyreLife', numeric=True),
+        'LapSeconds': pd.to_timedelta(_column(laps, 'LapTime'), errors='coerce').dt.total_seconds(),
+    }).reset_index(drop=True)
+    frame = frame[frame['Driver'].notna()]
+
+    _build_position_traces(analytics, frame)
+    _build_stints(analytics, frame)
+    _build_lap_options(analytics, frame)
+    return analytics
+
+
+def _build_position_traces(analytics: HistoricalAnalytics, frame: pd.DataFrame):
+    # Legend order: drivers by the best position they held, as the chart always listed them
+    driver_order = frame.sort_values(by='Position', kind='stable')['Driver'].unique()
+    rows_by_driver = frame.groupby('Driver', sort=False).indices
+    lap_numbers = frame['LapNumber'].to_numpy(dtype=float)
+    positions = frame['Position'].to_numpy(dtype=float)
+    teams = frame['Team'].to_numpy()
+    for driver in driver_order:
+        rows = rows_by_driver[driver]
+        analytics.position_traces.append({
+            'driver': driver,
+            'team': _text(teams[rows[0]]),
+            'laps': _nullable_list(lap_numbers[rows]),
+            'positions': _nullable_list(positions[rows]),
+        })
+
+
+def _build_stints(analytics: HistoricalAnalytics, frame: pd.DataFrame):
+    stinted = frame[frame['Stint'].notna()]
+    if stinted.empty:
+        return
+    grouped = stinted.groupby(_STINT_KEYS, sort=True)
+    quartiles = grouped['LapSeconds'].quantile([0.25, 0.75]).unstack()
+    quartiles.columns = ['Q1', 'Q3']
+    stinted = stinted.join(quartiles, on=_STINT_KEYS)
+    iqr = stinted['Q3'] - stinted['Q1']
+    outlier = (stinted['LapSeconds'] < stinted['Q1'] - 1.5 * iqr) | (stinted['LapSeconds'] > stinted['Q3'] + 1.5 * iqr)
+    points = stinted[~outlier].dropna(subset=['TyreLife', 'LapSeconds'])
+
+    # Least-squares line per stint from grouped sums: slope = (n*Sxy - Sx*Sy) / (n*Sxx - Sx^2)
+    sums = points.assign(XY=points['TyreLife'] * points['LapSeconds'], XX=points['TyreLife'] ** 2) \
+        .groupby(_STINT_KEYS)[['TyreLife', 'LapSeconds', 'XY', 'XX']].sum()
+    counts = points.groupby(_STINT_KEYS).size()
+    denominator = counts * sums['XX'] - sums['TyreLife'] ** 2
+    slopes = (counts * sums['XY'] - sums['TyreLife'] * sums['LapSeconds']) / denominator.where(denominator != 0)
+    intercepts = (sums['LapSeconds'] - slopes * sums['TyreLife']) / counts
+
+    first_rows = grouped[['Team', 'Compound']].first()
+    point_rows = points.groupby(_STINT_KEYS, sort=False).indices
+    tyre_life = points['TyreLife'].to_numpy(dtype=float)
+    lap_seconds = points['LapSeconds'].to_numpy(dtype=float)
+    for (driver, stint), meta in first_rows.iterrows():
+        rows = point_rows.get((driver, stint), np.array([], dtype=int))
+        summary = {
+            'driver': driver, 'stint': float(stint), 'team': _text(meta['Team']), 'compound': _text(meta['Compound']),
+            'tyre_life': tyre_life[rows].tolist(), 'lap_seconds': lap_seconds[rows].tolist(),
+            'slope': None, 'intercept': None,
+        }
+        slope = slopes.get((driver, stint))
+        if slope is not None and not np.isnan(slope):
+            summary['slope'] = float(slope)
+            summary['intercept'] = float(intercepts[(driver, stint)])
+        analytics.stints.setdefault(driver, {})[float(stint)] = summary
+
+
+def _build_lap_options(analytics: HistoricalAnalytics, frame: pd.DataFrame):
+    timed = frame[frame['LapSeconds'].notna() & frame['LapNumber'].notna()] \
+        .sort_values(by=['Driver', 'LapNumber'], kind='stable')
+    if timed.empty:
+        return
+    fastest_rows = set(timed.groupby('Driver')['LapSeconds'].idxmin())
+    for driver, driver_laps in timed.groupby('Driver', sort=False):
+        options = []
+        for row, lap_number, lap_seconds, compound in zip(driver_laps.index, driver_laps['LapNumber'],
+                                                          driver_laps['LapSeconds'], driver_laps['Compound']):
+            label = f"Lap {int(lap_number)} ({format_lap_time(lap_seconds)})"
+            if row in fastest_rows:
+                label += " - fastest"
+                analytics.fastest_laps[driver] = {'driver': driver, 'lap': int(lap_number),
+                                                  'lap_seconds': float(lap_seconds), 'compound': _text(compound)}
+            options.append({'label': label, 'value': int(lap_number)})
+        analytics.lap_options[driver] = options
+    if analytics.fastest_laps:
+        analytics.session_fastest = min(analytics.fastest_laps.values(), key=lambda lap: lap['lap_seconds'])
+
+
+print("DEBUG: historical_analytics module loaded")
@@ -8,6 +8,7 @@ import fastf1
 import pandas as pd
 
 import app_state
+import fastf1_sessions
 import utils
 
 logger = logging.getLogger(__name__)
@@ -26,9 +27,8 @@ def load_and_transform_historical_session(session_state: app_state.SessionState,
         # Reset the session state to ensure no old data remains
         session_state.reset_state_variables()
 
-        # Load the session data from fastf1. This is the main network call.
-        session = fastf1.get_session(year, event_name, session_identifier)
-        session.load(laps=True, telemetry=False, weather=False, messages=False) # Laps are essential
+        # Load the session data from fastf1 (or the shared session cache). Laps are essential
+        session = fastf1_sessions.get_session(year, event_name, session_identifier)
 
         # --- Transform and Populate session_state.session_details ---
         with session_state.lock:
@@ -97,8 +97,7 @@ def load_historical_laps(year: int, event_name: str, session_identifier: str) ->
     try:
         logger.info(f"Loading historical lap data for {year} {event_name} - {session_identifier}...")
         
-        session = fastf1.get_session(year, event_name, session_identifier)
-        session.load(laps=True, telemetry=False, weather=False, messages=False)
+        session = fastf1_sessions.get_session(year, event_name, session_identifier)
         
         # Return the laps DataFrame, which contains all the data we need
         return session.laps
@@ -117,9 +116,9 @@ def load_historical_telemetry(year: int, event_name: str, session_identifier: st
     try:
         logger.info(f"Loading historical TELEMETRY for {year} {event_name} - {session_identifier}...")
         
-        session = fastf1.get_session(year, event_name, session_identifier)
-        # We need laps to get telemetry, and telemetry=True to load the actual data
-        session.load(laps=True, telemetry=True, weather=False, messages=False)
+        # We need laps to get telemetry, and telemetry=True to load the actual data.
+        # Replaces a cached laps-only session; laps already handed out from it stay valid.
+        session = fastf1_sessions.get_session(year, event_name, session_identifier, telemetry=True)
         
         return session
 
@@ -0,0 +1,174 @@
+# lane_queue.py
+"""
+Bounded, multi-lane priority queue used as SessionState.data_queue.
+
+Every stream is routed to a lane (config.DATA_QUEUE_LANES). get() always serves the
+lane with the lowest priority number first and is FIFO within a lane, so a burst of
+CarData/Position frames no longer delays session, race control and timing messages
+queued behind it. To keep the feed's order meaningful (CarData is attributed to the lap
+TimingData reports), an item that has waited max_lane_delay seconds is served ahead of
+higher-priority lanes, oldest first, so overtaking is bounded in time.
+
+Each lane has a capacity and an overflow policy:
+    drop_oldest   the oldest queued item of the lane is discarded to make room
+                  (for streams where the newest frame supersedes older ones)
+    drop_newest   put() raises queue.Full and the caller discards the new item
+    never_drop    the item is accepted anyway; the lane counts it as an overflow
+
+Provides the subset of the queue.Queue API the app uses (put/get/get_nowait/empty/
+qsize/task_done/join/unfinished_tasks) plus clear() and lane_stats().
+"""
+import logging
+import time
+import queue
+import threading
+import itertools
+import collections
+from typing import Any, Optional, List, Dict, Deque
+
+logger = logging.getLogger("F1App.LaneQueue")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+NEVER_DROP = "never_drop"
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, NEVER_DROP)
+
+
+class _Lane:
+    __slots__ = ("name", "priority", "capacity", "policy", "items", "put_count", "dropped", "overflow", "max_depth")
+
+    def __init__(self, name: str, priority: int, capacity: int, policy: str):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}' for lane '{name}'")
+        self.name = name
+        self.priority = priority
+        self.capacity = capacity
+        self.policy = policy
+        self.items: Deque[Any] = collections.deque()
+        self.put_count = 0
+        self.dropped = 0
+        self.overflow = 0
+        self.max_depth = 0
+
+
+class LaneQueue:
+    def __init__(self, lanes: Dict[str, Dict[str, Any]], default_lane: str, max_lane_delay: float):
+        """lanes: {lane_name: {"priority", "capacity", "policy", "streams"}}; unlisted streams go to default_lane."""
+        self.max_lane_delay = max_lane_delay
+        self._sequence = itertools.count()
+        self._lanes: List[_Lane] = sorted(
+            (_Lane(name, spec["priority"], spec["capacity"], spec["policy"]) for name, spec in lanes.items()),
+            key=lambda lane: lane.priority)
+        lanes_by_name = {lane.name: lane for lane in self._lanes}
+        self._default_lane = lanes_by_name[default_lane]
+        self._lane_by_stream: Dict[str, _Lane] = {
+            stream: lanes_by_name[name] for name, spec in lanes.items() for stream in spec.get("streams", ())
+        }
+        self._size = 0
+        self.unfinished_tasks = 0
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._all_tasks_done = threading.Condition(self._mutex)
+
+    def _lane_for(self, item: Any) -> _Lane:
+        stream = item.get("stream") if isinstance(item, dict) else None
+        return self._lane_by_stream.get(stream, self._default_lane)
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        """Never waits; block and timeout are accepted for queue.Queue compatibility. Raises queue.Full per lane policy."""
+        with self._mutex:
+            lane = self._lane_for(item)
+            if len(lane.items) >= lane.capacity:
+                if lane.policy == DROP_OLDEST:
+                    lane.items.popleft()
+                    lane.dropped += 1
+                    self._size -= 1
+                    self.unfinished_tasks -= 1
+                elif lane.policy == DROP_NEWEST:
+                    lane.dropped += 1
+                    raise queue.Full
+                else:
+                    lane.overflow += 1
+            lane.items.append((next(self._sequence), time.monotonic(), item))
+            lane.put_count += 1
+            lane.max_depth = max(lane.max_depth, len(lane.items))
+            self._size += 1
+            self.unfinished_tasks += 1
+            self._not_empty.notify()
+
+    def put_nowait(self, item: Any):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        with self._not_empty:
+            if not block:
+                if not self._size:
+                    raise queue.Empty
+            elif timeout is None:
+                while not self._size:
+                    self._not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+            serve_lane = None
+            overdue_before = time.monotonic() - self.max_lane_delay
+            for lane in self._lanes:
+                if not lane.items:
+                    continue
+                if serve_lane is None:
+                    serve_lane = lane
+                elif lane.items[0][1] <= overdue_before and lane.items[0][0] < serve_lane.items[0][0]:
+                    serve_lane = lane  # Waited too long: the oldest overdue item goes first
+            self._size -= 1
+            return serve_lane.items.popleft()[2]
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def task_done(self):
+        with self._all_tasks_done:
+            if self.unfinished_tasks <= 0:
+                raise ValueError('task_done() called too many times')
+            self.unfinished_tasks -= 1
+            if self.unfinished_tasks == 0:
+                self._all_tasks_done.notify_all()
+
+    def join(self):
+        with self._all_tasks_done:
+            while self.unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    def clear(self) -> int:
+        """Discards every queued item (they count as done). Returns how many were discarded."""
+        with self._mutex:
+            discarded = self._size
+            for lane in self._lanes:
+                lane.items.clear()
+            self._size = 0
+            self.unfinished_tasks -= discarded
+            if self.unfinished_tasks == 0:
+                self._all_tasks_done.notify_all()
+            return discarded
+
+    def qsize(self) -> int:
+        with self._mutex:
+            return self._size
+
+    def empty(self) -> bool:
+        with self._mutex:
+            return not self._size
+
+    def lane_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Depth, peak depth, put/dropped/overflow counters and policy of every lane."""
+        with self._mutex:
+            return {lane.name: {"depth": len(lane.items), "max_depth": lane.max_depth, "put": lane.put_count,
+                                "dropped": lane.dropped, "overflow": lane.overflow, "policy": lane.policy,
+                                "priority": lane.priority, "capacity": lane.capacity}
+                    for lane in self._lanes}
+
+
+print("DEBUG: lane_queue module loaded")
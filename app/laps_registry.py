@@ -0,0 +1,109 @@
+# laps_registry.py
+"""
+Server-side registry of the laps datasets shown on the Historical Analysis page.
+
+The page used to serialise the whole laps DataFrame into 'historical-laps-data-store'
+(to_json, megabytes) and every dropdown change sent it back to be re-parsed with
+pd.read_json. The laps now stay on the server: register() returns an opaque handle,
+which is all the browser stores, and callbacks look the dataset up with get().
+
+A dataset references the laps frame of the shared fastf1 session (fastf1_sessions.py)
+without copying it. Its driver list and derived views (historical_analytics.py) are
+computed once, when it is registered.
+
+Datasets are evicted least recently used first beyond LAPS_REGISTRY_MAX_DATASETS and
+after LAPS_REGISTRY_IDLE_TTL_SECONDS without access; callbacks treat an unknown handle
+as "load the session again".
+"""
+import logging
+import time
+import uuid
+import threading
+import collections
+from typing import Any, Optional, Dict, Tuple
+
+import pandas as pd
+
+import config
+import historical_analytics
+
+logger = logging.getLogger("F1App.LapsRegistry")
+
+
+class LapsDataset:
+    """One session's laps frame (read-only) with its rows indexed by driver and its analytics."""
+    __slots__ = ("handle", "key", "laps", "driver_rows", "analytics", "last_access_monotonic")
+
+    def __init__(self, handle: str, key: Tuple[Any, ...], laps: pd.DataFrame):
+        self.handle = handle
+        self.key = key
+        self.laps = laps
+        self.driver_rows = laps.groupby('Driver', sort=True).indices if 'Driver' in laps.columns else {}
+        self.analytics = historical_analytics.build_analytics(laps)
+        self.last_access_monotonic = time.monotonic()
+
+    @property
+    def drivers(self):
+        return list(self.driver_rows)
+
+
+_LOCK = threading.Lock()
+_DATASETS: 'collections.OrderedDict[str, LapsDataset]' = collections.OrderedDict()
+_HANDLES_BY_KEY: Dict[Tuple[Any, ...], str] = {}
+
+
+def _drop(handle: str, reason: str):
+    """Hold _LOCK."""
+    dataset = _DATASETS.pop(handle, None)
+    if dataset is not None:
+        if _HANDLES_BY_KEY.get(dataset.key) == handle:
+            del _HANDLES_BY_KEY[dataset.key]
+        logger.debug(f"Dropped laps dataset {dataset.key} ({reason}).")
+
+
+def _evict():
+    """Hold _LOCK."""
+    now = time.monotonic()
+    for handle, dataset in list(_DATASETS.items()):
+        if now - dataset.last_access_monotonic > config.LAPS_REGISTRY_IDLE_TTL_SECONDS:
+            _drop(handle, "idle")
+    while len(_DATASETS) > max(1, config.LAPS_REGISTRY_MAX_DATASETS):
+        _drop(next(iter(_DATASETS)), "capacity")
+
+
+def register(key: Tuple[Any, ...], laps: pd.DataFrame) -> str:
+    """
+    Registers the laps of a session (key, e.g. (year, event, session)) and returns its handle.
+    A session whose same laps frame is already registered keeps its handle. A new laps frame
+    for the session gets a new handle; the old dataset stays valid for the browsers still
+    holding it until LRU/TTL eviction removes it.
+    """
+    with _LOCK:
+        handle = _HANDLES_BY_KEY.get(key)
+        dataset = _DATASETS.get(handle) if handle else None
+        if dataset is not None and dataset.laps is laps:
+            dataset.last_access_monotonic = time.monotonic()
+            _DATASETS.move_to_end(handle)
+            return handle
+    dataset = LapsDataset(uuid.uuid4().hex, key, laps)  # Index and analyse outside the lock
+    with _LOCK:
+        _DATASETS[dataset.handle] = dataset
+        _HANDLES_BY_KEY[key] = dataset.handle
+        _evict()
+    logger.info(f"Registered laps dataset {key}: {len(laps)} laps, {len(dataset.driver_rows)} drivers.")
+    return dataset.handle
+
+
+def get(handle: Optional[str]) -> Optional[LapsDataset]:
+    """The dataset behind a handle, or None if it is unknown or was evicted."""
+    if not handle or not isinstance(handle, str):
+        return None
+    with _LOCK:
+        dataset = _DATASETS.get(handle)
+        if dataset is not None:
+            dataset.last_access_monotonic = time.monotonic()
+            _DATASETS.move_to_end(handle)
+    return dataset
+
+
+print("DEBUG: laps_registry module loaded")
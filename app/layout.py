@@ -70,6 +70,10 @@ main_app_layout = html.Div([
     dcc.Store(id='sidebar-toggle-signal', data=None),
     dcc.Store(id='user-session-id', storage_type='session'),
     dcc.Store(id='user-timezone-store-data', storage_type='session'),
+    # Server push (see push_stream.py / assets/push_stream.js)
+    dcc.Store(id='push-stream-url-store', data=config.PUSH_STREAM_ROUTE if config.PUSH_STREAM_ENABLED else None),
+    dcc.Store(id='push-status-store', data={'connected': False}),
+    dcc.Store(id='push-domain-versions-store', data={}),
     dcc.Download(id="download-timing-data-csv"),
     
     # --- Main Page Components ---
@@ -105,6 +109,13 @@ def define_dashboard_layout():
         dcc.Store(id='current-track-layout-cache-key-store'),
         dcc.Store(id='track-map-figure-version-store'),
         dcc.Store(id='track-map-yellow-key-store', storage_type='memory', data=""),
+        dcc.Store(id='timing-table-render-key-store', storage_type='memory'),
+        dcc.Store(id='timing-columns-version-store', storage_type='memory'),
+        dcc.Store(id='team-radio-version-store', storage_type='memory'),
+        dcc.Store(id='session-weather-version-store', storage_type='memory'),
+        dcc.Store(id='track-status-version-store', storage_type='memory'),
+        dcc.Store(id='race-control-version-store', storage_type='memory'),
+        dcc.Store(id='driver-options-version-store', storage_type='memory'),
         dcc.Store(id='clicked-car-driver-number-store', storage_type='memory'),
         dcc.Interval(id='clientside-click-poll-interval', interval=100, n_intervals=0), 
         dcc.Interval(id='clientside-update-interval', interval=1250, n_intervals=0, disabled=True)
@@ -167,6 +178,14 @@ def define_dashboard_layout():
                 dbc.Button("Start Replay", id="replay-button", color="primary"), 
                 width="auto"
             ),
+            dbc.Col(
+                dbc.InputGroup([
+                    dbc.Input(id='replay-seek-lap-input', type='number', min=1, step=1,
+                              placeholder=config.TEXT_REPLAY_SEEK_LAP_PLACEHOLDER, style={'maxWidth': '80px'}),
+                    dbc.Button("Seek", id="replay-seek-button", color="secondary", n_clicks=0),
+                ], size="sm"),
+                width="auto"
+            ),
         ], align="center", className="mt-3"),
     ]
     # --- END MODIFIED control_card_content_list ---
@@ -0,0 +1,210 @@
+# live_hub.py
+"""
+Process-wide live feed hubs. Each hub owns exactly one upstream SignalR connection,
+one data processing thread and one processed SessionState per live source key.
+Browser sessions attach to a hub as read-only subscribers instead of opening their
+own connection, so connection and processing cost scales with the number of live
+sources rather than the number of viewers.
+"""
+import logging
+import threading
+from typing import Dict, Optional, Set, Any
+
+import app_state
+import config
+import data_processing
+import replay
+import signalr_client
+
+logger = logging.getLogger("F1App.LiveHub")
+
+
+class LiveHub:
+    def __init__(self, key: str):
+        self.key: str = key
+        # The hub's processed state is a regular SessionState, so every existing
+        # signalr_client / data_processing / utils function works on it unchanged.
+        self.state: app_state.SessionState = app_state.SessionState(f"livehub_{key}")
+        self.subscribers: Set[str] = set()
+        # Serialises start/stop so concurrent attaches never open two upstream connections.
+        self.lifecycle_lock: threading.Lock = threading.Lock()
+
+    def is_running(self) -> bool:
+        with self.state.lock:
+            conn_thread = self.state.connection_thread
+            current_state = self.state.app_status.get("state", "Idle")
+        return bool(conn_thread and conn_thread.is_alive()) and \
+            current_state not in ["Stopping", "Stopped", "Error"]
+
+    def ensure_started(self, record_live_data: bool = False) -> bool:
+        """Starts the upstream connection and processing thread if they are not already running."""
+        with self.lifecycle_lock:
+            if self.is_running():
+                return True
+
+            hub_log = self.state.session_id
+            # Clean up after a previous upstream run that ended on its own (disconnect/error).
+            self._stop_threads()
+            self.state.reset_state_variables()
+            self.state.stop_event.clear()
+            with self.state.lock:
+                self.state.record_live_data = record_live_data
+                self.state.app_status.update({
+                    "state": "Initializing",
+                    "connection": config.TEXT_SIGNALR_SOCKET_PRE_NEGOTIATE_STATUS,
+                    "current_replay_file": None,
+                })
+
+            websocket_url, ws_headers = signalr_client.build_connection_url(
+                config.NEGOTIATE_URL_BASE, config.HUB_NAME)
+            if not websocket_url or not ws_headers:
+                logger.error(f"Hub {hub_log}: Negotiation failed. Upstream connection not started.")
+                with self.state.lock:
+                    self.state.app_status.update(
+                        {"state": "Error", "connection": "Negotiation Failed (Live Hub)"})
+                return False
+
+            if record_live_data and not replay.init_live_file_session(self.state):
+                logger.error(f"Hub {hub_log}: Failed to initialize live recording file.")
+
+            conn_thread = threading.Thread(
+                target=signalr_client.run_connection_session,
+                args=(self.state, websocket_url, ws_headers),
+                name=f"SigRConn_Hub_{self.key}", daemon=True)
+            dp_thread = threading.Thread(
+                target=data_processing.data_processing_loop_session,
+                args=(self.state,),
+                name=f"DataProc_Hub_{self.key}", daemon=True)
+            with self.state.lock:
+                self.state.connection_thread = conn_thread
+                self.state.data_processing_thread = dp_thread
+            conn_thread.start()
+            dp_thread.start()
+            logger.info(f"Hub {hub_log}: Upstream connection and data processing threads started.")
+            return True
+
+    def stop(self):
+        """Stops the upstream connection and joins the processing thread."""
+        with self.lifecycle_lock:
+            self._stop_threads()
+
+    def _stop_threads(self):
+        signalr_client.stop_connection_session(self.state)
+        self.state.stop_event.set()
+        with self.state.lock:
+            dp_thread = self.state.data_processing_thread
+        if dp_thread and dp_thread.is_alive():
+            dp_thread.join(timeout=config.LIVE_HUB_STOP_JOIN_TIMEOUT_SECONDS)
+            if dp_thread.is_alive():
+                logger.warning(f"Hub {self.state.session_id}: Data processing thread did not join cleanly.")
+        with self.state.lock:
+            if self.state.data_processing_thread is dp_thread:
+                self.state.data_processing_thread = None
+
+
+# --- Global Hub Registry ---
+LIVE_HUBS: Dict[str, LiveHub] = {}
+LIVE_HUBS_LOCK: threading.Lock = threading.Lock()
+
+
+def attach_session(session_state: app_state.SessionState, hub_key: Optional[str] = None,
+                   record_live_data: bool = False) -> bool:
+    """
+    Subscribes a browser session to the live hub for hub_key, creating and starting the hub if needed.
+    The recording preference only applies when this call is the one that starts the upstream connection.
+    Returns True if the hub is running after the call.
+    """
+    key = hub_key or config.LIVE_HUB_DEFAULT_KEY
+    sess_id_log = session_state.session_id[:8]
+
+    previous_key = session_state.live_hub_key
+    if previous_key and previous_key != key:
+        detach_session(session_state)
+
+    with LIVE_HUBS_LOCK:
+        hub = LIVE_HUBS.get(key)
+        if hub is None:
+            hub = LiveHub(key)
+            LIVE_HUBS[key] = hub
+            with app_state.LIVE_HUB_STATES_LOCK:
+                app_state.LIVE_HUB_STATES[key] = hub.state
+            logger.info(f"Created live hub '{key}'.")
+        hub.subscribers.add(session_state.session_id)
+        subscriber_count = len(hub.subscribers)
+
+    with session_state.lock:
+        session_state.live_hub_key = key
+    logger.info(f"Session {sess_id_log}: Attached to live hub '{key}' ({subscriber_count} subscriber(s)).")
+
+    started = hub.ensure_started(record_live_data)
+    with session_state.lock:
+        if started:
+            session_state.app_status.update(
+                {"state": "Live", "connection": config.TEXT_LIVE_HUB_ATTACHED_STATUS})
+        else:
+            session_state.app_status.update(
+                {"state": "Error", "connection": "Negotiation Failed (Live Hub)"})
+    return started
+
+
+def detach_session(session_state: app_state.SessionState):
+    """Unsubscribes a browser session from its live hub. The hub is stopped when its last subscriber leaves."""
+    with session_state.lock:
+        key = session_state.live_hub_key
+        session_state.live_hub_key = None
+    if not key:
+        return
+
+    sess_id_log = session_state.session_id[:8]
+    hub_to_stop = None
+    with LIVE_HUBS_LOCK:
+        hub = LIVE_HUBS.get(key)
+        if hub is None:
+            return
+        hub.subscribers.discard(session_state.session_id)
+        remaining = len(hub.subscribers)
+        if remaining == 0:
+            hub_to_stop = LIVE_HUBS.pop(key)
+            with app_state.LIVE_HUB_STATES_LOCK:
+                app_state.LIVE_HUB_STATES.pop(key, None)
+
+    logger.info(f"Session {sess_id_log}: Detached from live hub '{key}' ({remaining} subscriber(s) left).")
+    with session_state.lock:
+        if session_state.app_status.get("state") == "Live":
+            session_state.app_status.update(
+                {"state": "Stopped", "connection": config.TEXT_SIGNALR_DISCONNECTED_STATUS})
+
+    if hub_to_stop is not None:
+        logger.info(f"Live hub '{key}' has no subscribers left. Stopping upstream connection.")
+        hub_to_stop.stop()
+
+
+def get_hub_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns a snapshot of the running hubs and their subscriber counts."""
+    with LIVE_HUBS_LOCK:
+        hubs = list(LIVE_HUBS.values())
+    stats = {}
+    for hub in hubs:
+        with hub.state.lock:
+            stats[hub.key] = {
+                "subscribers": len(hub.subscribers),
+                "state": hub.state.app_status.get("state"),
+                "connection": hub.state.app_status.get("connection"),
+                "session_key": hub.state.session_details.get("SessionKey"),
+            }
+    return stats
+
+
+def shutdown_all_hubs():
+    """Stops every hub. Used by the application shutdown hook."""
+    with LIVE_HUBS_LOCK:
+        hubs = list(LIVE_HUBS.values())
+        LIVE_HUBS.clear()
+    with app_state.LIVE_HUB_STATES_LOCK:
+        app_state.LIVE_HUB_STATES.clear()
+    for hub in hubs:
+        logger.info(f"Shutting down live hub '{hub.key}'...")
+        hub.stop()
+
+
+print("DEBUG: live_hub module loaded")
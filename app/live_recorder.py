@@ -0,0 +1,293 @@
+# live_recorder.py
+"""
+Background recorder for live sessions.
+
+The SignalR message handler used to json.dumps every feed message and write it to the
+recording file on the websocket thread. A LiveRecorder takes its place in
+session_state.live_data_file: record() only appends the message to a bounded buffer, and
+a dedicated thread serialises and writes it in batches of up to RECORDER_BATCH_MAX_MESSAGES.
+
+Output is stream-compressed according to RECORDER_COMPRESSION ('gzip', 'zstd' if the
+optional zstandard package is installed, or 'none'), flushed every
+RECORDER_FLUSH_INTERVAL_SECONDS (a sync flush, so a file that is still being recorded can
+be read up to that point) and fsynced every RECORDER_FSYNC_INTERVAL_SECONDS. When a part
+reaches RECORDER_ROTATE_MAX_BYTES on disk or RECORDER_ROTATE_MAX_SECONDS of age, the
+recorder continues in "<name>_part002.data.txt.gz" and so on.
+
+If the buffer is full the message is dropped (and counted) rather than stalling ingestion.
+
+iter_recording_lines() reads any of these formats back for the replay loaders.
+"""
+import logging
+import os
+import io
+import time
+import json
+import gzip
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Optional, List, Dict, Iterator
+
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("F1App.LiveRecorder")
+
+RECORDING_SUFFIX = ".data.txt"
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+RECORDING_GLOBS = [f"*{RECORDING_SUFFIX}{suffix}" for suffix in COMPRESSION_SUFFIXES.values()]
+
+# Buffer entries other than recorded messages
+_TEXT, _RENAME, _CLOSE = "text", "rename", "close"
+
+
+def effective_compression() -> str:
+    compression = str(config.RECORDER_COMPRESSION).lower()
+    if compression not in COMPRESSION_SUFFIXES:
+        logger.warning(f"Unknown RECORDER_COMPRESSION '{compression}', using gzip.")
+        return "gzip"
+    if compression == "zstd" and zstandard is None:
+        logger.warning("RECORDER_COMPRESSION is 'zstd' but the zstandard package is not installed, using gzip.")
+        return "gzip"
+    return compression
+
+
+def recording_filename(base_filename: str, compression: Optional[str] = None, part: int = 1) -> str:
+    """'Race.data.txt' -> 'Race.data.txt.gz', or 'Race_part002.data.txt.gz' for later parts."""
+    compression = compression or effective_compression()
+    stem = base_filename[:-len(RECORDING_SUFFIX)] if base_filename.endswith(RECORDING_SUFFIX) else base_filename
+    if part > 1:
+        stem = f"{stem}_part{part:03d}"
+    return f"{stem}{RECORDING_SUFFIX}{COMPRESSION_SUFFIXES[compression]}"
+
+
+def strip_recording_suffix(filename: str) -> str:
+    """'Race.data.txt.gz' -> 'Race'."""
+    for suffix in sorted(COMPRESSION_SUFFIXES.values(), key=len, reverse=True):
+        full_suffix = RECORDING_SUFFIX + suffix
+        if filename.endswith(full_suffix):
+            return filename[:-len(full_suffix)]
+    return filename
+
+
+def iter_recording_lines(filepath: Path) -> Iterator[str]:
+    """Yields the text lines of a plain, gzip or zstd recording. A truncated tail (file still being recorded) ends the iteration."""
+    name = filepath.name
+    try:
+        if name.endswith(".gz"):
+            with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+                yield from f
+        elif name.endswith(".zst"):
+            if zstandard is None:
+                raise ValueError(f"Reading {name} requires the zstandard package")
+            with open(filepath, 'rb') as raw:
+                reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+                yield from io.TextIOWrapper(reader, encoding='utf-8')
+        else:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                yield from f
+    except EOFError:
+        logger.warning(f"Recording {name} ends in an incomplete block (still being recorded?); read up to it.")
+
+
+class LiveRecorder:
+    """File-like recorder owned by one session; write()/record() never block on disk I/O."""
+
+    def __init__(self, directory: Path, base_filename: str, log_prefix: str = ""):
+        self.directory = Path(directory)
+        self.base_filename = base_filename
+        self.compression = effective_compression()
+        self.log_prefix = log_prefix
+        self.part = 1
+        self.part_filenames: List[str] = []
+        self.stats: Dict[str, int] = {"messages": 0, "dropped": 0, "bytes_in": 0, "bytes_out": 0}
+        self._buffer: queue.Queue = queue.Queue(maxsize=config.RECORDER_BUFFER_MAX_MESSAGES)
+        self._closed = False
+        self._raw = None
+        self._stream = None
+        self._part_started = 0.0
+        self._last_flush = 0.0
+        self._last_fsync = 0.0
+        self._last_drop_warning = 0.0
+        self._open_part()
+        self._thread = threading.Thread(target=self._run, name=f"LiveRecorder_{base_filename}", daemon=True)
+        self._thread.start()
+
+    # --- Producer side (websocket / control threads) ---
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def filename(self) -> str:
+        return recording_filename(self.base_filename, self.compression, self.part)
+
+    def record(self, message: Any):
+        """Buffers one feed message (serialised as a JSON line by the recorder thread)."""
+        if self._closed:
+            return
+        try:
+            self._buffer.put_nowait(message)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            now = time.monotonic()
+            if now - self._last_drop_warning >= 10:
+                self._last_drop_warning = now
+                logger.warning(f"{self.log_prefix}Recorder buffer full, {self.stats['dropped']} message(s) dropped so far.")
+
+    def write(self, text: str):
+        """Buffers raw text (header and footer lines). Waits for buffer space instead of dropping."""
+        if not self._closed:
+            self._buffer.put((_TEXT, text), timeout=config.RECORDER_CLOSE_TIMEOUT_SECONDS)
+
+    def flush(self):
+        """Writes are flushed by the recorder thread every RECORDER_FLUSH_INTERVAL_SECONDS."""
+
+    def rename(self, base_filename: str):
+        """Renames the parts written so far and continues under base_filename (done on the recorder thread)."""
+        if not self._closed:
+            self._buffer.put((_RENAME, base_filename), timeout=config.RECORDER_CLOSE_TIMEOUT_SECONDS)
+
+    def close(self):
+        """Writes out everything buffered, closes the file and stops the recorder thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._buffer.put((_CLOSE, None), timeout=config.RECORDER_CLOSE_TIMEOUT_SECONDS)
+        except queue.Full:
+            logger.error(f"{self.log_prefix}Recorder buffer still full at close; the tail of the recording may be lost.")
+        self._thread.join(timeout=config.RECORDER_CLOSE_TIMEOUT_SECONDS)
+        if self._thread.is_alive():
+            logger.error(f"{self.log_prefix}Recorder thread did not finish within {config.RECORDER_CLOSE_TIMEOUT_SECONDS}s.")
+
+    # --- Recorder thread ---
+
+    def _open_part(self):
+        path = self.directory / self.filename
+        self._raw = open(path, 'ab')
+        if self.compression == "gzip":
+            self._stream = gzip.GzipFile(filename=path.name, mode='ab', fileobj=self._raw,
+                                         compresslevel=config.RECORDER_GZIP_LEVEL)
+        elif self.compression == "zstd":
+            self._stream = zstandard.ZstdCompressor(level=config.RECORDER_ZSTD_LEVEL).stream_writer(
+                self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        if self.filename not in self.part_filenames:
+            self.part_filenames.append(self.filename)
+        self._part_started = self._last_flush = self._last_fsync = time.monotonic()
+
+    def _close_part(self):
+        if self._stream is not self._raw:
+            self._stream.close()  # Ends the gzip member / zstd frame; the raw file stays open
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def _flush(self, fsync: bool):
+        if self.compression == "gzip":
+            self._stream.flush()  # Z_SYNC_FLUSH: readable up to here
+        elif self.compression == "zstd":
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._raw.flush()
+        if fsync:
+            os.fsync(self._raw.fileno())
+
+    def _rename_parts(self, base_filename: str):
+        self._close_part()
+        renamed = []
+        for part_index, old_filename in enumerate(self.part_filenames, 1):
+            new_filename = recording_filename(base_filename, self.compression, part_index)
+            try:
+                os.rename(self.directory / old_filename, self.directory / new_filename)
+                renamed.append(new_filename)
+            except OSError as e:
+                logger.error(f"{self.log_prefix}Failed to rename recording '{old_filename}' -> '{new_filename}': {e}")
+                renamed.append(old_filename)
+                if part_index == self.part:
+                    # Keep appending to the file we have rather than starting an empty one
+                    base_filename = self.base_filename
+        self.part_filenames = renamed
+        self.base_filename = base_filename
+        logger.info(f"{self.log_prefix}Recording renamed to '{self.filename}'.")
+        self._open_part()
+
+    def _rotate_if_due(self):
+        now = time.monotonic()
+        size_due = config.RECORDER_ROTATE_MAX_BYTES > 0 and self._raw.tell() >= config.RECORDER_ROTATE_MAX_BYTES
+        age_due = config.RECORDER_ROTATE_MAX_SECONDS > 0 and now - self._part_started >= config.RECORDER_ROTATE_MAX_SECONDS
+        if size_due or age_due:
+            self._close_part()
+            self.part += 1
+            self._open_part()
+            logger.info(f"{self.log_prefix}Recording rotated to '{self.filename}'.")
+
+    def _run(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self._buffer.get(timeout=config.RECORDER_FLUSH_INTERVAL_SECONDS)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < config.RECORDER_BATCH_MAX_MESSAGES:
+                try:
+                    batch.append(self._buffer.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = []
+                for entry in batch:
+                    if isinstance(entry, tuple) and entry and entry[0] in (_TEXT, _RENAME, _CLOSE):
+                        kind, payload = entry
+                        if kind == _TEXT:
+                            lines.append(payload)
+                            continue
+                        self._write_lines(lines)
+                        lines = []
+                        if kind == _RENAME:
+                            self._rename_parts(payload)
+                        else:
+                            closing = True
+                            break
+                    else:
+                        lines.append(json.dumps(entry) + "\n")
+                        self.stats["messages"] += 1
+                self._write_lines(lines)
+                now = time.monotonic()
+                if not closing and now - self._last_flush >= config.RECORDER_FLUSH_INTERVAL_SECONDS:
+                    fsync = now - self._last_fsync >= config.RECORDER_FSYNC_INTERVAL_SECONDS
+                    self._flush(fsync)
+                    self._last_flush = now
+                    if fsync:
+                        self._last_fsync = now
+                if not closing:
+                    self._rotate_if_due()
+            except Exception as e:
+                logger.error(f"{self.log_prefix}Recorder write failed: {e}", exc_info=True)
+        try:
+            self._close_part()
+        except Exception as e:
+            logger.error(f"{self.log_prefix}Error closing recording '{self.filename}': {e}")
+        self.stats["bytes_out"] = sum((self.directory / name).stat().st_size
+                                      for name in self.part_filenames if (self.directory / name).exists())
+        logger.info(
+            f"{self.log_prefix}Recording closed: {self.stats['messages']} messages in {len(self.part_filenames)} part(s), "
+            f"{self.stats['bytes_in'] / 1e6:.1f} MB -> {self.stats['bytes_out'] / 1e6:.1f} MB on disk "
+            f"({self.compression}), {self.stats['dropped']} dropped.")
+
+    def _write_lines(self, lines: List[str]):
+        if not lines:
+            return
+        data = "".join(lines).encode('utf-8')
+        self._stream.write(data)
+        self.stats["bytes_in"] += len(data)
+
+
+print("DEBUG: live_recorder module loaded")
@@ -18,6 +18,7 @@ import dash_bootstrap_components as dbc
 import app_state  # Uses the new multi-session structure from Response #14
 import config
 import utils
+import circuit_geometry
 from app_instance import app, server  # Import app AND server
 import fastf1
 
@@ -27,6 +28,9 @@ import callbacks
 import signalr_client
 import data_processing
 import replay
+import live_hub
+import session_lifecycle
+import push_stream  # Registers the server push route
 import schedule_page
 
 from layout import main_app_layout
@@ -95,6 +99,8 @@ def warm_up_schedule_cache():
         logger_cache_warmup.info("Background schedule cache warm-up completed successfully.")
     except Exception as e:
         logger_cache_warmup.error(f"Background schedule cache warm-up failed: {e}", exc_info=True)
+    # Track map geometry for the season's circuits, so sessions never wait for the circuit API
+    circuit_geometry.prewarm_season()
 
 
 # --- Clientside Timezone Callback (from your previous main.py) ---
@@ -117,6 +123,10 @@ def shutdown_application():
     logger_shutdown.info(
         "Initiating application shutdown sequence via atexit...")
 
+    session_lifecycle.stop_session_reaper()
+    # Shared live hubs own the upstream connections; stop them before per-session cleanup.
+    live_hub.shutdown_all_hubs()
+
     active_session_ids = []
     with app_state.SESSIONS_STORE_LOCK:
         active_session_ids = list(app_state.SESSIONS_STORE.keys())
@@ -127,62 +137,7 @@ def shutdown_application():
         session_state = app_state.get_session_state(session_id)
         if session_state:
             logger_shutdown.info(f"Cleaning up session: {session_id}...")
-            with session_state.lock:
-                session_state.stop_event.set()  # Signal all threads for this session
-
-                threads_to_join = []
-                if session_state.connection_thread and session_state.connection_thread.is_alive():
-                    threads_to_join.append(
-                        ("SignalR Connection", session_state.connection_thread))
-                if session_state.replay_thread and session_state.replay_thread.is_alive():
-                    threads_to_join.append(
-                        ("Replay", session_state.replay_thread))
-                if session_state.data_processing_thread and session_state.data_processing_thread.is_alive():
-                    threads_to_join.append(
-                        ("Data Processing", session_state.data_processing_thread))
-                if session_state.auto_connect_thread and session_state.auto_connect_thread.is_alive():  # ADDED
-                    threads_to_join.append(
-                        ("Auto-Connect Monitor", session_state.auto_connect_thread))
-                if session_state.track_data_fetch_thread and session_state.track_data_fetch_thread.is_alive(): # NEW
-                    threads_to_join.append(
-                        ("Track Data Fetch", session_state.track_data_fetch_thread))
-                if session_state.hub_connection:  # Attempt to stop hub directly if part of this session's state
-                    try:
-                        logger_shutdown.debug(
-                            f"Session {session_id}: Attempting to stop session's hub_connection directly.")
-                        session_state.hub_connection.stop()
-                    except Exception as e_hub_stop:
-                        logger_shutdown.error(
-                            f"Session {session_id}: Error stopping session's hub_connection: {e_hub_stop}")
-
-            for thread_name, thread_obj in threads_to_join:
-                logger_shutdown.info(
-                    f"Session {session_id}: Waiting for {thread_name} thread ({thread_obj.name}) to join...")
-                thread_obj.join(timeout=5.0)  # Standard timeout
-                if thread_obj.is_alive():
-                    logger_shutdown.warning(
-                        f"Session {session_id}: Thread {thread_obj.name} did not exit cleanly.")
-                else:
-                    logger_shutdown.info(
-                        f"Session {session_id}: Thread {thread_obj.name} joined successfully.")
-
-            with session_state.lock:  # Re-acquire lock to nullify handles and close files
-                session_state.connection_thread = None
-                session_state.replay_thread = None
-                session_state.data_processing_thread = None
-                session_state.auto_connect_thread = None
-                session_state.hub_connection = None
-                session_state.track_data_fetch_thread = None #
-
-                if session_state.live_data_file and not session_state.live_data_file.closed:
-                    try:
-                        session_state.live_data_file.close()
-                        logger_shutdown.info(
-                            f"Session {session_id}: Closed live_data_file.")
-                    except Exception as e:
-                        logger_shutdown.error(
-                            f"Session {session_id}: Error closing live_data_file: {e}")
-                session_state.live_data_file = None  # Ensure it's cleared
+            session_lifecycle.stop_session(session_state, join_timeout=5.0)
 
     with app_state.SESSIONS_STORE_LOCK:
         if app_state.SESSIONS_STORE:  # Only log if there was something to clear
@@ -212,6 +167,7 @@ if hasattr(config, 'REPLAY_DIR') and config.REPLAY_DIR:
             f"Could not create replay directory {config.REPLAY_DIR}: {e}")
 
 atexit.register(shutdown_application)
+session_lifecycle.start_session_reaper()
 
 threading.Thread(target=warm_up_schedule_cache, daemon=True, name="ScheduleCacheWarmer").start()
 
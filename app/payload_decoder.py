@@ -0,0 +1,163 @@
+# payload_decoder.py
+"""
+Off-thread decoding of compressed (`.z`) feed payloads.
+
+The SignalR message handler runs on the websocket's receive thread, so base64 + raw
+inflate + json.loads of every CarData.z / Position.z frame used to delay the next socket
+read. Each session now owns an OrderedDecodeStage: the handler submits raw messages and
+returns immediately, a process-wide pool of PAYLOAD_DECODE_WORKERS threads decodes the
+compressed ones, and decoded items are put on the session's data_queue strictly in
+submission order (an uncompressed message waits for the compressed ones received before it).
+
+zlib releases the GIL while inflating, so the pool overlaps decompression of several
+frames; json.loads does not, but it no longer runs on the receive thread.
+
+PAYLOAD_DECODE_WORKERS = 0 decodes inline on the submitting thread (the old behaviour).
+"""
+import logging
+import time
+import threading
+import collections
+import queue
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Optional, Dict, Deque, Tuple
+
+import config
+import utils
+
+logger = logging.getLogger("F1App.PayloadDecoder")
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(max_workers=config.PAYLOAD_DECODE_WORKERS,
+                                           thread_name_prefix="PayloadDecode")
+            logger.info(f"Started payload decode pool with {config.PAYLOAD_DECODE_WORKERS} worker(s).")
+        return _EXECUTOR
+
+
+def _decode_timed(encoded_data: str) -> Tuple[Optional[Dict[Any, Any]], float]:
+    decode_start = time.perf_counter()
+    decoded = utils._decode_and_decompress(encoded_data)
+    return decoded, time.perf_counter() - decode_start
+
+
+class _PendingMessage:
+    __slots__ = ("stream", "stream_raw", "timestamp", "data", "future", "submitted")
+
+    def __init__(self, stream: str, stream_raw: str, timestamp: str, data: Any,
+                 future: Optional[Future], submitted: float):
+        self.stream = stream
+        self.stream_raw = stream_raw
+        self.timestamp = timestamp
+        self.data = data
+        self.future = future
+        self.submitted = submitted
+
+
+class OrderedDecodeStage:
+    """Decodes a session's feed messages on the shared pool and delivers them to data_queue in order."""
+
+    def __init__(self, session_state: Any):
+        self.data_queue: queue.Queue = session_state.data_queue
+        self.log_prefix = f"Session {session_state.session_id[:8]}: "
+        self._lock = threading.Lock()
+        self._pending: Deque[_PendingMessage] = collections.deque()
+        self.metrics: Dict[str, Any] = {
+            "submitted": 0, "decoded": 0, "failed": 0, "dropped": 0, "max_pending": 0,
+            "avg_decode_ms": 0.0, "max_decode_ms": 0.0,
+            # Submission to delivery, i.e. decode plus waiting for the pool and for earlier messages
+            "avg_latency_ms": 0.0, "max_latency_ms": 0.0,
+        }
+
+    def submit(self, stream_name_raw: str, data_content: Any, timestamp: str):
+        """Queues one feed message. Never blocks on decoding."""
+        compressed = isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z')
+        stream_name = stream_name_raw[:-2] if compressed else stream_name_raw
+        future = None
+        if compressed:
+            if config.PAYLOAD_DECODE_WORKERS <= 0:
+                future = Future()
+                future.set_result(_decode_timed(data_content))
+                data_content = None
+            else:
+                future = _get_executor().submit(_decode_timed, data_content)
+                data_content = None
+        with self._lock:
+            if len(self._pending) >= config.PAYLOAD_DECODE_MAX_PENDING:
+                self.metrics["dropped"] += 1
+                logger.warning(f"{self.log_prefix}Decode backlog full! Discarding '{stream_name}' message.")
+                if future is not None:
+                    future.cancel()
+                return
+            self._pending.append(_PendingMessage(stream_name, stream_name_raw, timestamp, data_content,
+                                                 future, time.perf_counter()))
+            self.metrics["submitted"] += 1
+            self.metrics["max_pending"] = max(self.metrics["max_pending"], len(self._pending))
+        if future is None or future.done():
+            self._deliver_ready()
+        else:
+            future.add_done_callback(lambda _future: self._deliver_ready())
+
+    def _deliver_ready(self):
+        alpha = config.PAYLOAD_DECODE_METRICS_EMA_ALPHA
+        with self._lock:
+            metrics = self.metrics
+            while self._pending:
+                message = self._pending[0]
+                if message.future is not None:
+                    if not message.future.done():
+                        break
+                    if message.future.cancelled():
+                        self._pending.popleft()
+                        continue
+                    try:
+                        message.data, decode_seconds = message.future.result()
+                    except Exception as e:
+                        logger.error(f"{self.log_prefix}Decode worker failed for '{message.stream_raw}': {e}")
+                        message.data, decode_seconds = None, 0.0
+                    decode_ms = decode_seconds * 1000
+                    latency_ms = (time.perf_counter() - message.submitted) * 1000
+                    first = metrics["decoded"] + metrics["failed"] == 0
+                    metrics["avg_decode_ms"] = decode_ms if first else \
+                        (1 - alpha) * metrics["avg_decode_ms"] + alpha * decode_ms
+                    metrics["avg_latency_ms"] = latency_ms if first else \
+                        (1 - alpha) * metrics["avg_latency_ms"] + alpha * latency_ms
+                    metrics["max_decode_ms"] = max(metrics["max_decode_ms"], decode_ms)
+                    metrics["max_latency_ms"] = max(metrics["max_latency_ms"], latency_ms)
+                    if message.data is None:
+                        metrics["failed"] += 1
+                        logger.warning(
+                            f"{self.log_prefix}Failed to decode/decompress data for stream '{message.stream_raw}'. Skipping.")
+                    else:
+                        metrics["decoded"] += 1
+                self._pending.popleft()
+                if message.data is None:
+                    continue
+                try:
+                    self.data_queue.put({"stream": message.stream, "data": message.data,
+                                         "timestamp": message.timestamp}, block=False)
+                except queue.Full:
+                    logger.warning(f"{self.log_prefix}Session data queue full! Discarding '{message.stream}' message.")
+
+    def discard_pending(self):
+        """Drops messages that were submitted but not delivered yet (e.g. on a session reset)."""
+        with self._lock:
+            for message in self._pending:
+                if message.future is not None:
+                    message.future.cancel()
+            self._pending.clear()
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self.metrics)
+            snapshot["pending"] = len(self._pending)
+        return snapshot
+
+
+print("DEBUG: payload_decoder module loaded")
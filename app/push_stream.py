@@ -0,0 +1,146 @@
+# push_stream.py
+"""
+Server-Sent Events stream that pushes processed-state changes to the dashboard.
+
+Each browser opens one EventSource on PUSH_STREAM_ROUTE. The stream checks the published
+snapshot of the state the browser displays (see state_snapshot.py) and only writes when
+something changed:
+
+    event: versions   {domain: version} for the display domains that changed
+    event: cars       car position diff {"status", "selected_driver", "cars": {...}, "removed": [...]}
+
+assets/push_stream.js feeds these into 'push-domain-versions-store' and 'car-positions-store',
+and pauses the timing and car position polling intervals while the stream is connected.
+Request volume then follows the data rate instead of viewers x poll rate.
+
+Streams are capped at PUSH_STREAM_MAX_CONNECTIONS (each holds a WSGI worker thread); browsers
+over the cap, or with PUSH_STREAM_ENABLED off, get a 503 and keep polling.
+"""
+import logging
+import json
+import time
+import threading
+from typing import Any, Optional, Dict, Iterator
+
+import flask
+
+import app_state
+import config
+import state_snapshot
+import utils
+from app_instance import server
+
+logger = logging.getLogger("F1App.PushStream")
+
+_active_streams = 0
+_active_streams_lock = threading.Lock()
+
+
+def _format_event(event_name: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(payload, separators=(',', ':'), default=str)}\n\n"
+
+
+def _car_status(app_status_state: str, cars: Dict[str, Any]) -> str:
+    # Same status values as update_car_data_for_clientside
+    if app_status_state not in ["Live", "Replaying"]:
+        return 'inactive'
+    return 'active' if cars else 'active_no_cars'
+
+
+def _stream_session_updates(session_state: app_state.SessionState) -> Iterator[str]:
+    """Yields SSE chunks for one browser session until the stream's maximum lifetime is reached."""
+    sess_id_log = session_state.session_id[:8]
+    sent_versions: Dict[str, int] = {}
+    sent_cars: Dict[str, Dict[str, Any]] = {}
+    sent_car_meta: Optional[tuple] = None
+    seen_snapshot_version: Optional[int] = None
+    stream_start = time.monotonic()
+    last_write = stream_start
+
+    yield f"retry: {config.PUSH_STREAM_RETRY_MS}\n\n"
+    while time.monotonic() - stream_start < config.PUSH_STREAM_MAX_SECONDS:
+        session_state.last_access_monotonic = time.monotonic()  # An open stream keeps the session from idling out
+        feed_state = app_state.get_data_state(session_state)
+        snap = state_snapshot.get_snapshot(feed_state)
+        with feed_state.lock:
+            app_status_state = feed_state.app_status.get("state", "Idle")
+        with session_state.lock:
+            # Per-browser, never on the shared hub state
+            selected_driver_rno = session_state.selected_driver_for_map_and_lap_chart
+
+        chunks = []
+        snapshot_changed = snap.version != seen_snapshot_version
+        if snapshot_changed:
+            seen_snapshot_version = snap.version
+            # Car positions travel in their own event, so 'positions' alone must not wake the timing table
+            changed_versions = {domain: version for domain, version in snap.domain_versions.items()
+                                if domain != "positions" and sent_versions.get(domain) != version}
+            if changed_versions:
+                sent_versions.update(changed_versions)
+                chunks.append(_format_event("versions", changed_versions))
+
+        if snapshot_changed or sent_car_meta is None or (app_status_state, selected_driver_rno) != sent_car_meta[:2]:
+            cars = utils.build_car_positions(snap.timing_state) if app_status_state in ["Live", "Replaying"] else {}
+            car_meta = (app_status_state, selected_driver_rno, _car_status(app_status_state, cars))
+            changed_cars = {car: data for car, data in cars.items() if sent_cars.get(car) != data}
+            removed_cars = [car for car in sent_cars if car not in cars]
+            if changed_cars or removed_cars or car_meta != sent_car_meta:
+                chunks.append(_format_event("cars", {
+                    "status": car_meta[2], "selected_driver": selected_driver_rno,
+                    "cars": changed_cars, "removed": removed_cars}))
+                sent_cars = cars
+                sent_car_meta = car_meta
+
+        now = time.monotonic()
+        if chunks:
+            yield "".join(chunks)
+            last_write = now
+        elif now - last_write >= config.PUSH_STREAM_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_write = now
+        time.sleep(config.PUSH_STREAM_CHECK_INTERVAL_SECONDS)
+    logger.debug(f"Session {sess_id_log}: Push stream reached its maximum lifetime, closing for reconnect.")
+
+
+class _CountedStream:
+    """Response body that frees its connection slot when the server closes it, even if it never started."""
+
+    def __init__(self, session_state: app_state.SessionState):
+        self.session_state = session_state
+        self._released = False
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            yield from _stream_session_updates(self.session_state)
+        except Exception as e:
+            logger.error(f"Session {self.session_state.session_id[:8]}: Push stream failed: {e}", exc_info=True)
+
+    def close(self):
+        global _active_streams
+        with _active_streams_lock:
+            if not self._released:
+                self._released = True
+                _active_streams -= 1
+
+
+@server.route(config.PUSH_STREAM_ROUTE)
+def push_stream_route():
+    global _active_streams
+    if not config.PUSH_STREAM_ENABLED:
+        return flask.Response("Push stream disabled", status=503)
+    # Resolve the browser's session while the request context (and its Flask session) is available
+    session_state = app_state.get_or_create_session_state()
+    if session_state is None:
+        return flask.Response("No session", status=503)
+    with _active_streams_lock:
+        if _active_streams >= config.PUSH_STREAM_MAX_CONNECTIONS:
+            logger.info(f"Push stream limit ({config.PUSH_STREAM_MAX_CONNECTIONS}) reached; browser keeps polling.")
+            return flask.Response("Push stream limit reached", status=503)
+        _active_streams += 1
+    return flask.Response(_CountedStream(session_state), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Stop reverse proxies from buffering the stream
+    })
+
+
+print("DEBUG: push_stream module loaded")
@@ -5,8 +5,6 @@ and managing state and file I/O for live recording, on a per-session basis.
 """
 
 import logging
-import os
-import json
 import time
 import datetime  # Keep for datetime objects
 from datetime import timezone  # Keep for timezone objects
@@ -23,6 +21,11 @@ import config
 import utils  # For sanitize_filename, parse_iso_timestamp_safe, _decode_and_decompress
 import data_processing
 import signalr_client
+import replay_timeline
+import replay_container
+import live_recorder
+import replay_keyframes
+import state_snapshot
 
 logger = logging.getLogger("F1App.Replay")  # Module-level logger
 
@@ -94,15 +97,22 @@ def ensure_replay_dir_exists():
 
 
 def get_replay_files(directory: str) -> list:
-    """Gets a list of .data.txt files from the specified directory. (Global utility)"""
+    """
+    Gets a list of .data.txt recordings (plain or compressed) from the specified directory, plus converted
+    replay containers that have no source recording next to them. (Global utility)
+    """
     ensure_replay_dir_exists()  # Ensures directory exists before scanning
     dir_path = Path(directory)
     files = []
     if dir_path.exists() and dir_path.is_dir():
         try:
             # Sort alphabetically, could also sort by modification time if preferred
-            files = sorted(
-                [f.name for f in dir_path.glob('*.data.txt') if f.is_file()])
+            source_files = [f for pattern in live_recorder.RECORDING_GLOBS
+                            for f in dir_path.glob(pattern) if f.is_file()]
+            source_container_names = {replay_container.container_path_for(f).name for f in source_files}
+            container_only = [f for f in dir_path.glob(f'*{config.REPLAY_CONTAINER_SUFFIX}')
+                              if f.is_file() and f.name not in source_container_names]
+            files = sorted([f.name for f in source_files + container_only])
         except Exception as e:
             logger.error(
                 f"Error scanning directory '{directory}' for replay files: {e}")
@@ -130,15 +140,17 @@ def init_live_file_session(session_state: 'app_state.SessionState') -> bool:
     filepath = Path(config.TARGET_SAVE_DIRECTORY) / temp_filename
 
     try:
-        with session_state.lock:
-            if session_state.live_data_file and not session_state.live_data_file.closed:
-                logger.warning(
-                    f"Session {sess_id_log}: Closing previously open live data file: {session_state.current_recording_filename}")
-                session_state.live_data_file.close()
+        previous_recorder = session_state.take_live_recorder()
+        if previous_recorder is not None:  # Drained and joined without holding the session lock
+            logger.warning(
+                f"Session {sess_id_log}: Closing previously open live data file: {previous_recorder.filename}")
+            previous_recorder.close()
 
-            session_state.live_data_file = open(filepath, 'a', encoding='utf-8')
+        with session_state.lock:
+            session_state.live_data_file = live_recorder.LiveRecorder(
+                config.TARGET_SAVE_DIRECTORY, temp_filename, log_prefix=f"Session {sess_id_log}: ")
             session_state.is_saving_active = True
-            session_state.current_recording_filename = temp_filename # Store the temp name
+            session_state.current_recording_filename = session_state.live_data_file.filename # Store the temp name
 
             start_time_str = datetime.datetime.now(timezone.utc).strftime(
                 config.LOG_REPLAY_FILE_HEADER_TS_FORMAT)
@@ -152,10 +164,9 @@ def init_live_file_session(session_state: 'app_state.SessionState') -> bool:
             }
             header_msg += f"# Recording for SessionID {sess_id_log}: {s_details_for_header}\n"
             session_state.live_data_file.write(header_msg)
-            session_state.live_data_file.flush()
 
         logger.info(
-            f"Session {sess_id_log}: Live data recording started. Saving to temporary file: {temp_filename}")
+            f"Session {sess_id_log}: Live data recording started. Saving to temporary file: {session_state.current_recording_filename}")
         return True
     except Exception as e:
         logger.error(
@@ -190,32 +201,17 @@ def rename_live_file_session(session_state: 'app_state.SessionState'):
         return
     # --- END OF NEW LOGIC ---
 
-    temp_filepath = Path(config.TARGET_SAVE_DIRECTORY) / temp_filename
-    final_filepath = Path(config.TARGET_SAVE_DIRECTORY) / final_filename
-
-    if live_file and not live_file.closed:
-        logger.debug(f"Session {sess_id_log}: Closing file handle for renaming.")
-        live_file.close()
-        with session_state.lock:
-            session_state.live_data_file = None
-
-    try:
-        os.rename(temp_filepath, final_filepath)
-        logger.info(f"Session {sess_id_log}: Renamed recording from '{temp_filename}' to '{final_filename}'")
+    if not live_file or live_file.closed:
+        logger.debug(f"Session {sess_id_log}: No open recording to rename.")
+        return
 
-        new_file_handle = open(final_filepath, 'a', encoding='utf-8')
-        with session_state.lock:
-            session_state.live_data_file = new_file_handle
-            session_state.current_recording_filename = final_filename
-            
-    except Exception as e:
-        logger.error(f"Session {sess_id_log}: CRITICAL: Failed to rename recording file '{temp_filename}'. Error: {e}", exc_info=True)
-        try:
-            old_file_handle = open(temp_filepath, 'a', encoding='utf-8')
-            with session_state.lock:
-                session_state.live_data_file = old_file_handle
-        except Exception as e_reopen:
-             logger.error(f"Session {sess_id_log}: FAILED to reopen temporary file after rename error: {e_reopen}", exc_info=True)
+    # The recorder renames its parts on its own thread and keeps appending to the renamed file
+    live_file.rename(final_filename)
+    with session_state.lock:
+        session_state.current_recording_filename = live_recorder.recording_filename(
+            final_filename, live_file.compression, live_file.part)
+    logger.info(f"Session {sess_id_log}: Renaming recording from '{temp_filename}' to "
+                f"'{session_state.current_recording_filename}'")
 
 
 def close_live_file_session(session_state: 'app_state.SessionState'):
@@ -226,32 +222,25 @@ def close_live_file_session(session_state: 'app_state.SessionState'):
 
     with session_state.lock:
         filename_that_was_closed = session_state.current_recording_filename
-        if session_state.live_data_file and not session_state.live_data_file.closed:
-            logger.info(
-                f"Session {sess_id_log}: Closing live data file: {filename_that_was_closed}")
-            try:
-                stop_time_str = datetime.datetime.now(timezone.utc).strftime(
-                    config.LOG_REPLAY_FILE_HEADER_TS_FORMAT)
-                footer_msg = f"{config.LOG_REPLAY_FILE_STOP_MSG_PREFIX}{stop_time_str}\n"
-                session_state.live_data_file.write(footer_msg)
-                session_state.live_data_file.close()
-                file_closed_successfully = True
-            except Exception as e:
-                logger.error(
-                    f"Session {sess_id_log}: Error writing footer or closing live data file '{filename_that_was_closed}': {e}")
-            finally:  # Ensure state is updated regardless of write error during close
-                session_state.live_data_file = None
-                session_state.is_saving_active = False
-                # Do not clear current_recording_filename here, let init_live_file_session handle it for new files.
-                # Or clear it if the intention is that "closed" means no current file. For status, keeping it might be okay.
-                # Let's clear it to indicate no active recording file.
-                # session_state.current_recording_filename = None
-        else:
-            logger.debug(
-                f"Session {sess_id_log}: close_live_file_session called, but no active file to close.")
-
-        # Always ensure is_saving_active is false after attempting to close or if no file was open.
-        session_state.is_saving_active = False
+    # Detached under the lock, then finished without it: the footer write and close() wait for the buffer to drain.
+    # current_recording_filename is kept so the status can still show the last file.
+    live_file = session_state.take_live_recorder()
+    if live_file is not None:
+        logger.info(
+            f"Session {sess_id_log}: Closing live data file: {filename_that_was_closed}")
+        try:
+            stop_time_str = datetime.datetime.now(timezone.utc).strftime(
+                config.LOG_REPLAY_FILE_HEADER_TS_FORMAT)
+            footer_msg = f"{config.LOG_REPLAY_FILE_STOP_MSG_PREFIX}{stop_time_str}\n"
+            live_file.write(footer_msg)
+            live_file.close()
+            file_closed_successfully = True
+        except Exception as e:
+            logger.error(
+                f"Session {sess_id_log}: Error writing footer or closing live data file '{filename_that_was_closed}': {e}")
+    else:
+        logger.debug(
+            f"Session {sess_id_log}: close_live_file_session called, but no active file to close.")
 
     if file_closed_successfully:
         logger.info(
@@ -261,82 +250,76 @@ def close_live_file_session(session_state: 'app_state.SessionState'):
 def _queue_message_from_replay_session(session_state: 'app_state.SessionState', message_data: Any) -> int:
     """Queues messages from replay data into the session's data_queue."""
     sess_id_log = session_state.session_id[:8]
-    put_count = 0
     try:
-        # Your existing logic for parsing different message_data structures (R block, list, heartbeat, M block)
-        # Replace app_state.data_queue.put with session_state.data_queue.put
-        if isinstance(message_data, dict) and "R" in message_data:
-            # ... (logic for R block, using session_state.data_queue.put) ...
-            snapshot_data = message_data.get("R", {})
-            if isinstance(snapshot_data, dict):
-                snapshot_ts = snapshot_data.get("Heartbeat", {}).get("Utc") or (
-                    datetime.datetime.now(timezone.utc).isoformat() + 'Z')
-                for stream_name_raw, stream_data in snapshot_data.items():
-                    # ... (decode, decompress logic)
-                    stream_name = stream_name_raw
-                    actual_data = stream_data
-                    if isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z'):
-                        stream_name = stream_name_raw[:-2]
-                        actual_data = utils._decode_and_decompress(stream_data)
-                        if actual_data is None:
-                            logger.warning(f"Session {sess_id_log}: Failed decode {stream_name_raw} in R"); continue
-                    if actual_data is not None:
-                        session_state.data_queue.put(
-                            {"stream": stream_name, "data": actual_data, "timestamp": snapshot_ts}, block=False)
-                        put_count += 1
-        elif isinstance(message_data, list) and len(message_data) >= 2:
-            # ... (logic for list messages, using session_state.data_queue.put) ...
-            stream_name_raw = message_data[0]
-            data_content = message_data[1]
-            timestamp_for_queue = message_data[2] if len(message_data) > 2 else (
-                datetime.datetime.now(timezone.utc).isoformat() + 'Z')
-            stream_name = stream_name_raw
-            actual_data = data_content
-            if isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z'):
-                stream_name = stream_name_raw[:-2]
-                actual_data = utils._decode_and_decompress(data_content)
-                if actual_data is None:
-                    logger.warning(f"Session {sess_id_log}: Failed decode {stream_name_raw} list msg"); return 0
-            if actual_data is not None:
-                session_state.data_queue.put(
-                    {"stream": stream_name, "data": actual_data, "timestamp": timestamp_for_queue}, block=False)
-                put_count += 1
-        elif isinstance(message_data, dict) and not message_data:  # Heartbeat {}
-            session_state.data_queue.put({"stream": "Heartbeat", "data": {
-                                         }, "timestamp": datetime.datetime.now(timezone.utc).isoformat() + 'Z'}, block=False)
-            put_count += 1
-        elif isinstance(message_data, dict) and "M" in message_data and isinstance(message_data["M"], list):
-            # ... (logic for M block, using session_state.data_queue.put) ...
-            for msg_container in message_data["M"]:
-                if isinstance(msg_container, dict) and msg_container.get("M") == "feed":
-                    msg_args = msg_container.get("A")
-                    if isinstance(msg_args, list) and len(msg_args) >= 2:
-                        snr = msg_args[0]
-                        dc = msg_args[1]; ts = msg_args[2] if len(
-                            msg_args) > 2 else datetime.datetime.now(timezone.utc).isoformat()+'Z'
-                        sn = snr
-                        ad = dc
-                        if isinstance(snr, str) and snr.endswith('.z'):
-                            sn = snr[:-
-                                2]; ad = utils._decode_and_decompress(dc)
-                        if ad is not None: session_state.data_queue.put(
-                            {"stream": sn, "data": ad, "timestamp": ts}, block=False); put_count += 1
-        else:
-            logger.warning(
-                f"Session {sess_id_log}: Unknown message structure in replay data: {str(message_data)[:100]}")
-
-    except queue.Full:
-        logger.warning(
-            f"Session {sess_id_log}: Replay data queue full! Discarding message(s).")
+        items = replay_timeline.extract_queue_items(message_data, f"Session {sess_id_log}: ")
+        return _queue_items_session(session_state, items)
     except Exception as e:
         error_data_str = str(message_data)
         logger.error(
             f"Session {sess_id_log}: Unexpected error in _queue_message_from_replay_session for data '{error_data_str[:100]}...': {e}", exc_info=True)
+    return 0
+
+
+def _queue_items_session(session_state: 'app_state.SessionState', items: List[Dict[str, Any]]) -> int:
+    """Puts already-decoded queue items on the session's data_queue."""
+    put_count = 0
+    try:
+        for item in items:
+            session_state.data_queue.put(item, block=False)
+            put_count += 1
+    except queue.Full:
+        logger.warning(
+            f"Session {session_state.session_id[:8]}: Replay data queue full! Discarding message(s).")
     return put_count
 
 
+def _drain_data_queue_session(session_state: 'app_state.SessionState') -> int:
+    """Drops queued items and waits (bounded) for the item the processing thread may be applying."""
+    drained = session_state.data_queue.clear()
+    deadline = time.monotonic() + config.REPLAY_SEEK_DRAIN_TIMEOUT_SECONDS
+    while session_state.data_queue.unfinished_tasks > 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return drained
+
+
+def _apply_seek_session(session_state: 'app_state.SessionState', timeline: 'replay_timeline.ReplayTimeline',
+                        seek_request: Dict[str, Any]) -> bool:
+    """Runs on the replay thread: restores the nearest keyframe and fast-applies up to the seek target."""
+    sess_id_log = session_state.session_id[:8]
+    seek_start_time = time.monotonic()
+    try:
+        keyframe_index = replay_keyframes.get_keyframe_index(timeline)
+    except Exception as e:
+        logger.error(f"ReplaySess {sess_id_log}: Cannot seek, keyframe build failed: {e}", exc_info=True)
+        return False
+
+    target_frame = None
+    if seek_request.get("lap") is not None:
+        target_frame = keyframe_index.frame_for_lap(int(seek_request["lap"]))
+    elif seek_request.get("offset_seconds") is not None:
+        target_frame = keyframe_index.frame_for_offset(float(seek_request["offset_seconds"]))
+    if target_frame is None:
+        logger.warning(f"ReplaySess {sess_id_log}: Seek target {seek_request} not found in {timeline.filepath.name}.")
+        return False
+
+    drained = _drain_data_queue_session(session_state)
+    keyframe, applied_frames, pending_fetch_info = keyframe_index.seek(session_state, target_frame)
+    state_snapshot.mark_dirty(session_state)
+    state_snapshot.publish_if_due(session_state, force=True)
+    if pending_fetch_info:
+        data_processing.start_background_fetch(session_state, pending_fetch_info)
+    logger.info(
+        f"ReplaySess {sess_id_log}: Seek {seek_request} -> frame {target_frame} via keyframe at frame "
+        f"{keyframe.frame_index} (+{applied_frames} frames, {drained} queued items dropped) "
+        f"in {(time.monotonic() - seek_start_time) * 1000:.0f}ms.")
+    return True
+
+
 def _replay_thread_target_session(session_state: 'app_state.SessionState', filename_str: str, initial_speed: float):
-    """Target function for a session's replay thread."""
+    """
+    Target function for a session's replay thread. Walks the shared decoded timeline of the
+    file from the session's replay_cursor, pacing on the file timestamps scaled by replay_speed.
+    """
     sess_id_log = session_state.session_id[:8]
     filepath = Path(config.REPLAY_DIR) / filename_str
     logger.info(
@@ -344,7 +327,7 @@ def _replay_thread_target_session(session_state: 'app_state.SessionState', filen
 
     actual_start_real_time: Optional[float] = None 
     first_interesting_file_timestamp: Optional[datetime.datetime] = None
-    # last_processed_file_timestamp is used to calculate deltas between consecutive paced messages
+    # last_paced_line_file_timestamp is used to calculate deltas between consecutive paced messages
     last_paced_line_file_timestamp: Optional[datetime.datetime] = None 
 
     lines_processed = 0
@@ -352,140 +335,104 @@ def _replay_thread_target_session(session_state: 'app_state.SessionState', filen
     playback_status_str = config.REPLAY_STATUS_RUNNING
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            logger.info(f"ReplaySess {sess_id_log}: Opened replay file {filepath}")
-            for line_num, line in enumerate(f, 1):
-                if session_state.stop_event.is_set():
-                    logger.info(f"ReplaySess {sess_id_log}: Stop event detected in replay thread loop (L{line_num}). Breaking.")
-                    playback_status_str = config.REPLAY_STATUS_STOPPED
-                    break
-
-                line = line.strip()
-                if not line or line.startswith("#"):
-                    continue
-
-                current_line_processing_start_time = time.monotonic()
-                current_line_has_pacing_timestamp: Optional[datetime.datetime] = None # Timestamp for THIS line, if found
-                timestamp_str_for_pacing = None
-                
-                # Flag to determine if this line contains what we consider "start of action"
-                is_first_anchor_message_type = False
-
-                try:
-                    raw_message = json.loads(line)
-                    
-                    # Determine if this raw_message is an M-block with actual feed data
-                    if isinstance(raw_message, dict) and "M" in raw_message and isinstance(raw_message["M"], list) and len(raw_message["M"]) > 0:
-                        # Check if any sub-message is a "feed"
-                        if any(isinstance(m, dict) and m.get("M") == "feed" for m in raw_message["M"]):
-                            is_first_anchor_message_type = True 
-                            # For pacing, extract the timestamp from the *last* feed message in the M-block
-                            for msg_container in reversed(raw_message['M']):
-                                if isinstance(msg_container, dict) and msg_container.get("M") == "feed":
-                                    msg_args = msg_container.get("A")
-                                    if isinstance(msg_args, list) and len(msg_args) > 2 and msg_args[2]:
-                                        timestamp_str_for_pacing = msg_args[2]; break
-                    
-                    # Fallback or alternative: extract pacing timestamp from R-block heartbeat IF no M-block timestamp found yet
-                    # AND if we haven't found our first "interesting" anchor yet.
-                    # This ensures that if a file *only* has R-blocks for a while, it still paces.
-                    if not timestamp_str_for_pacing and isinstance(raw_message, dict) and "R" in raw_message and isinstance(raw_message["R"], dict):
-                        hb_ts = raw_message.get("R", {}).get("Heartbeat", {}).get("Utc")
-                        if hb_ts: timestamp_str_for_pacing = hb_ts
-                        # R-blocks usually aren't the "start of action" for user perception.
-                        # is_first_anchor_message_type remains False unless set by M-block logic above.
-
-                    # Fallback for simple list messages (less common for F1 data with pacing)
-                    if not timestamp_str_for_pacing and isinstance(raw_message, list) and len(raw_message) > 2:
-                        timestamp_str_for_pacing = raw_message[2]
-                        # Potentially set is_first_anchor_message_type = True if this list message type is considered "action"
-                        # For example: if raw_message[0] == "TimingData" (if that's a possible stream format)
-
-                    if timestamp_str_for_pacing:
-                        current_line_has_pacing_timestamp = utils.parse_iso_timestamp_safe(timestamp_str_for_pacing)
-                        if not current_line_has_pacing_timestamp:
-                             logger.warning(f"ReplaySess {sess_id_log}: L{line_num} - Failed to parse pacing timestamp: '{timestamp_str_for_pacing}' from raw: {str(raw_message)[:100]}")
-                    else:
-                        logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - No pacing timestamp in: {str(raw_message)[:100]}")
-
-                    queued_count = _queue_message_from_replay_session(session_state, raw_message)
-                    if queued_count > 0: lines_processed += queued_count
-                    else: lines_skipped_other +=1; logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - No messages queued by _queue_message_from_replay_session."); continue
-                    
-                    # --- Pacing Logic ---
-                    if current_line_has_pacing_timestamp:
-                        calculated_time_to_wait_for_original_timing = 0.0
-
-                        if first_interesting_file_timestamp is None: # We are still looking for our anchor
-                            if is_first_anchor_message_type: # This line IS our anchor!
-                                first_interesting_file_timestamp = current_line_has_pacing_timestamp
-                                last_paced_line_file_timestamp = current_line_has_pacing_timestamp
-                                actual_start_real_time = time.monotonic() # Anchor real-world time
-                                logger.info(f"ReplaySess {sess_id_log}: L{line_num} - FIRST ACTION ANCHOR. FileTS: {first_interesting_file_timestamp.isoformat()}. Real-time anchor set. No initial sleep.")
-                                # calculated_time_to_wait_for_original_timing remains 0
-                            else: # It's a message with a timestamp (e.g. R-block) but not our "action" anchor
-                                last_paced_line_file_timestamp = current_line_has_pacing_timestamp # Keep track of it for next potential delta
-                                logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - Processed pre-anchor TS: {current_line_has_pacing_timestamp.isoformat()}. No pacing sleep yet.")
-                                # No sleep, process immediately
-                        
-                        else: # We have an anchor (first_interesting_file_timestamp and actual_start_real_time are set)
-                            if last_paced_line_file_timestamp is None: # Should not happen if first_interesting_file_timestamp is set
-                                logger.error(f"ReplaySess {sess_id_log}: L{line_num} - Inconsistent state: first_interesting_file_timestamp is set, but last_paced_line_file_timestamp is None. Resetting anchor.")
-                                first_interesting_file_timestamp = current_line_has_pacing_timestamp # Re-anchor
-                                last_paced_line_file_timestamp = current_line_has_pacing_timestamp
-                                actual_start_real_time = time.monotonic()
+        if not filepath.is_file() and not replay_timeline.resolve_replay_source(filepath).is_file():
+            raise FileNotFoundError(str(filepath))
+        timeline = replay_timeline.get_timeline(filepath)
+        if timeline is None:
+            raise RuntimeError(f"Could not decode replay timeline for {filepath}")
+        lines_skipped_json_error = timeline.lines_skipped_json_error
+        lines_skipped_other = timeline.lines_skipped_other
+        logger.info(f"ReplaySess {sess_id_log}: Using shared timeline for {filepath.name} ({len(timeline)} frames)")
+
+        while session_state.replay_cursor < len(timeline.frames):
+            if session_state.stop_event.is_set():
+                logger.info(f"ReplaySess {sess_id_log}: Stop event detected in replay thread loop (frame {session_state.replay_cursor}). Breaking.")
+                playback_status_str = config.REPLAY_STATUS_STOPPED
+                break
+
+            with session_state.lock:
+                seek_request = session_state.replay_seek_request
+                session_state.replay_seek_request = None
+            if seek_request:
+                if _apply_seek_session(session_state, timeline, seek_request):
+                    # Re-anchor pacing on the first action frame after the jump
+                    first_interesting_file_timestamp = None
+                    last_paced_line_file_timestamp = None
+                    actual_start_real_time = None
+                continue
+
+            frame = timeline.frames[session_state.replay_cursor]
+            session_state.replay_cursor += 1
+            line_num = frame.line_num
+            current_line_processing_start_time = time.monotonic()
+            current_line_has_pacing_timestamp = frame.pacing_ts
+
+            try:
+                queued_count = _queue_items_session(session_state, frame.items)
+                if queued_count > 0: lines_processed += queued_count
+                else: lines_skipped_other +=1; logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - No messages queued."); continue
+
+                # --- Pacing Logic ---
+                if current_line_has_pacing_timestamp:
+                    calculated_time_to_wait_for_original_timing = 0.0
+
+                    if first_interesting_file_timestamp is None: # We are still looking for our anchor
+                        if frame.is_anchor: # This line IS our anchor!
+                            first_interesting_file_timestamp = current_line_has_pacing_timestamp
+                            last_paced_line_file_timestamp = current_line_has_pacing_timestamp
+                            actual_start_real_time = time.monotonic() # Anchor real-world time
+                            logger.info(f"ReplaySess {sess_id_log}: L{line_num} - FIRST ACTION ANCHOR. FileTS: {first_interesting_file_timestamp.isoformat()}. Real-time anchor set. No initial sleep.")
+                        else: # It's a message with a timestamp (e.g. R-block) but not our "action" anchor
+                            last_paced_line_file_timestamp = current_line_has_pacing_timestamp # Keep track of it for next potential delta
+                            logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - Processed pre-anchor TS: {current_line_has_pacing_timestamp.isoformat()}. No pacing sleep yet.")
+
+                    else: # We have an anchor (first_interesting_file_timestamp and actual_start_real_time are set)
+                        if last_paced_line_file_timestamp is None: # Should not happen if first_interesting_file_timestamp is set
+                            logger.error(f"ReplaySess {sess_id_log}: L{line_num} - Inconsistent state: first_interesting_file_timestamp is set, but last_paced_line_file_timestamp is None. Resetting anchor.")
+                            first_interesting_file_timestamp = current_line_has_pacing_timestamp # Re-anchor
+                            last_paced_line_file_timestamp = current_line_has_pacing_timestamp
+                            actual_start_real_time = time.monotonic()
+                        else:
+                            file_time_delta_from_last_paced = (current_line_has_pacing_timestamp - last_paced_line_file_timestamp).total_seconds()
+                            if file_time_delta_from_last_paced < 0:
+                                 logger.warning(f"ReplaySess {sess_id_log}: L{line_num} - Negative/Retrograde time delta ({file_time_delta_from_last_paced:.3f}s). Processing immediately.")
+                                 calculated_time_to_wait_for_original_timing = 0.0
                             else:
-                                file_time_delta_from_last_paced = (current_line_has_pacing_timestamp - last_paced_line_file_timestamp).total_seconds()
-                                if file_time_delta_from_last_paced < 0:
-                                     logger.warning(f"ReplaySess {sess_id_log}: L{line_num} - Negative/Retrograde time delta ({file_time_delta_from_last_paced:.3f}s). Processing immediately.")
-                                     calculated_time_to_wait_for_original_timing = 0.0
-                                else:
-                                     calculated_time_to_wait_for_original_timing = file_time_delta_from_last_paced
-                            
-                            # Get current replay speed
+                                 calculated_time_to_wait_for_original_timing = file_time_delta_from_last_paced
+
+                        # Get current replay speed
+                        current_s_replay_speed = 1.0
+                        with session_state.lock: current_s_replay_speed = session_state.replay_speed
+                        if not (isinstance(current_s_replay_speed, (int,float)) and current_s_replay_speed > 0 and not math.isinf(current_s_replay_speed) and not math.isnan(current_s_replay_speed)):
                             current_s_replay_speed = 1.0
-                            with session_state.lock: current_s_replay_speed = session_state.replay_speed
-                            if not (isinstance(current_s_replay_speed, (int,float)) and current_s_replay_speed > 0 and not math.isinf(current_s_replay_speed) and not math.isnan(current_s_replay_speed)):
-                                current_s_replay_speed = 1.0
-                            
-                            # Pacing calculation
-                            target_delay_adjusted_for_speed = calculated_time_to_wait_for_original_timing / current_s_replay_speed
-                            line_proc_duration = time.monotonic() - current_line_processing_start_time
-                            actual_sleep_duration = max(0, target_delay_adjusted_for_speed - line_proc_duration)
-
-                            if actual_sleep_duration > 0.001:
-                                logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - Pacing sleep: {actual_sleep_duration:.3f}s. (FileDelta: {calculated_time_to_wait_for_original_timing:.3f}s, Speed: {current_s_replay_speed:.1f}x)")
-                                # ... (Chunked sleep logic from Response #11) ...
-                                max_sleep_chunk = 1.0; remaining_sleep = actual_sleep_duration
-                                while remaining_sleep > 0.001:
-                                    chunk = min(remaining_sleep, max_sleep_chunk)
-                                    if session_state.stop_event.wait(chunk):
-                                        playback_status_str = config.REPLAY_STATUS_STOPPED; break
-                                    remaining_sleep -= chunk
-                                if playback_status_str == config.REPLAY_STATUS_STOPPED: break
-                            
-                            last_paced_line_file_timestamp = current_line_has_pacing_timestamp # Update for next iteration
-
-                except json.JSONDecodeError:
-                    lines_skipped_json_error += 1
-                    if line_num > 10:
-                        logger.warning(
-                            f"Session {sess_id_log}: Invalid JSON L{line_num} (skipped) in {filename_str}")
-                    continue
-                except queue.Full:  # Should be caught by _queue_message_from_replay_session, but as fallback
-                    logger.warning(
-                        f"Session {sess_id_log}: Data queue full during replay L{line_num}. Pausing briefly.")
-                    time.sleep(0.1)
-                    continue
-                except Exception as e_line:
-                    lines_skipped_other += 1
-                    # exc_info=False for less noise on minor line errors
-                    logger.error(
-                        f"Session {sess_id_log}: Error processing L{line_num} of {filename_str}: {e_line}", exc_info=False)
-                    continue
-
-            if playback_status_str == config.REPLAY_STATUS_RUNNING:  # If loop finished without break
-                playback_status_str = config.REPLAY_STATUS_COMPLETE
+
+                        # Pacing calculation
+                        target_delay_adjusted_for_speed = calculated_time_to_wait_for_original_timing / current_s_replay_speed
+                        line_proc_duration = time.monotonic() - current_line_processing_start_time
+                        actual_sleep_duration = max(0, target_delay_adjusted_for_speed - line_proc_duration)
+
+                        if actual_sleep_duration > 0.001:
+                            logger.debug(f"ReplaySess {sess_id_log}: L{line_num} - Pacing sleep: {actual_sleep_duration:.3f}s. (FileDelta: {calculated_time_to_wait_for_original_timing:.3f}s, Speed: {current_s_replay_speed:.1f}x)")
+                            max_sleep_chunk = 1.0; remaining_sleep = actual_sleep_duration
+                            while remaining_sleep > 0.001:
+                                chunk = min(remaining_sleep, max_sleep_chunk)
+                                if session_state.stop_event.wait(chunk):
+                                    playback_status_str = config.REPLAY_STATUS_STOPPED; break
+                                if session_state.replay_seek_request is not None: break
+                                remaining_sleep -= chunk
+                            if playback_status_str == config.REPLAY_STATUS_STOPPED: break
+
+                        last_paced_line_file_timestamp = current_line_has_pacing_timestamp # Update for next iteration
+
+            except Exception as e_line:
+                lines_skipped_other += 1
+                # exc_info=False for less noise on minor line errors
+                logger.error(
+                    f"Session {sess_id_log}: Error processing L{line_num} of {filename_str}: {e_line}", exc_info=False)
+                continue
+
+        if playback_status_str == config.REPLAY_STATUS_RUNNING:  # If loop finished without break
+            playback_status_str = config.REPLAY_STATUS_COMPLETE
 
     except FileNotFoundError:
         logger.error(
@@ -574,6 +521,7 @@ def start_replay_session(session_state: 'app_state.SessionState', data_file_path
             "current_replay_file": filename_str
         })
         session_state.replay_speed = replay_speed
+        session_state.replay_cursor = 0
         # Reset track map states explicitly here too, as done in handle_control_clicks
         session_state.track_coordinates_cache = app_state.INITIAL_SESSION_TRACK_COORDINATES_CACHE.copy() # Ensure app_state imported
         session_state.session_details['SessionKey'] = None 
@@ -581,6 +529,9 @@ def start_replay_session(session_state: 'app_state.SessionState', data_file_path
         logger.debug(f"ReplaySess {sess_id_log}: app_status and map states updated for replay init.")# NEW LOG
 
 
+    if config.REPLAY_KEYFRAMES_PREBUILD:
+        replay_keyframes.prebuild_keyframes_async(data_file_path)
+
     logger.info(
         f"ReplaySess {sess_id_log}: Starting replay thread for {filename_str} at speed {replay_speed}x") # MODIFIED LOG
     try:
@@ -628,6 +579,26 @@ def start_replay_session(session_state: 'app_state.SessionState', data_file_path
         return False
 
 
+def seek_replay_session(session_state: 'app_state.SessionState', lap: Optional[int] = None,
+                        offset_seconds: Optional[float] = None) -> bool:
+    """
+    Asks the session's running replay thread to jump to the start of a lap or to an offset
+    (seconds of feed time after the first action message). Returns False if no replay is running.
+    """
+    sess_id_log = session_state.session_id[:8]
+    if lap is None and offset_seconds is None:
+        return False
+    with session_state.lock:
+        s_replay_thread = session_state.replay_thread
+        if not s_replay_thread or not s_replay_thread.is_alive():
+            logger.info(f"ReplaySess {sess_id_log}: Seek ignored, no active replay thread.")
+            return False
+        seek_request = {"lap": lap} if lap is not None else {"offset_seconds": offset_seconds}
+        session_state.replay_seek_request = seek_request
+    logger.info(f"ReplaySess {sess_id_log}: Seek requested: {seek_request}")
+    return True
+
+
 def stop_replay_session(session_state: 'app_state.SessionState'):
     sess_id_log = session_state.session_id[:8]
     logger.info(f"ReplaySess {sess_id_log}: Stop replay requested.") # MODIFIED LOG
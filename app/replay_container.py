@@ -0,0 +1,385 @@
+# replay_container.py
+"""
+Compact, pre-decoded binary container for replay recordings (.f1r), plus a converter
+from the newline-delimited SignalR `.data.txt` recordings.
+
+Layout:
+    MAGIC
+    chunk 0 .. chunk N-1        zlib-compressed blocks of consecutive frames:
+                                string table, JSON column, frames
+    metadata                    JSON (source name, stream table, counts)
+    chunk index                 one fixed-size record per chunk (first pacing timestamp, offset, sizes)
+    footer                      offsets of metadata and index, then MAGIC again
+
+Inside a chunk, high-rate CarData and Position payloads are stored column-wise as
+fixed-width integers, so playback rebuilds them with struct unpacking instead of
+base64 + inflate + json.loads per message. Every other payload (TimingData, by far the
+most frequent message, and the low-rate streams) goes into the chunk's JSON column: one
+JSON array per chunk, parsed with a single json.loads, that items refer to by position.
+Each chunk is decompressed once as a whole.
+
+Loading a container yields the same queue items as loading its source recording, except
+for the timestamps of '{}' heartbeats: the feed gives them none, so they carry the time
+the recording was decoded for conversion rather than the time of the load.
+
+Usage:
+    python replay_container.py replays/Miami_Grand_Prix_Race_20250504_211828.data.txt
+"""
+import logging
+import json
+import struct
+import zlib
+import bisect
+import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Any, Optional, List, Dict, Tuple, Iterator
+
+import config
+import live_recorder
+
+logger = logging.getLogger("F1App.ReplayContainer")
+
+MAGIC = b"F1RPLAY1"
+FORMAT_VERSION = 2
+NO_TIMESTAMP = -(2 ** 63)
+EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+KIND_JSON = 0
+KIND_CAR_DATA = 1
+KIND_POSITION = 2
+
+# Channel order as sent by the feed; payloads with any other layout fall back to JSON.
+CAR_DATA_CHANNEL_KEYS = ['0', '2', '3', '4', '5', '45']
+POSITION_CAR_KEYS = ['Status', 'X', 'Y', 'Z']
+POSITION_STATUSES = ['OnTrack', 'OffTrack']
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_FRAME_HEADER = struct.Struct("<IqBH")        # line_num, pacing_ts_us, is_anchor, item_count
+_ITEM_HEADER = struct.Struct("<BIB")          # stream_idx, timestamp_str_idx, payload kind
+_ENTRY_HEADER = struct.Struct("<IB")          # timestamp_str_idx, car_count
+_CAR_DATA_ROW = struct.Struct("<BHHBBBB")     # car, rpm, speed, gear, throttle, brake, drs
+_POSITION_ROW = struct.Struct("<BBiii")       # car, status, x, y, z
+_INDEX_ENTRY = struct.Struct("<qQIII")        # first_pacing_ts_us, offset, compressed_len, raw_len, frame_count
+_FOOTER = struct.Struct("<QIQI")              # meta_offset, meta_len, index_offset, chunk_count
+
+_UINT_LIMITS = {'B': 0xFF, 'H': 0xFFFF}
+
+
+def datetime_to_us(dt: Optional[datetime.datetime]) -> int:
+    if dt is None:
+        return NO_TIMESTAMP
+    delta = dt - EPOCH_UTC
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def us_to_datetime(us: int) -> Optional[datetime.datetime]:
+    if us == NO_TIMESTAMP:
+        return None
+    return EPOCH_UTC + datetime.timedelta(microseconds=us)
+
+
+# --- Encoding ---
+
+def _fits(value: Any, code: str) -> bool:
+    return type(value) is int and 0 <= value <= _UINT_LIMITS[code]
+
+
+def _car_number(car_key: Any) -> Optional[int]:
+    if not isinstance(car_key, str) or not car_key.isdigit():
+        return None
+    car_no = int(car_key)
+    return car_no if str(car_no) == car_key and car_no <= 0xFF else None
+
+
+def _encode_car_data(data: Any, strings: '_StringTable') -> Optional[bytes]:
+    if not isinstance(data, dict) or list(data.keys()) != ['Entries'] or not isinstance(data['Entries'], list):
+        return None
+    entries = data['Entries']
+    if len(entries) > 0xFFFF:
+        return None
+    parts = [_U16.pack(len(entries))]
+    for entry in entries:
+        if not isinstance(entry, dict) or list(entry.keys()) != ['Utc', 'Cars'] or \
+           not isinstance(entry['Utc'], str) or not isinstance(entry['Cars'], dict) or len(entry['Cars']) > 0xFF:
+            return None
+        parts.append(_ENTRY_HEADER.pack(strings.add(entry['Utc']), len(entry['Cars'])))
+        for car_key, car_payload in entry['Cars'].items():
+            car_no = _car_number(car_key)
+            if car_no is None or not isinstance(car_payload, dict) or list(car_payload.keys()) != ['Channels']:
+                return None
+            channels = car_payload['Channels']
+            if not isinstance(channels, dict) or list(channels.keys()) != CAR_DATA_CHANNEL_KEYS:
+                return None
+            rpm, speed, gear, throttle, brake, drs = (channels[k] for k in CAR_DATA_CHANNEL_KEYS)
+            if not (_fits(rpm, 'H') and _fits(speed, 'H') and _fits(gear, 'B') and
+                    _fits(throttle, 'B') and _fits(brake, 'B') and _fits(drs, 'B')):
+                return None
+            parts.append(_CAR_DATA_ROW.pack(car_no, rpm, speed, gear, throttle, brake, drs))
+    return b"".join(parts)
+
+
+def _encode_position(data: Any, strings: '_StringTable') -> Optional[bytes]:
+    if not isinstance(data, dict) or list(data.keys()) != ['Position'] or not isinstance(data['Position'], list):
+        return None
+    entries = data['Position']
+    if len(entries) > 0xFFFF:
+        return None
+    parts = [_U16.pack(len(entries))]
+    for entry in entries:
+        if not isinstance(entry, dict) or list(entry.keys()) != ['Timestamp', 'Entries'] or \
+           not isinstance(entry['Timestamp'], str) or not isinstance(entry['Entries'], dict) or len(entry['Entries']) > 0xFF:
+            return None
+        parts.append(_ENTRY_HEADER.pack(strings.add(entry['Timestamp']), len(entry['Entries'])))
+        for car_key, pos in entry['Entries'].items():
+            car_no = _car_number(car_key)
+            if car_no is None or not isinstance(pos, dict) or list(pos.keys()) != POSITION_CAR_KEYS or \
+               pos['Status'] not in POSITION_STATUSES:
+                return None
+            x, y, z = pos['X'], pos['Y'], pos['Z']
+            if not all(type(v) is int and -2 ** 31 <= v < 2 ** 31 for v in (x, y, z)):
+                return None
+            parts.append(_POSITION_ROW.pack(car_no, POSITION_STATUSES.index(pos['Status']), x, y, z))
+    return b"".join(parts)
+
+
+class _StringTable:
+    def __init__(self):
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.values.append(value)
+            self._index[value] = idx
+        return idx
+
+    def pack(self) -> bytes:
+        parts = [_U32.pack(len(self.values))]
+        for value in self.values:
+            encoded = value.encode('utf-8')
+            parts.append(_U32.pack(len(encoded)))
+            parts.append(encoded)
+        return b"".join(parts)
+
+
+def _encode_chunk(frames: List[Any], stream_table: Dict[str, int], stream_names: List[str]) -> bytes:
+    strings = _StringTable()
+    json_values: List[Any] = []
+    body = [_U32.pack(len(frames))]
+    for frame in frames:
+        body.append(_FRAME_HEADER.pack(frame.line_num, datetime_to_us(frame.pacing_ts),
+                                       1 if frame.is_anchor else 0, len(frame.items)))
+        for item in frame.items:
+            stream_name = item.get("stream")
+            if stream_name not in stream_table:
+                stream_table[stream_name] = len(stream_names)
+                stream_names.append(stream_name)
+            ts_value = item.get("timestamp")
+            ts_idx = strings.add(ts_value if isinstance(ts_value, str) else "")
+            data = item.get("data")
+
+            payload = None
+            kind = KIND_JSON
+            if stream_name == "CarData":
+                payload = _encode_car_data(data, strings)
+                kind = KIND_CAR_DATA
+            elif stream_name == "Position":
+                payload = _encode_position(data, strings)
+                kind = KIND_POSITION
+            if payload is None:
+                kind = KIND_JSON
+                payload = _U32.pack(len(json_values))
+                json_values.append(data)
+
+            body.append(_ITEM_HEADER.pack(stream_table[stream_name], ts_idx, kind))
+            body.append(payload)
+    encoded_json = json.dumps(json_values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return strings.pack() + _U32.pack(len(encoded_json)) + encoded_json + b"".join(body)
+
+
+def write_container(frames: List[Any], dst: Path, source_name: str = "",
+                    chunk_frames: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Writes frames (objects with line_num, pacing_ts, is_anchor and items, e.g. replay_timeline.ReplayFrame)
+    to dst. Returns the container metadata.
+    """
+    chunk_frames = max(1, chunk_frames or config.REPLAY_CONTAINER_CHUNK_FRAMES)
+    stream_table: Dict[str, int] = {}
+    stream_names: List[str] = []
+    index_entries: List[Tuple[int, int, int, int, int]] = []
+    item_count = 0
+
+    tmp_path = dst.with_name(dst.name + ".tmp")
+    with open(tmp_path, 'wb') as out:
+        out.write(MAGIC)
+        for start in range(0, len(frames), chunk_frames):
+            chunk = frames[start:start + chunk_frames]
+            raw = _encode_chunk(chunk, stream_table, stream_names)
+            compressed = zlib.compress(raw, config.REPLAY_CONTAINER_COMPRESSION_LEVEL)
+            first_ts = next((datetime_to_us(f.pacing_ts) for f in chunk if f.pacing_ts is not None), NO_TIMESTAMP)
+            index_entries.append((first_ts, out.tell(), len(compressed), len(raw), len(chunk)))
+            out.write(compressed)
+            item_count += sum(len(f.items) for f in chunk)
+
+        meta = {
+            "version": FORMAT_VERSION,
+            "source": source_name,
+            "streams": stream_names,
+            "frame_count": len(frames),
+            "item_count": item_count,
+            "created_utc": datetime.datetime.now(timezone.utc).isoformat(),
+        }
+        meta_bytes = json.dumps(meta).encode('utf-8')
+        meta_offset = out.tell()
+        out.write(meta_bytes)
+        index_offset = out.tell()
+        for entry in index_entries:
+            out.write(_INDEX_ENTRY.pack(*entry))
+        out.write(_FOOTER.pack(meta_offset, len(meta_bytes), index_offset, len(index_entries)))
+        out.write(MAGIC)
+    tmp_path.replace(dst)
+    return meta
+
+
+# --- Decoding ---
+
+def _decode_car_data(buf: bytes, pos: int, strings: List[str]) -> Tuple[Dict[str, Any], int]:
+    (n_entries,) = _U16.unpack_from(buf, pos); pos += _U16.size
+    entries = []
+    for _ in range(n_entries):
+        utc_idx, n_cars = _ENTRY_HEADER.unpack_from(buf, pos); pos += _ENTRY_HEADER.size
+        cars = {}
+        for car_no, rpm, speed, gear, throttle, brake, drs in _CAR_DATA_ROW.iter_unpack(
+                buf[pos:pos + n_cars * _CAR_DATA_ROW.size]):
+            cars[str(car_no)] = {"Channels": {'0': rpm, '2': speed, '3': gear, '4': throttle, '5': brake, '45': drs}}
+        pos += n_cars * _CAR_DATA_ROW.size
+        entries.append({"Utc": strings[utc_idx], "Cars": cars})
+    return {"Entries": entries}, pos
+
+
+def _decode_position(buf: bytes, pos: int, strings: List[str]) -> Tuple[Dict[str, Any], int]:
+    (n_entries,) = _U16.unpack_from(buf, pos); pos += _U16.size
+    entries = []
+    for _ in range(n_entries):
+        ts_idx, n_cars = _ENTRY_HEADER.unpack_from(buf, pos); pos += _ENTRY_HEADER.size
+        cars = {}
+        for car_no, status, x, y, z in _POSITION_ROW.iter_unpack(buf[pos:pos + n_cars * _POSITION_ROW.size]):
+            cars[str(car_no)] = {"Status": POSITION_STATUSES[status], "X": x, "Y": y, "Z": z}
+        pos += n_cars * _POSITION_ROW.size
+        entries.append({"Timestamp": strings[ts_idx], "Entries": cars})
+    return {"Position": entries}, pos
+
+
+def _decode_chunk(buf: bytes, stream_names: List[str]) -> List[Tuple[int, Optional[datetime.datetime], bool, List[Dict[str, Any]]]]:
+    pos = 0
+    (n_strings,) = _U32.unpack_from(buf, pos); pos += _U32.size
+    strings = []
+    for _ in range(n_strings):
+        (length,) = _U32.unpack_from(buf, pos); pos += _U32.size
+        strings.append(buf[pos:pos + length].decode('utf-8')); pos += length
+    (json_length,) = _U32.unpack_from(buf, pos); pos += _U32.size
+    json_values = json.loads(buf[pos:pos + json_length].decode('utf-8')); pos += json_length
+
+    (n_frames,) = _U32.unpack_from(buf, pos); pos += _U32.size
+    frames = []
+    for _ in range(n_frames):
+        line_num, pacing_us, is_anchor, n_items = _FRAME_HEADER.unpack_from(buf, pos); pos += _FRAME_HEADER.size
+        items = []
+        for _ in range(n_items):
+            stream_idx, ts_idx, kind = _ITEM_HEADER.unpack_from(buf, pos); pos += _ITEM_HEADER.size
+            if kind == KIND_CAR_DATA:
+                data, pos = _decode_car_data(buf, pos, strings)
+            elif kind == KIND_POSITION:
+                data, pos = _decode_position(buf, pos, strings)
+            else:
+                (json_idx,) = _U32.unpack_from(buf, pos); pos += _U32.size
+                data = json_values[json_idx]
+            items.append({"stream": stream_names[stream_idx], "data": data, "timestamp": strings[ts_idx]})
+        frames.append((line_num, us_to_datetime(pacing_us), bool(is_anchor), items))
+    return frames
+
+
+class ContainerReader:
+    """Reads the metadata and chunk index of a container and decodes its chunks on demand."""
+
+    def __init__(self, path: Path):
+        self.path: Path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path.name} is not a replay container")
+            f.seek(-(len(MAGIC) + _FOOTER.size), 2)
+            footer = f.read(_FOOTER.size)
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path.name} is truncated (missing footer)")
+            meta_offset, meta_len, index_offset, chunk_count = _FOOTER.unpack(footer)
+            f.seek(meta_offset)
+            self.meta: Dict[str, Any] = json.loads(f.read(meta_len))
+            f.seek(index_offset)
+            index_bytes = f.read(chunk_count * _INDEX_ENTRY.size)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path.name}: unsupported container version {self.meta.get('version')}")
+        self.index: List[Tuple[int, int, int, int, int]] = list(_INDEX_ENTRY.iter_unpack(index_bytes))
+        self.stream_names: List[str] = self.meta.get("streams", [])
+
+    def chunk_for_timestamp(self, dt: datetime.datetime) -> int:
+        """Returns the index of the last chunk starting at or before dt (0 if dt precedes the recording)."""
+        starts = [entry[0] for entry in self.index]
+        return max(0, bisect.bisect_right(starts, datetime_to_us(dt)) - 1)
+
+    def read_chunk(self, chunk_idx: int, f=None) -> List[Tuple[int, Optional[datetime.datetime], bool, List[Dict[str, Any]]]]:
+        _, offset, compressed_len, raw_len, _ = self.index[chunk_idx]
+        if f is None:
+            with open(self.path, 'rb') as fh:
+                fh.seek(offset)
+                compressed = fh.read(compressed_len)
+        else:
+            f.seek(offset)
+            compressed = f.read(compressed_len)
+        return _decode_chunk(zlib.decompress(compressed), self.stream_names)
+
+    def iter_frames(self, start_chunk: int = 0) -> Iterator[Tuple[int, Optional[datetime.datetime], bool, List[Dict[str, Any]]]]:
+        with open(self.path, 'rb') as f:
+            for chunk_idx in range(start_chunk, len(self.index)):
+                yield from self.read_chunk(chunk_idx, f)
+
+
+def is_container(path: Path) -> bool:
+    return path.suffix == config.REPLAY_CONTAINER_SUFFIX
+
+
+def container_path_for(source_path: Path) -> Path:
+    """Returns the container path that sits next to a `.data.txt` recording."""
+    name = live_recorder.strip_recording_suffix(source_path.name)
+    return source_path.with_name(name + config.REPLAY_CONTAINER_SUFFIX)
+
+
+def convert_replay_file(source_path: Path, dst: Optional[Path] = None) -> Path:
+    """Decodes a `.data.txt` recording once and writes it as a container next to it (or to dst)."""
+    # Local import: replay_timeline loads containers through this module.
+    import replay_timeline
+    dst = dst or container_path_for(source_path)
+    timeline = replay_timeline.ReplayTimeline(source_path).load()
+    meta = write_container(timeline.frames, dst, source_name=source_path.name)
+    src_size = source_path.stat().st_size
+    dst_size = dst.stat().st_size
+    logger.info(
+        f"Converted {source_path.name} -> {dst.name}: {meta['frame_count']} frames, {meta['item_count']} items, "
+        f"{src_size / 1e6:.2f} MB -> {dst_size / 1e6:.2f} MB ({dst_size / max(src_size, 1):.0%})")
+    return dst
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO, format=config.LOG_FORMAT_DEFAULT)
+    parser = argparse.ArgumentParser(description="Convert .data.txt replay recordings to the binary replay container.")
+    parser.add_argument("files", nargs="+", type=Path, help="Recordings to convert")
+    parser.add_argument("--out-dir", type=Path, default=None, help="Directory for the containers (default: next to each source)")
+    cli_args = parser.parse_args()
+    for source in cli_args.files:
+        target = (cli_args.out_dir / container_path_for(source).name) if cli_args.out_dir else None
+        convert_replay_file(source, target)
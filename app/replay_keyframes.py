@@ -0,0 +1,222 @@
+# replay_keyframes.py
+"""
+Keyframe index for seekable replays. A replay timeline is run once, unpaced, through the
+regular data processors on a scratch SessionState, and every
+REPLAY_KEYFRAME_INTERVAL_SECONDS of feed time the processed state (timing, stints, lap
+history, session bests, race control, ...) is captured as a compressed snapshot.
+
+A seek restores the nearest keyframe at or before the target frame into the viewer's
+SessionState and fast-applies only the frames between the keyframe and the target.
+
+Telemetry is not copied into each keyframe. Telemetry arrays only ever grow, so a keyframe
+stores their lengths and a restore copies the builder's final arrays back to those lengths.
+
+The index lives on the shared ReplayTimeline, so it is built once per file and dropped
+together with the timeline when it is evicted.
+"""
+import logging
+import time
+import pickle
+import zlib
+import bisect
+import threading
+from pathlib import Path
+from typing import Any, Optional, List, Dict, Tuple
+
+import app_state
+import config
+import data_processing
+import headless_replay
+import replay_timeline
+import replay_container
+import telemetry_store
+import track_projection
+
+logger = logging.getLogger("F1App.ReplayKeyframes")
+
+# Everything a seek must restore: the processed state plus the lap total remembered by the lap counter.
+KEYFRAME_STATE_FIELDS = app_state.PROCESSED_STATE_FIELDS + ("last_known_total_laps",)
+
+
+def _current_lap(state: app_state.SessionState) -> Optional[int]:
+    """Lap counter from LapCount, or the leader's completed laps + 1 for recordings without it."""
+    lap_count_data = state.data_store.get('LapCount', {}).get('data')
+    if isinstance(lap_count_data, dict):
+        try:
+            return int(lap_count_data.get('CurrentLap'))
+        except (ValueError, TypeError):
+            pass
+    completed_laps = []
+    for driver_state in state.timing_state.values():
+        try:
+            completed_laps.append(int(driver_state.get('NumberOfLaps')))
+        except (ValueError, TypeError):
+            continue
+    return max(completed_laps) + 1 if completed_laps else None
+
+
+class Keyframe:
+    """Processed state after applying frames[0:frame_index] of a timeline."""
+    __slots__ = ("frame_index", "feed_us", "blob", "telemetry_lengths")
+
+    def __init__(self, frame_index: int, feed_us: int, blob: bytes,
+                 telemetry_lengths: Dict[str, Dict[Any, int]]):
+        self.frame_index = frame_index
+        self.feed_us = feed_us
+        self.blob = blob
+        self.telemetry_lengths = telemetry_lengths
+
+
+class KeyframeIndex:
+    def __init__(self, timeline: 'replay_timeline.ReplayTimeline'):
+        self.timeline = timeline
+        self.keyframes: List[Keyframe] = []
+        # Feed time of each frame (running max, so it can be bisected)
+        self.frame_us: List[int] = []
+        # Feed time of the first action frame; seek offsets are relative to it
+        self.start_us: int = replay_container.NO_TIMESTAMP
+        # First frame at which the lap counter reached each lap
+        self.lap_start_frames: Dict[int, int] = {}
+        # Final telemetry of the build run; keyframes slice it back to their lengths
+        self.telemetry = telemetry_store.TelemetryStore()
+        self.build_seconds: float = 0.0
+
+    def build(self) -> 'KeyframeIndex':
+        start_time = time.monotonic()
+        frames = self.timeline.frames
+        scratch = headless_replay.create_headless_state(f"keyframes_{self.timeline.filepath.name}")
+        # Raw samples throughout, so keyframes can slice any lap; restores apply retention
+        scratch.telemetry_data = telemetry_store.TelemetryStore(full_res_laps=0)
+
+        interval_us = int(max(1.0, config.REPLAY_KEYFRAME_INTERVAL_SECONDS) * 1_000_000)
+        last_keyframe_us: Optional[int] = None
+        running_us = replay_container.NO_TIMESTAMP
+
+        self.keyframes.append(self._capture(scratch, 0, running_us))
+        for frame_idx, frame in enumerate(frames):
+            if frame.pacing_ts is not None:
+                running_us = max(running_us, replay_container.datetime_to_us(frame.pacing_ts))
+                if frame.is_anchor and self.start_us == replay_container.NO_TIMESTAMP:
+                    self.start_us = running_us
+                if frame_idx > 0 and (last_keyframe_us is None or running_us - last_keyframe_us >= interval_us):
+                    self.keyframes.append(self._capture(scratch, frame_idx, running_us))
+                    last_keyframe_us = running_us
+            self.frame_us.append(running_us)
+
+            lap_may_change = False
+            for item in frame.items:
+                # Background track fetches are left to the viewers' own sessions
+                data_processing.apply_queue_item(scratch, item)
+                lap_may_change = lap_may_change or item.get("stream") in ("LapCount", "TimingData")
+            if lap_may_change:
+                current_lap = _current_lap(scratch)
+                if current_lap is not None:
+                    self.lap_start_frames.setdefault(current_lap, frame_idx)
+
+        if self.start_us == replay_container.NO_TIMESTAMP:
+            self.start_us = next((us for us in self.frame_us if us != replay_container.NO_TIMESTAMP),
+                                 replay_container.NO_TIMESTAMP)
+        self.telemetry = scratch.telemetry_data
+        self.build_seconds = time.monotonic() - start_time
+        logger.info(
+            f"Keyframes {self.timeline.filepath.name}: Built {len(self.keyframes)} keyframes over "
+            f"{len(frames)} frames in {self.build_seconds:.2f}s "
+            f"({sum(len(k.blob) for k in self.keyframes) / 1e6:.1f} MB compressed, "
+            f"telemetry {self.telemetry.memory_footprint()['bytes'] / 1e6:.1f} MB).")
+        return self
+
+    def _capture(self, state: app_state.SessionState, frame_index: int, feed_us: int) -> Keyframe:
+        with state.lock:
+            snapshot = {field: getattr(state, field) for field in KEYFRAME_STATE_FIELDS}
+            snapshot["last_heartbeat"] = state.app_status.get("last_heartbeat")
+            blob = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL),
+                                 config.REPLAY_KEYFRAME_COMPRESSION_LEVEL)
+            telemetry_lengths = state.telemetry_data.lengths()
+        return Keyframe(frame_index, feed_us, blob, telemetry_lengths)
+
+    # --- Seek targets ---
+
+    @property
+    def duration_seconds(self) -> float:
+        if not self.frame_us or self.start_us == replay_container.NO_TIMESTAMP:
+            return 0.0
+        return max(0.0, (self.frame_us[-1] - self.start_us) / 1e6)
+
+    def frame_for_offset(self, offset_seconds: float) -> int:
+        """Returns the first frame at or after offset_seconds of feed time from the first action frame."""
+        if self.start_us == replay_container.NO_TIMESTAMP:
+            return 0
+        target_us = self.start_us + int(max(0.0, offset_seconds) * 1_000_000)
+        return min(bisect.bisect_left(self.frame_us, target_us), len(self.frame_us))
+
+    def frame_for_lap(self, lap: int) -> Optional[int]:
+        """Returns the frame at which the feed's lap counter reached lap (or the closest lap before it)."""
+        candidate_laps = [known_lap for known_lap in self.lap_start_frames if known_lap <= lap]
+        if not candidate_laps:
+            return None
+        return self.lap_start_frames[max(candidate_laps)]
+
+    def keyframe_for_frame(self, frame_index: int) -> Keyframe:
+        starts = [keyframe.frame_index for keyframe in self.keyframes]
+        return self.keyframes[max(0, bisect.bisect_right(starts, frame_index) - 1)]
+
+    # --- Restore ---
+
+    def restore(self, session_state: app_state.SessionState, keyframe: Keyframe):
+        snapshot = pickle.loads(zlib.decompress(keyframe.blob))
+        telemetry = self.telemetry.truncated(keyframe.telemetry_lengths)
+        telemetry.full_res_laps = config.TELEMETRY_FULL_RES_LAPS
+        telemetry.enforce_retention()
+        last_heartbeat = snapshot.pop("last_heartbeat", None)
+        with session_state.lock:
+            for field, value in snapshot.items():
+                setattr(session_state, field, value)
+            session_state.telemetry_data = telemetry
+            # Projections and mini-sector entry times belong to the pre-seek position
+            session_state.track_positions = track_projection.TrackPositions()
+            session_state.app_status["last_heartbeat"] = last_heartbeat
+            # Everything may have changed; the keyframe's own versions were never rendered by this session
+            session_state.bump_domain_versions()
+
+    def seek(self, session_state: app_state.SessionState, target_frame: int) -> Tuple[Keyframe, int, Optional[Dict[str, Any]]]:
+        """
+        Brings session_state to the state after frames[0:target_frame] and points its replay
+        cursor at target_frame. The caller must make sure nothing else feeds the session meanwhile.
+        Returns (keyframe used, frames fast-applied, last background fetch requested while applying).
+        """
+        target_frame = max(0, min(target_frame, len(self.timeline.frames)))
+        keyframe = self.keyframe_for_frame(target_frame)
+        pending_fetch_info = None
+        with session_state.lock:
+            self.restore(session_state, keyframe)
+            for frame in self.timeline.frames[keyframe.frame_index:target_frame]:
+                for item in frame.items:
+                    pending_fetch_info = data_processing.apply_queue_item(session_state, item) or pending_fetch_info
+            session_state.replay_cursor = target_frame
+        return keyframe, target_frame - keyframe.frame_index, pending_fetch_info
+
+
+def get_keyframe_index(timeline: 'replay_timeline.ReplayTimeline') -> KeyframeIndex:
+    """Returns the keyframe index of a shared timeline, building it on first use."""
+    with timeline.keyframe_lock:
+        if timeline.keyframe_index is None:
+            timeline.keyframe_index = KeyframeIndex(timeline).build()
+        return timeline.keyframe_index
+
+
+def prebuild_keyframes_async(filepath: Path) -> threading.Thread:
+    """Decodes the timeline and builds its keyframes in the background so the first seek is instant."""
+    def _target():
+        try:
+            timeline = replay_timeline.get_timeline(filepath)
+            if timeline is not None:
+                get_keyframe_index(timeline)
+        except Exception as e:
+            logger.error(f"Failed to prebuild replay keyframes for {filepath.name}: {e}", exc_info=True)
+
+    thread = threading.Thread(target=_target, name=f"KeyframeBuild_{filepath.name[:20]}", daemon=True)
+    thread.start()
+    return thread
+
+
+print("DEBUG: replay_keyframes module loaded")
@@ -0,0 +1,269 @@
+# replay_timeline.py
+"""
+Shared, decoded replay timelines. Each replay file is read, JSON-parsed and
+base64+zlib-decoded once into an in-memory list of frames (one frame per file line,
+holding the ready-to-queue items and the line's pacing timestamp). Every session
+replaying the same file shares that timeline and only keeps its own cursor and speed.
+
+Queue items handed out from a timeline are shared between viewers and must be
+treated as read-only by the data processors.
+"""
+import logging
+import json
+import time
+import datetime
+from datetime import timezone
+import threading
+import collections
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Optional, List, Dict, Tuple
+
+import config
+import utils
+import replay_container
+import live_recorder
+
+logger = logging.getLogger("F1App.ReplayTimeline")
+
+
+def _now_feed_timestamp() -> str:
+    return datetime.datetime.now(timezone.utc).isoformat() + 'Z'
+
+
+def extract_queue_items(message_data: Any, log_prefix: str = "") -> List[Dict[str, Any]]:
+    """
+    Converts one raw replay message (R block, list message, heartbeat or M block)
+    into the list of {"stream", "data", "timestamp"} items the data processing loop expects.
+    """
+    items: List[Dict[str, Any]] = []
+    if isinstance(message_data, dict) and "R" in message_data:
+        snapshot_data = message_data.get("R", {})
+        if isinstance(snapshot_data, dict):
+            snapshot_ts = snapshot_data.get("Heartbeat", {}).get("Utc") or _now_feed_timestamp()
+            for stream_name_raw, stream_data in snapshot_data.items():
+                stream_name = stream_name_raw
+                actual_data = stream_data
+                if isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z'):
+                    stream_name = stream_name_raw[:-2]
+                    actual_data = utils._decode_and_decompress(stream_data)
+                    if actual_data is None:
+                        logger.warning(f"{log_prefix}Failed decode {stream_name_raw} in R"); continue
+                if actual_data is not None:
+                    items.append({"stream": stream_name, "data": actual_data, "timestamp": snapshot_ts})
+    elif isinstance(message_data, list) and len(message_data) >= 2:
+        stream_name_raw = message_data[0]
+        data_content = message_data[1]
+        timestamp_for_queue = message_data[2] if len(message_data) > 2 else _now_feed_timestamp()
+        stream_name = stream_name_raw
+        actual_data = data_content
+        if isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z'):
+            stream_name = stream_name_raw[:-2]
+            actual_data = utils._decode_and_decompress(data_content)
+            if actual_data is None:
+                logger.warning(f"{log_prefix}Failed decode {stream_name_raw} list msg"); return items
+        if actual_data is not None:
+            items.append({"stream": stream_name, "data": actual_data, "timestamp": timestamp_for_queue})
+    elif isinstance(message_data, dict) and not message_data:  # Heartbeat {}
+        items.append({"stream": "Heartbeat", "data": {}, "timestamp": _now_feed_timestamp()})
+    elif isinstance(message_data, dict) and "M" in message_data and isinstance(message_data["M"], list):
+        for msg_container in message_data["M"]:
+            if isinstance(msg_container, dict) and msg_container.get("M") == "feed":
+                msg_args = msg_container.get("A")
+                if isinstance(msg_args, list) and len(msg_args) >= 2:
+                    snr = msg_args[0]
+                    dc = msg_args[1]
+                    ts = msg_args[2] if len(msg_args) > 2 else _now_feed_timestamp()
+                    sn = snr
+                    ad = dc
+                    if isinstance(snr, str) and snr.endswith('.z'):
+                        sn = snr[:-2]; ad = utils._decode_and_decompress(dc)
+                    if ad is not None:
+                        items.append({"stream": sn, "data": ad, "timestamp": ts})
+    else:
+        logger.warning(f"{log_prefix}Unknown message structure in replay data: {str(message_data)[:100]}")
+    return items
+
+
+def extract_pacing_info(raw_message: Any) -> Tuple[Optional[str], bool]:
+    """
+    Returns (pacing_timestamp_str, is_anchor) for a raw replay message.
+    M blocks carrying feed messages are "action" anchors and pace on their last feed timestamp;
+    R blocks fall back to the Heartbeat Utc and list messages to their third element.
+    """
+    timestamp_str_for_pacing = None
+    is_anchor = False
+    if isinstance(raw_message, dict) and "M" in raw_message and isinstance(raw_message["M"], list) and len(raw_message["M"]) > 0:
+        if any(isinstance(m, dict) and m.get("M") == "feed" for m in raw_message["M"]):
+            is_anchor = True
+            for msg_container in reversed(raw_message['M']):
+                if isinstance(msg_container, dict) and msg_container.get("M") == "feed":
+                    msg_args = msg_container.get("A")
+                    if isinstance(msg_args, list) and len(msg_args) > 2 and msg_args[2]:
+                        timestamp_str_for_pacing = msg_args[2]; break
+    if not timestamp_str_for_pacing and isinstance(raw_message, dict) and "R" in raw_message and isinstance(raw_message["R"], dict):
+        hb_ts = raw_message.get("R", {}).get("Heartbeat", {}).get("Utc")
+        if hb_ts: timestamp_str_for_pacing = hb_ts
+    if not timestamp_str_for_pacing and isinstance(raw_message, list) and len(raw_message) > 2:
+        timestamp_str_for_pacing = raw_message[2]
+    return timestamp_str_for_pacing, is_anchor
+
+
+class ReplayFrame:
+    """One file line worth of decoded queue items plus its pacing metadata."""
+    __slots__ = ("line_num", "pacing_ts", "is_anchor", "items")
+
+    def __init__(self, line_num: int, pacing_ts: Optional[datetime.datetime], is_anchor: bool,
+                 items: List[Dict[str, Any]]):
+        self.line_num = line_num
+        self.pacing_ts = pacing_ts
+        self.is_anchor = is_anchor
+        self.items = items
+
+
+class ReplayTimeline:
+    """All decoded frames of one replay file. The frames are immutable once loaded."""
+
+    def __init__(self, filepath: Path):
+        self.filepath: Path = filepath
+        self.frames: List[ReplayFrame] = []
+        self.item_count: int = 0
+        self.lines_skipped_json_error: int = 0
+        self.lines_skipped_other: int = 0
+        self.load_seconds: float = 0.0
+        # Seek index built on first use by replay_keyframes.get_keyframe_index
+        self.keyframe_index: Optional[Any] = None
+        self.keyframe_lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def load(self) -> 'ReplayTimeline':
+        if replay_container.is_container(self.filepath):
+            return self._load_container()
+        start_time = time.monotonic()
+        log_prefix = f"Timeline {self.filepath.name}: "
+        for line_num, line in enumerate(live_recorder.iter_recording_lines(self.filepath), 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                raw_message = json.loads(line)
+            except json.JSONDecodeError:
+                self.lines_skipped_json_error += 1
+                if line_num > 10:
+                    logger.warning(f"{log_prefix}Invalid JSON L{line_num} (skipped)")
+                continue
+            try:
+                timestamp_str_for_pacing, is_anchor = extract_pacing_info(raw_message)
+                pacing_ts = None
+                if timestamp_str_for_pacing:
+                    pacing_ts = utils.parse_iso_timestamp_safe(timestamp_str_for_pacing)
+                    if not pacing_ts:
+                        logger.warning(f"{log_prefix}L{line_num} - Failed to parse pacing timestamp: '{timestamp_str_for_pacing}'")
+                items = extract_queue_items(raw_message, log_prefix)
+            except Exception as e_line:
+                self.lines_skipped_other += 1
+                logger.error(f"{log_prefix}Error decoding L{line_num}: {e_line}", exc_info=False)
+                continue
+            if not items:
+                self.lines_skipped_other += 1
+                continue
+            self.frames.append(ReplayFrame(line_num, pacing_ts, is_anchor, items))
+            self.item_count += len(items)
+        self.load_seconds = time.monotonic() - start_time
+        logger.info(
+            f"{log_prefix}Decoded {len(self.frames)} frames ({self.item_count} items) in {self.load_seconds:.2f}s. "
+            f"JSONSkips: {self.lines_skipped_json_error}, OtherSkips: {self.lines_skipped_other}")
+        return self
+
+    def _load_container(self) -> 'ReplayTimeline':
+        start_time = time.monotonic()
+        reader = replay_container.ContainerReader(self.filepath)
+        for line_num, pacing_ts, is_anchor, items in reader.iter_frames():
+            self.frames.append(ReplayFrame(line_num, pacing_ts, is_anchor, items))
+            self.item_count += len(items)
+        self.load_seconds = time.monotonic() - start_time
+        logger.info(
+            f"Timeline {self.filepath.name}: Loaded {len(self.frames)} frames ({self.item_count} items) "
+            f"from container in {self.load_seconds:.2f}s.")
+        return self
+
+
+# --- Process-wide Timeline Cache ---
+_TIMELINES: 'collections.OrderedDict[Tuple[str, int, int], ReplayTimeline]' = collections.OrderedDict()
+_TIMELINES_LOCK = threading.Lock()
+_BUILD_LOCKS: Dict[Tuple[str, int, int], threading.Lock] = {}
+
+
+def resolve_replay_source(filepath: Path) -> Path:
+    """Prefers an up-to-date converted container next to a `.data.txt` recording."""
+    if replay_container.is_container(filepath):
+        return filepath
+    container_path = replay_container.container_path_for(filepath)
+    try:
+        if container_path.is_file() and (not filepath.is_file() or
+                                         container_path.stat().st_mtime_ns >= filepath.stat().st_mtime_ns):
+            return container_path
+    except OSError:
+        pass
+    return filepath
+
+
+def _cache_key(filepath: Path) -> Tuple[str, int, int]:
+    stat = filepath.stat()
+    return (str(filepath.resolve()), stat.st_mtime_ns, stat.st_size)
+
+
+def get_timeline(filepath: Path) -> Optional[ReplayTimeline]:
+    """
+    Returns the shared decoded timeline for filepath, decoding the file on first use.
+    Concurrent first requests for the same file wait for a single decode.
+    Returns None if the file cannot be read.
+    """
+    filepath = resolve_replay_source(filepath)
+    try:
+        key = _cache_key(filepath)
+    except OSError as e:
+        logger.error(f"Cannot stat replay file {filepath}: {e}")
+        return None
+
+    with _TIMELINES_LOCK:
+        timeline = _TIMELINES.get(key)
+        if timeline is not None:
+            _TIMELINES.move_to_end(key)
+            return timeline
+        build_lock = _BUILD_LOCKS.setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _TIMELINES_LOCK:
+            timeline = _TIMELINES.get(key)
+        if timeline is not None:
+            return timeline
+        try:
+            timeline = ReplayTimeline(filepath).load()
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            logger.error(f"Failed to load replay timeline for {filepath}: {e}")
+            return None
+        finally:
+            with _TIMELINES_LOCK:
+                _BUILD_LOCKS.pop(key, None)
+
+        with _TIMELINES_LOCK:
+            # Drop stale versions of the same file (e.g. a recording that was appended to)
+            for stale_key in [k for k in _TIMELINES if k[0] == key[0]]:
+                del _TIMELINES[stale_key]
+            _TIMELINES[key] = timeline
+            while len(_TIMELINES) > max(1, config.REPLAY_TIMELINE_CACHE_MAX_FILES):
+                evicted_key, _ = _TIMELINES.popitem(last=False)
+                logger.info(f"Evicted replay timeline {Path(evicted_key[0]).name} from cache.")
+        return timeline
+
+
+def clear_timeline_cache():
+    with _TIMELINES_LOCK:
+        _TIMELINES.clear()
+
+
+print("DEBUG: replay_timeline module loaded")
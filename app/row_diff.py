@@ -0,0 +1,89 @@
+# row_diff.py
+"""
+Row-level diffs for DataTable 'data' updates.
+
+The timing table callback used to send all ~20 rows (markdown, tyre strings, pit timers...)
+on every tick. It now remembers the rows it emitted to each browser (EmittedRows, kept on
+the browser's own SessionState) and, when the browser's table still holds one of them,
+sends only what changed as a dash.Patch:
+
+  * a cell whose value changed becomes one patch operation (row index, column, value),
+  * a row whose key ('id') moved, i.e. a position change, is replaced as a whole.
+
+diff_rows() returns None for structural changes (no known base, different row count or
+data source), and the callback then sends the full table as before.
+
+Emissions are identified by an id the browser echoes back through its render key store,
+so a reload, a second tab sharing the cookie or a missed response never patches a table
+that does not hold the base rows.
+"""
+import logging
+import itertools
+import threading
+import collections
+from typing import Any, Optional, List, Dict, Tuple
+
+logger = logging.getLogger("F1App.RowDiff")
+
+_EMISSION_COUNTER = itertools.count(1)
+
+# (row index, column or None for the whole row, value)
+RowChange = Tuple[int, Optional[str], Any]
+
+
+def diff_rows(previous_rows: Optional[List[Dict[str, Any]]], rows: List[Dict[str, Any]],
+              key_field: str = 'id') -> Optional[List[RowChange]]:
+    """Changes turning previous_rows into rows, or None if they differ structurally."""
+    if previous_rows is None or len(previous_rows) != len(rows):
+        return None
+    changes: List[RowChange] = []
+    for index, (previous_row, row) in enumerate(zip(previous_rows, rows)):
+        if previous_row == row:
+            continue
+        if previous_row.get(key_field) != row.get(key_field) or previous_row.keys() != row.keys():
+            changes.append((index, None, row))
+            continue
+        for column, value in row.items():
+            if previous_row[column] != value:
+                changes.append((index, column, value))
+    return changes
+
+
+def changed_cells(changes: List[RowChange]) -> int:
+    """Number of cells a list of changes rewrites (a whole row counts all of its cells)."""
+    return sum(len(value) if column is None else 1 for _, column, value in changes)
+
+
+class EmittedRows:
+    """The last few row lists emitted to one browser's table, keyed by emission id."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._lock = threading.Lock()
+        self._emissions: 'collections.OrderedDict[int, Tuple[str, List[Dict[str, Any]]]]' = collections.OrderedDict()
+
+    def remember(self, source_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Stores rows (which must not be mutated afterwards) and returns their emission id."""
+        emission_id = next(_EMISSION_COUNTER)
+        with self._lock:
+            self._emissions[emission_id] = (source_id, rows)
+            while len(self._emissions) > self.capacity:
+                self._emissions.popitem(last=False)
+        return emission_id
+
+    def get(self, emission_id: Optional[int], source_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Rows of emission_id if they are still known and came from the same data source."""
+        if emission_id is None:
+            return None
+        with self._lock:
+            entry = self._emissions.get(emission_id)
+        if entry is None or entry[0] != source_id:
+            return None
+        return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._emissions.clear()
+
+
+print("DEBUG: row_diff module loaded")
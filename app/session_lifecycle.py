@@ -0,0 +1,243 @@
+# session_lifecycle.py
+"""
+Lifecycle of the per-browser SessionStates in app_state.SESSIONS_STORE.
+
+Every get_or_create_session_state() call (i.e. every Dash callback and push stream tick)
+refreshes the session's last_access_monotonic. A background reaper thread then:
+
+  * evicts sessions that have not been accessed for SESSION_IDLE_TTL_SECONDS, and
+  * keeps the estimated memory of all sessions under SESSION_MEMORY_BUDGET_MB by evicting
+    sessions in SESSION_SHED_ORDER ('lru' or 'largest') until the total fits. The shared
+    live hub states (app_state.LIVE_HUB_STATES) count towards the total but are never
+    evicted; they live as long as their hub has subscribers.
+
+Eviction detaches the session from its live hub, stops its replay, connection,
+auto-connect and processing threads, closes its recording and drops it from the store.
+A browser that comes back later simply gets a fresh session.
+
+Sessions that are recording (or have auto-connect enabled, which exists to record
+unattended) are kept while SESSION_EVICT_KEEP_RECORDING is set.
+"""
+import logging
+import sys
+import time
+import threading
+import collections
+from typing import Any, Optional, List, Dict, Tuple
+
+import app_state
+import config
+import live_hub
+import telemetry_store
+
+logger = logging.getLogger("F1App.SessionLifecycle")
+
+_reaper_thread: Optional[threading.Thread] = None
+_reaper_stop = threading.Event()
+
+
+# --- Memory estimate ---
+
+def _deep_sizeof(root: Any) -> int:
+    """sys.getsizeof summed over the JSON-like containers reachable from root, each object counted once."""
+    seen = set()
+    total = 0
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        obj_id = id(obj)
+        if obj_id in seen:
+            continue
+        seen.add(obj_id)
+        if isinstance(obj, telemetry_store.TelemetryStore):
+            total += obj.memory_footprint()["bytes"]
+            continue
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+            stack.extend(obj)
+    return total
+
+
+def estimate_session_bytes(session_state: app_state.SessionState) -> int:
+    """Approximate bytes held by a session's processed state, telemetry and published snapshot."""
+    with session_state.lock:
+        roots = [getattr(session_state, field) for field in app_state.PROCESSED_STATE_FIELDS]
+        roots.append(session_state.telemetry_data)
+        snapshot = session_state.published_snapshot
+    if snapshot is not None:
+        roots.extend(getattr(snapshot, field) for field in app_state.PROCESSED_STATE_FIELDS)
+    return _deep_sizeof(roots)
+
+
+# --- Eviction ---
+
+def _is_pinned(session_state: app_state.SessionState) -> bool:
+    if not config.SESSION_EVICT_KEEP_RECORDING:
+        return False
+    with session_state.lock:
+        return bool(session_state.is_saving_active or session_state.auto_connect_enabled)
+
+
+def stop_session(session_state: app_state.SessionState, join_timeout: float = 5.0):
+    """Signals and joins all of a session's threads, stops its own hub connection and closes its recording."""
+    session_id = session_state.session_id
+    live_hub.detach_session(session_state)
+    with session_state.lock:
+        session_state.stop_event.set()  # Signal all threads for this session
+
+        threads_to_join = []
+        if session_state.connection_thread and session_state.connection_thread.is_alive():
+            threads_to_join.append(
+                ("SignalR Connection", session_state.connection_thread))
+        if session_state.replay_thread and session_state.replay_thread.is_alive():
+            threads_to_join.append(
+                ("Replay", session_state.replay_thread))
+        if session_state.data_processing_thread and session_state.data_processing_thread.is_alive():
+            threads_to_join.append(
+                ("Data Processing", session_state.data_processing_thread))
+        if session_state.auto_connect_thread and session_state.auto_connect_thread.is_alive():
+            threads_to_join.append(
+                ("Auto-Connect Monitor", session_state.auto_connect_thread))
+        if session_state.track_data_fetch_thread and session_state.track_data_fetch_thread.is_alive():
+            threads_to_join.append(
+                ("Track Data Fetch", session_state.track_data_fetch_thread))
+        if session_state.hub_connection:  # Attempt to stop hub directly if part of this session's state
+            try:
+                logger.debug(
+                    f"Session {session_id}: Attempting to stop session's hub_connection directly.")
+                session_state.hub_connection.stop()
+            except Exception as e_hub_stop:
+                logger.error(
+                    f"Session {session_id}: Error stopping session's hub_connection: {e_hub_stop}")
+
+    for thread_name, thread_obj in threads_to_join:
+        logger.info(
+            f"Session {session_id}: Waiting for {thread_name} thread ({thread_obj.name}) to join...")
+        thread_obj.join(timeout=join_timeout)
+        if thread_obj.is_alive():
+            logger.warning(
+                f"Session {session_id}: Thread {thread_obj.name} did not exit cleanly.")
+        else:
+            logger.info(
+                f"Session {session_id}: Thread {thread_obj.name} joined successfully.")
+
+    with session_state.lock:  # Re-acquire lock to nullify handles and close files
+        session_state.connection_thread = None
+        session_state.replay_thread = None
+        session_state.data_processing_thread = None
+        session_state.auto_connect_thread = None
+        session_state.hub_connection = None
+        session_state.track_data_fetch_thread = None
+
+    open_recorder = session_state.take_live_recorder()
+    if open_recorder is not None:  # Drained and joined without holding the session lock
+        try:
+            open_recorder.close()
+            logger.info(
+                f"Session {session_id}: Closed live_data_file.")
+        except Exception as e:
+            logger.error(
+                f"Session {session_id}: Error closing live_data_file: {e}")
+
+
+def evict_session(session_id: str, reason: str, idle_at_least: float = 0.0) -> bool:
+    """
+    Removes a session from SESSIONS_STORE and stops it. Skipped (returns False) if the
+    session was accessed within idle_at_least seconds by the time the store lock is held.
+    """
+    with app_state.SESSIONS_STORE_LOCK:
+        session_state = app_state.SESSIONS_STORE.get(session_id)
+        if session_state is None:
+            return False
+        if time.monotonic() - session_state.last_access_monotonic < idle_at_least:
+            return False
+        del app_state.SESSIONS_STORE[session_id]
+    logger.info(f"Evicting session {session_id[:8]} ({reason}).")
+    try:
+        stop_session(session_state, join_timeout=config.SESSION_EVICT_JOIN_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.error(f"Error stopping evicted session {session_id[:8]}: {e}", exc_info=True)
+    return True
+
+
+def reap_sessions() -> Dict[str, Any]:
+    """One pass of idle eviction and memory budget enforcement. Returns what it did."""
+    now = time.monotonic()
+    with app_state.SESSIONS_STORE_LOCK:
+        sessions = list(app_state.SESSIONS_STORE.items())
+
+    evicted_idle = 0
+    remaining: List[Tuple[str, app_state.SessionState]] = []
+    for session_id, session_state in sessions:
+        idle_seconds = now - session_state.last_access_monotonic
+        if idle_seconds >= config.SESSION_IDLE_TTL_SECONDS and not _is_pinned(session_state):
+            if evict_session(session_id, f"idle for {idle_seconds:.0f}s",
+                             idle_at_least=config.SESSION_IDLE_TTL_SECONDS):
+                evicted_idle += 1
+                continue
+        remaining.append((session_id, session_state))
+
+    sizes = {session_id: estimate_session_bytes(session_state) for session_id, session_state in remaining}
+    with app_state.LIVE_HUB_STATES_LOCK:
+        hub_states = list(app_state.LIVE_HUB_STATES.values())
+    hub_bytes = sum(estimate_session_bytes(hub_state) for hub_state in hub_states)
+    total_bytes = sum(sizes.values()) + hub_bytes
+    budget_bytes = config.SESSION_MEMORY_BUDGET_MB * 1024 * 1024
+    evicted_budget = 0
+    if budget_bytes > 0 and total_bytes > budget_bytes:
+        candidates = [(session_id, session_state) for session_id, session_state in remaining
+                      if not _is_pinned(session_state)]
+        if config.SESSION_SHED_ORDER == "largest":
+            candidates.sort(key=lambda entry: sizes[entry[0]], reverse=True)
+        else:
+            candidates.sort(key=lambda entry: entry[1].last_access_monotonic)
+        for session_id, _ in candidates:
+            if total_bytes <= budget_bytes:
+                break
+            if evict_session(session_id, f"memory budget {total_bytes / 1e6:.0f}/{budget_bytes / 1e6:.0f} MB"):
+                total_bytes -= sizes[session_id]
+                evicted_budget += 1
+        if total_bytes > budget_bytes:
+            logger.warning(
+                f"Sessions still use ~{total_bytes / 1e6:.0f} MB after shedding (budget {budget_bytes / 1e6:.0f} MB); "
+                f"the rest are recording or pinned, and live hubs hold ~{hub_bytes / 1e6:.0f} MB.")
+
+    result = {"sessions": len(remaining) - evicted_budget, "evicted_idle": evicted_idle,
+              "evicted_budget": evicted_budget, "live_hub_mb": round(hub_bytes / 1e6, 1),
+              "estimated_mb": round(total_bytes / 1e6, 1)}
+    if evicted_idle or evicted_budget:
+        logger.info(f"Session reaper: {result}")
+    else:
+        logger.debug(f"Session reaper: {result}")
+    return result
+
+
+def _reaper_loop():
+    logger.info(
+        f"Session reaper started (idle TTL {config.SESSION_IDLE_TTL_SECONDS}s, "
+        f"budget {config.SESSION_MEMORY_BUDGET_MB} MB, shed order '{config.SESSION_SHED_ORDER}').")
+    while not _reaper_stop.wait(config.SESSION_REAPER_INTERVAL_SECONDS):
+        try:
+            reap_sessions()
+        except Exception as e:
+            logger.error(f"Session reaper pass failed: {e}", exc_info=True)
+
+
+def start_session_reaper():
+    """Starts the background reaper thread once per process."""
+    global _reaper_thread
+    if _reaper_thread is not None and _reaper_thread.is_alive():
+        return
+    _reaper_stop.clear()
+    _reaper_thread = threading.Thread(target=_reaper_loop, name="SessionReaper", daemon=True)
+    _reaper_thread.start()
+
+
+def stop_session_reaper():
+    _reaper_stop.set()
+
+
+print("DEBUG: session_lifecycle module loaded")
@@ -18,13 +18,12 @@ import json
 from signalrcore.hub_connection_builder import HubConnectionBuilder
 from signalrcore.protocol.json_hub_protocol import JsonHubProtocol
 from signalrcore.hub.errors import HubConnectionError, HubError
-import queue  # For queue.Full exception
 
 # Local imports
 # app_state will be passed as an argument (session_state) to functions
 import app_state
 import config
-import utils
+import payload_decoder
 
 # Module-level loggers (can still be used, but messages should include session context)
 main_logger = logging.getLogger("F1App.SignalR")  # General SignalR operations
@@ -225,13 +224,8 @@ def on_message_session(session_state: 'app_state.SessionState', args: list):
             live_data_file = session_state.live_data_file
 
         if is_recording_active and live_data_file and not live_data_file.closed:
-            try:
-                # Re-serialize the received message arguments into a JSON string and save.
-                # This creates a replay file with the exact same structure as a raw recording.
-                message_to_save = json.dumps(args)
-                live_data_file.write(message_to_save + "\n")
-            except Exception as e:
-                logger_s_msg.error(f"Failed to write live data to replay file: {e}")
+            # Buffered for the recorder thread, which writes the same JSON lines as a raw recording
+            live_data_file.record(args)
         # --- END: Session-Aware Recording Logic ---
 
 
@@ -250,25 +244,12 @@ def on_message_session(session_state: 'app_state.SessionState', args: list):
                 timestamp_for_queue_str = datetime.datetime.now(
                     datetime.timezone.utc).isoformat() + 'Z'
 
-            stream_name = stream_name_raw
-            actual_data = data_content
-
-            if isinstance(stream_name_raw, str) and stream_name_raw.endswith('.z'):
-                stream_name = stream_name_raw[:-2]
-                actual_data = utils._decode_and_decompress(data_content)
-                if actual_data is None:
-                    logger_s_msg.warning(
-                        f"Failed to decode/decompress data for stream '{stream_name_raw}'. Skipping.")
-                    return
-
-            if actual_data is not None:
-                try:
-                    queue_item = {
-                        "stream": stream_name, "data": actual_data, "timestamp": timestamp_for_queue_str}
-                    session_state.data_queue.put(queue_item, block=False)
-                except queue.Full:
-                    logger_s_msg.warning(
-                        f"Session data queue full! Discarding '{stream_name}' message.")
+            # .z payloads are decoded on the shared decode pool; the stage queues items in arrival order
+            with session_state.lock:
+                if session_state.decode_stage is None:
+                    session_state.decode_stage = payload_decoder.OrderedDecodeStage(session_state)
+                decode_stage = session_state.decode_stage
+            decode_stage.submit(stream_name_raw, data_content, timestamp_for_queue_str)
         else:
             logger_s_msg.warning(
                 f"'feed' received with unexpected arguments structure: {args!r}")
@@ -463,18 +444,17 @@ def stop_connection_session(session_state: 'app_state.SessionState'):
     logger_s.warning(
         f"Conceptual call: replay.close_live_file_session(session_state) for session {sess_id}. Needs implementation.")
     # For now, if live_data_file is managed in session_state directly:
-    with session_state.lock:
-        if session_state.live_data_file and not session_state.live_data_file.closed:
-            try:
-                logger_s.info(
-                    f"Closing live_data_file for session {sess_id} from stop_connection_session.")
-                session_state.live_data_file.close()
-            except Exception as e_file_close:
-                logger_s.error(
-                    f"Error closing live_data_file for session {sess_id}: {e_file_close}")
-            session_state.live_data_file = None
-            session_state.is_saving_active = False
+    open_recorder = session_state.take_live_recorder()
+    if open_recorder is not None:
+        with session_state.lock:
             session_state.current_recording_filename = None
+        try:  # Drained and joined without holding the session lock
+            logger_s.info(
+                f"Closing live_data_file for session {sess_id} from stop_connection_session.")
+            open_recorder.close()
+        except Exception as e_file_close:
+            logger_s.error(
+                f"Error closing live_data_file for session {sess_id}: {e_file_close}")
 
     logger_s.info("Stop connection sequence for session complete.")
 
@@ -0,0 +1,121 @@
+# state_snapshot.py
+"""
+Immutable, versioned snapshots of a session's processed feed state.
+
+The data processing loop publishes a fresh copy of the processed fields
+(app_state.PROCESSED_STATE_FIELDS) after applying a batch, at most once per
+SNAPSHOT_PUBLISH_MIN_INTERVAL_SECONDS. Publishing is a single reference assignment,
+so Dash callbacks read the latest snapshot without taking session_state.lock and
+never stall ingestion. A snapshot is never modified after it is published; readers
+must treat it (including nested dicts and lists) as read-only.
+
+Each snapshot carries a process-wide unique version, so a callback can skip work
+when the version it rendered last is still current. Callbacks that only show part of
+the state compare the per-domain counters instead (domain_version_key).
+
+Control fields that are not written by the processors (app_status, replay_speed,
+recording flags, track_coordinates_cache, telemetry_data) are not part of the snapshot.
+"""
+import logging
+import time
+import itertools
+import collections
+from typing import Any, Optional, Dict
+
+import app_state
+import config
+
+logger = logging.getLogger("F1App.StateSnapshot")
+
+_VERSION_COUNTER = itertools.count(1)
+
+
+def _frozen_copy(value: Any) -> Any:
+    """Recursive copy of the JSON-like containers used in SessionState. Scalars are shared."""
+    value_type = type(value)
+    if value_type is dict:
+        return {k: _frozen_copy(v) for k, v in value.items()}
+    if value_type is list:
+        return [_frozen_copy(v) for v in value]
+    if value_type is collections.deque or value_type is tuple:
+        return tuple(_frozen_copy(v) for v in value)
+    if value_type is set or value_type is frozenset:
+        return frozenset(value)
+    return value
+
+
+def _copy_data_store(data_store: Dict[str, Any]) -> Dict[str, Any]:
+    # Raw stream payloads are never mutated after they are queued, only the per-stream
+    # wrapper dict is (e.g. WeatherData), so the payloads can be shared.
+    return {stream: dict(entry) if type(entry) is dict else entry for stream, entry in data_store.items()}
+
+
+class StateSnapshot:
+    """Read-only copy of the processed fields of a SessionState."""
+    __slots__ = ("version", "published_monotonic") + app_state.PROCESSED_STATE_FIELDS
+
+    def __init__(self, version: int, fields: Dict[str, Any]):
+        self.version = version
+        self.published_monotonic = time.monotonic()
+        for field in app_state.PROCESSED_STATE_FIELDS:
+            setattr(self, field, fields[field])
+
+
+def _build_snapshot(session_state: app_state.SessionState) -> StateSnapshot:
+    with session_state.lock:
+        fields = {}
+        for field in app_state.PROCESSED_STATE_FIELDS:
+            value = getattr(session_state, field)
+            fields[field] = _copy_data_store(value) if field == "data_store" else _frozen_copy(value)
+        # Versions are taken under the lock, so they follow the order of the copied states
+        version = next(_VERSION_COUNTER)
+    return StateSnapshot(version, fields)
+
+
+def publish_snapshot(session_state: app_state.SessionState) -> StateSnapshot:
+    """Copies the processed state and makes it the session's current snapshot."""
+    snapshot = _build_snapshot(session_state)
+    with session_state.lock:
+        current = session_state.published_snapshot
+        # Publishers on other threads (e.g. a replay seek) must not replace a newer copy
+        if current is None or current.version < snapshot.version:
+            session_state.published_snapshot = snapshot
+        session_state.snapshot_dirty = False
+        session_state.last_snapshot_publish_monotonic = snapshot.published_monotonic
+    return session_state.published_snapshot
+
+
+def mark_dirty(session_state: app_state.SessionState):
+    with session_state.lock:
+        session_state.snapshot_dirty = True
+
+
+def publish_if_due(session_state: app_state.SessionState, force: bool = False) -> Optional[StateSnapshot]:
+    """Publishes if there are unpublished changes and the minimum interval has passed (or force)."""
+    if not session_state.snapshot_dirty:
+        return None
+    if not force and time.monotonic() - session_state.last_snapshot_publish_monotonic < config.SNAPSHOT_PUBLISH_MIN_INTERVAL_SECONDS:
+        return None
+    return publish_snapshot(session_state)
+
+
+def domain_version_key(snapshot: StateSnapshot, *domains: str) -> str:
+    """Change key over the given display domains, e.g. for a callback's last-rendered dcc.Store."""
+    return "|".join(f"{domain}:{snapshot.domain_versions.get(domain, 0)}" for domain in domains)
+
+
+_EMPTY_SNAPSHOT: Optional[StateSnapshot] = None
+
+
+def get_snapshot(session_state: app_state.SessionState) -> StateSnapshot:
+    """Returns the latest published snapshot without locking (an empty one before the first publish)."""
+    global _EMPTY_SNAPSHOT
+    snapshot = session_state.published_snapshot
+    if snapshot is not None:
+        return snapshot
+    if _EMPTY_SNAPSHOT is None:
+        _EMPTY_SNAPSHOT = _build_snapshot(app_state.SessionState("empty_snapshot"))
+    return _EMPTY_SNAPSHOT
+
+
+print("DEBUG: state_snapshot module loaded")
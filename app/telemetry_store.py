@@ -0,0 +1,236 @@
+# telemetry_store.py
+"""
+Columnar, array-backed store for per-lap car telemetry (SessionState.telemetry_data).
+
+Each (car, lap) holds one typed array per channel instead of lists of Python objects:
+timestamps as int64 epoch milliseconds and the CarData channels with the typecodes in
+config.TELEMETRY_CHANNEL_TYPECODES (int16 RPM/Speed, int8 Gear, uint8 Throttle/Brake/DRS).
+A sample costs ~15 bytes instead of ~7 list slots pointing at boxed ints and an ISO string.
+array.extend over-allocates like list.append, so appending a CarData batch is amortised O(n).
+
+Missing values are stored as a per-typecode sentinel (MISSING_VALUES): the type's minimum for
+signed arrays, its maximum for unsigned ones. Out-of-range values are clamped just short of it.
+
+Arrays only ever grow, so replay keyframes record lap lengths (lengths()) and a restore
+copies the builder's final arrays back to those lengths (truncated()).
+
+Retention: once a car has more than TELEMETRY_FULL_RES_LAPS laps, its older laps are
+replaced by a min/max envelope (envelope()): every TELEMETRY_ENVELOPE_BUCKET_SAMPLES
+samples become two, holding each channel's minimum and maximum in the order they occurred.
+Peaks, gear changes and DRS openings stay visible in the single-lap telemetry plot while an
+old lap costs 2/TELEMETRY_ENVELOPE_BUCKET_SAMPLES of its full size. Keyframe builders use
+TelemetryStore(full_res_laps=0) so that truncated() still slices raw samples; the restored
+store applies the retention policy itself (enforce_retention()).
+
+LapTelemetry.view() (TelemetryStore.view_lap()) returns zero-copy, read-only memoryviews.
+While a view is alive its array cannot grow (BufferError), so views are only valid while
+session_state.lock is held and must be released before it is; readers that work outside
+the lock take copy_lap() (a memcpy per channel) instead.
+"""
+import logging
+from array import array
+from typing import Any, Optional, List, Dict, Tuple
+
+import config
+
+logger = logging.getLogger("F1App.TelemetryStore")
+
+TIMESTAMP_KEY = 'Timestamps'
+
+MISSING_VALUES: Dict[str, int] = {
+    'b': -2 ** 7, 'h': -2 ** 15, 'i': -2 ** 31, 'q': -2 ** 63,
+    'B': 2 ** 8 - 1, 'H': 2 ** 16 - 1, 'I': 2 ** 32 - 1, 'Q': 2 ** 64 - 1,
+}
+_VALUE_RANGES: Dict[str, tuple] = {
+    typecode: ((missing + 1, -missing - 1) if missing < 0 else (0, missing - 1))
+    for typecode, missing in MISSING_VALUES.items()
+}
+
+
+def _pack(typecode: str, values: List[Any]) -> array:
+    """Typed array of values; None, non-numeric and out-of-range values are sanitised."""
+    try:
+        packed = array(typecode, values)
+        if MISSING_VALUES[typecode] not in packed:
+            return packed
+    except (TypeError, OverflowError):
+        pass
+    missing = MISSING_VALUES[typecode]
+    low, high = _VALUE_RANGES[typecode]
+    sanitised = []
+    for value in values:
+        try:
+            sanitised.append(missing if value is None else min(high, max(low, int(value))))
+        except (TypeError, ValueError):
+            sanitised.append(missing)
+    return array(typecode, sanitised)
+
+
+def _bucket_min_max(values: array, start: int, end: int) -> Tuple[int, int]:
+    """(first, second) of the bucket's min and max in occurrence order, ignoring missing samples."""
+    missing = MISSING_VALUES[values.typecode]
+    low_index = high_index = -1
+    for index in range(start, end):
+        value = values[index]
+        if value == missing:
+            continue
+        if low_index < 0 or value < values[low_index]:
+            low_index = index
+        if high_index < 0 or value > values[high_index]:
+            high_index = index
+    if low_index < 0:
+        return missing, missing
+    if low_index <= high_index:
+        return values[low_index], values[high_index]
+    return values[high_index], values[low_index]
+
+
+class LapTelemetry:
+    """Telemetry of one car for one lap: parallel typed arrays of equal length."""
+    __slots__ = ("timestamps", "channels", "decimated")
+
+    def __init__(self):
+        self.timestamps = array(config.TELEMETRY_TIMESTAMP_TYPECODE)
+        self.channels: Dict[str, array] = {
+            channel: array(typecode) for channel, typecode in config.TELEMETRY_CHANNEL_TYPECODES.items()
+        }
+        self.decimated = False
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append_samples(self, timestamps_ms: List[Optional[int]], channel_values: Dict[str, List[Any]]):
+        """Appends len(timestamps_ms) samples. Channels missing from channel_values (or short) are padded."""
+        sample_count = len(timestamps_ms)
+        if not sample_count:
+            return
+        self.timestamps.extend(_pack(self.timestamps.typecode, timestamps_ms))
+        for channel, values_array in self.channels.items():
+            values = channel_values.get(channel) or []
+            if len(values) != sample_count:
+                values = (list(values) + [None] * sample_count)[:sample_count]
+            values_array.extend(_pack(values_array.typecode, values))
+
+    def truncated(self, length: int) -> 'LapTelemetry':
+        """Independent copy of the first length samples."""
+        lap_copy = LapTelemetry.__new__(LapTelemetry)
+        lap_copy.timestamps = self.timestamps[:length]
+        lap_copy.channels = {channel: values_array[:length] for channel, values_array in self.channels.items()}
+        lap_copy.decimated = self.decimated
+        return lap_copy
+
+    def envelope(self, bucket_samples: int) -> 'LapTelemetry':
+        """Min/max envelope: two samples per bucket_samples, at the bucket's first and last timestamp."""
+        lap_envelope = LapTelemetry()
+        lap_envelope.decimated = True
+        timestamps = self.timestamps
+        for start in range(0, len(self), bucket_samples):
+            end = min(start + bucket_samples, len(self))
+            if end - start == 1:
+                lap_envelope.timestamps.append(timestamps[start])
+                for channel, values_array in self.channels.items():
+                    lap_envelope.channels[channel].append(values_array[start])
+                continue
+            lap_envelope.timestamps.append(timestamps[start])
+            lap_envelope.timestamps.append(timestamps[end - 1])
+            for channel, values_array in self.channels.items():
+                lap_envelope.channels[channel].extend(_bucket_min_max(values_array, start, end))
+        return lap_envelope
+
+    def copy(self) -> 'LapTelemetry':
+        return self.truncated(len(self))
+
+    def view(self, length: Optional[int] = None) -> Dict[str, memoryview]:
+        """Read-only zero-copy views of the first length samples (all by default), keyed TIMESTAMP_KEY and by channel."""
+        length = len(self) if length is None else length
+        views = {TIMESTAMP_KEY: memoryview(self.timestamps).toreadonly()[:length]}
+        views.update({channel: memoryview(values_array).toreadonly()[:length]
+                      for channel, values_array in self.channels.items()})
+        return views
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values_array.itemsize * len(values_array)
+                   for values_array in (self.timestamps, *self.channels.values()))
+
+
+class TelemetryStore:
+    """Per-car, per-lap LapTelemetry. Not thread-safe on its own; guarded by session_state.lock."""
+
+    def __init__(self, full_res_laps: Optional[int] = None):
+        """full_res_laps: laps per car kept at full resolution (default TELEMETRY_FULL_RES_LAPS, 0 keeps all)."""
+        self._cars: Dict[str, Dict[int, LapTelemetry]] = {}
+        self.full_res_laps = config.TELEMETRY_FULL_RES_LAPS if full_res_laps is None else full_res_laps
+
+    def __contains__(self, car: str) -> bool:
+        return car in self._cars
+
+    def cars(self) -> List[str]:
+        return list(self._cars)
+
+    def reset_car(self, car: str):
+        self._cars[car] = {}
+
+    def extend(self, car: str, lap: int, timestamps_ms: List[Optional[int]], channel_values: Dict[str, List[Any]]):
+        laps = self._cars.setdefault(car, {})
+        lap_telemetry = laps.get(lap)
+        if lap_telemetry is None:
+            lap_telemetry = laps[lap] = LapTelemetry()
+            self._apply_retention(car)
+        lap_telemetry.append_samples(timestamps_ms, channel_values)
+
+    def _apply_retention(self, car: str):
+        """Replaces the car's laps older than its newest full_res_laps with their envelopes."""
+        if self.full_res_laps <= 0 or config.TELEMETRY_ENVELOPE_BUCKET_SAMPLES <= 2:
+            return
+        laps = self._cars.get(car, {})
+        if len(laps) <= self.full_res_laps:
+            return
+        for lap in sorted(laps)[:-self.full_res_laps]:
+            lap_telemetry = laps[lap]
+            if not lap_telemetry.decimated:
+                laps[lap] = lap_telemetry.envelope(config.TELEMETRY_ENVELOPE_BUCKET_SAMPLES)
+
+    def enforce_retention(self):
+        for car in self._cars:
+            self._apply_retention(car)
+
+    def laps(self, car: str) -> List[int]:
+        return sorted(self._cars.get(car, {}))
+
+    def lap(self, car: str, lap: int) -> Optional[LapTelemetry]:
+        return self._cars.get(car, {}).get(lap)
+
+    def copy_lap(self, car: str, lap: int) -> Optional[LapTelemetry]:
+        lap_telemetry = self.lap(car, lap)
+        return lap_telemetry.copy() if lap_telemetry is not None else None
+
+    def view_lap(self, car: str, lap: int) -> Optional[Dict[str, memoryview]]:
+        """LapTelemetry.view() of one lap; hold session_state.lock until the views are released."""
+        lap_telemetry = self.lap(car, lap)
+        return lap_telemetry.view() if lap_telemetry is not None else None
+
+    def lengths(self) -> Dict[str, Dict[int, int]]:
+        return {car: {lap: len(lap_telemetry) for lap, lap_telemetry in laps.items()}
+                for car, laps in self._cars.items()}
+
+    def truncated(self, lengths: Dict[str, Dict[int, int]]) -> 'TelemetryStore':
+        """New store holding, for each car and lap in lengths, a copy of that many leading samples."""
+        store = TelemetryStore(self.full_res_laps)
+        for car, laps in lengths.items():
+            store._cars[car] = {lap: self._cars[car][lap].truncated(length) for lap, length in laps.items()}
+        return store
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Cars, laps (and how many are envelopes), samples and array payload bytes held by the store."""
+        laps = [lap_telemetry for car_laps in self._cars.values() for lap_telemetry in car_laps.values()]
+        return {
+            "cars": len(self._cars),
+            "laps": len(laps),
+            "decimated_laps": sum(1 for lap_telemetry in laps if lap_telemetry.decimated),
+            "samples": sum(len(lap_telemetry) for lap_telemetry in laps),
+            "bytes": sum(lap_telemetry.nbytes for lap_telemetry in laps),
+        }
+
+
+print("DEBUG: telemetry_store module loaded")
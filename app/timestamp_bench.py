@@ -0,0 +1,82 @@
+# timestamp_bench.py
+"""
+Benchmark of feed timestamp parsing (utils.parse_iso_timestamp_safe) on a real recording.
+
+Collects the timestamp strings a replay parses, i.e. the message timestamp of every feed
+item plus the 'Utc' of every CarData entry and the 'Timestamp' of every Position entry, in
+feed order, and times per message:
+
+  general   the general-purpose fromisoformat-based parser on its own (the old path)
+  fixed     the fixed-layout feed parser on its own
+  app       parse_iso_timestamp_safe as the app calls it (fixed parser, general fallback)
+
+It also reports how many of the timestamps are distinct. On the Miami race about 86% are,
+which is why the fixed parser is not memoised: an LRU cost more than it saved.
+
+Usage:
+    python timestamp_bench.py replays/Miami_Grand_Prix_Race_20250504_211828.data.txt
+    python timestamp_bench.py replays/Race.data.txt --repeat 5
+"""
+import logging
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import config
+import replay_timeline
+import utils
+
+logger = logging.getLogger("F1App.TimestampBench")
+
+
+def collect_timestamps(filepath: Path) -> List[str]:
+    """Timestamp strings of a recording in the order the processors parse them."""
+    timeline = replay_timeline.ReplayTimeline(filepath).load()
+    timestamps: List[str] = []
+    for frame in timeline.frames:
+        for item in frame.items:
+            if isinstance(item.get("timestamp"), str):
+                timestamps.append(item["timestamp"])
+            data = item.get("data")
+            if not isinstance(data, dict):
+                continue
+            if item.get("stream") == "CarData":
+                timestamps.extend(entry["Utc"] for entry in data.get("Entries", [])
+                                  if isinstance(entry, dict) and isinstance(entry.get("Utc"), str))
+            elif item.get("stream") == "Position":
+                timestamps.extend(entry["Timestamp"] for entry in data.get("Position", [])
+                                  if isinstance(entry, dict) and isinstance(entry.get("Timestamp"), str))
+    return timestamps
+
+
+def time_parser(parse: Callable[[str], object], timestamps: List[str], repeat: int) -> float:
+    """Best-of-repeat seconds per timestamp."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for timestamp_str in timestamps:
+            parse(timestamp_str)
+        best = min(best, time.perf_counter() - start)
+    return best / max(1, len(timestamps))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Time feed timestamp parsing on a replay recording.")
+    parser.add_argument("file", type=Path, help="Replay recording (.data.txt or container)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per parser (best is reported)")
+    cli_args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format=config.LOG_FORMAT_DEFAULT)
+    feed_timestamps = collect_timestamps(cli_args.file)
+    mismatches = sum(1 for timestamp_str in feed_timestamps
+                     if utils.parse_iso_timestamp_safe(timestamp_str) != utils._parse_iso_timestamp_general(timestamp_str))
+    print(f"{len(feed_timestamps)} timestamps, {len(set(feed_timestamps))} distinct, {mismatches} mismatch(es)")
+
+    general_s = None
+    for name, parse in (("general", utils._parse_iso_timestamp_general),
+                        ("fixed", utils._parse_feed_timestamp),
+                        ("app", utils.parse_iso_timestamp_safe)):
+        per_timestamp_s = time_parser(parse, feed_timestamps, cli_args.repeat)
+        general_s = general_s or per_timestamp_s
+        print(f"{name:>9}: {per_timestamp_s * 1e6:6.2f} us/timestamp  ({general_s / per_timestamp_s:5.1f}x)")
@@ -0,0 +1,219 @@
+# track_projection.py
+"""
+Live projection of every car onto the circuit centreline (SessionState.track_positions).
+
+Position frames only carried raw X/Y per car. On every processed Position message,
+TrackPositions projects all cars at once onto the track outline of the session's circuit
+geometry (circuit_geometry.TrackGeometry):
+
+  1. the nearest outline vertex of every car, from the geometry's spatial index (one query),
+  2. the exact projection onto the two segments meeting at that vertex, vectorised over cars,
+
+and keeps the result in fixed-size arrays indexed by car row: distance along the lap (in
+track coordinate units, see TRACK_COORDINATE_UNITS_PER_METRE), track fraction [0, 1),
+distance off the centreline and the frame's timestamp.
+
+On top of that it times TRACK_MINI_SECTORS equal-length mini sectors: when a car's mini
+sector changes (forwards, with wrap-around at the line), the time since it entered the
+previous one is recorded.
+
+Queries (gap_ahead_m, cars_near, snapshot) read the arrays; take session_state.lock.
+"""
+import logging
+from typing import Any, Optional, List, Dict, Tuple
+
+import config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+logger = logging.getLogger("F1App.TrackProjection")
+
+_MISSING_MS = -1
+
+# Per-car arrays of TrackPositions: (dtype, fill value, one column per mini sector)
+_ARRAYS = {
+    "distance": ('float64', float('nan'), False),
+    "fraction": ('float64', float('nan'), False),
+    "offset": ('float64', float('nan'), False),
+    "timestamp_ms": ('int64', _MISSING_MS, False),
+    "mini_sector": ('int32', -1, False),
+    "mini_sector_entry_ms": ('int64', _MISSING_MS, False),
+    "mini_sector_times_ms": ('int64', _MISSING_MS, True),
+}
+
+
+class _Centreline:
+    """Segment start points, directions and cumulative lengths of a closed track outline."""
+
+    def __init__(self, track_geometry: Any):
+        points = track_geometry.points
+        closing_gap = np.hypot(*(points[0] - points[-1]))
+        # Close the loop unless the outline already ends where it starts
+        ends = np.vstack((points[1:], points[:1])) if closing_gap > 0 else points[1:]
+        starts = points[:len(ends)]
+        self.starts = starts
+        self.directions = ends - starts
+        self.lengths = np.hypot(self.directions[:, 0], self.directions[:, 1])
+        self.squared_lengths = np.where(self.lengths > 0, self.lengths ** 2, 1.0)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(self.lengths)[:-1]))
+        self.total_length = float(self.lengths.sum())
+        self.segment_count = len(starts)
+
+
+class TrackPositions:
+    """Lap distance, track fraction and mini-sector times of every car, as arrays."""
+
+    def __init__(self, capacity: int = 32):
+        self.capacity = capacity
+        self.rows: Dict[str, int] = {}
+        self._track_geometry: Any = None
+        self._centreline: Optional[_Centreline] = None
+        self.mini_sectors = max(1, config.TRACK_MINI_SECTORS)
+        self._allocate()
+
+    def _allocate(self):
+        if np is None:
+            return
+        for name, (dtype, fill, per_mini_sector) in _ARRAYS.items():
+            shape = (self.capacity, self.mini_sectors) if per_mini_sector else (self.capacity,)
+            setattr(self, name, np.full(shape, fill, dtype=dtype))
+
+    @property
+    def track_length(self) -> Optional[float]:
+        return self._centreline.total_length if self._centreline is not None else None
+
+    def _bind(self, track_geometry: Any):
+        """Switches to another circuit's geometry; everything measured on the old one is dropped."""
+        self._track_geometry = track_geometry
+        self._centreline = _Centreline(track_geometry) if track_geometry is not None and len(track_geometry) > 1 else None
+        self.rows = {}
+        self._allocate()
+
+    def _rows_for(self, car_numbers: List[str]) -> 'np.ndarray':
+        for car_number in car_numbers:
+            if car_number not in self.rows:
+                if len(self.rows) == self.capacity:
+                    self._grow()
+                self.rows[car_number] = len(self.rows)
+        return np.fromiter((self.rows[car_number] for car_number in car_numbers), dtype=np.intp, count=len(car_numbers))
+
+    def _grow(self):
+        old_capacity = self.capacity
+        old_arrays = {name: getattr(self, name) for name in _ARRAYS}
+        self.capacity *= 2
+        self._allocate()
+        for name, old_array in old_arrays.items():
+            getattr(self, name)[:old_capacity] = old_array
+
+    def update(self, track_geometry: Any, car_numbers: List[str], xs: List[Any], ys: List[Any],
+               timestamp_ms: Optional[int]) -> int:
+        """
+        Projects the given cars' X/Y onto the track. Cars with missing coordinates are left as
+        they were. Returns how many cars were projected (0 without track geometry or numpy).
+        """
+        if np is None or track_geometry is None:
+            return 0
+        if track_geometry is not self._track_geometry:
+            self._bind(track_geometry)
+        centreline = self._centreline
+        if centreline is None or not car_numbers:
+            return 0
+
+        query_x = np.array([x if isinstance(x, (int, float)) else np.nan for x in xs], dtype=float)
+        query_y = np.array([y if isinstance(y, (int, float)) else np.nan for y in ys], dtype=float)
+        valid = ~(np.isnan(query_x) | np.isnan(query_y))
+        if not valid.any():
+            return 0
+        rows = self._rows_for([car_number for car_number, is_valid in zip(car_numbers, valid) if is_valid])
+        points = np.column_stack((query_x[valid], query_y[valid]))
+
+        # Candidate segments: the two that meet at each car's nearest outline vertex
+        nearest_vertex = track_geometry.nearest_indices(points[:, 0], points[:, 1])
+        candidates = np.stack(((nearest_vertex - 1) % centreline.segment_count,
+                               np.minimum(nearest_vertex, centreline.segment_count - 1)), axis=1)
+        starts = centreline.starts[candidates]                       # (cars, 2, xy)
+        directions = centreline.directions[candidates]
+        t = np.einsum('ijk,ijk->ij', points[:, None, :] - starts, directions) / centreline.squared_lengths[candidates]
+        t = np.clip(t, 0.0, 1.0)
+        projected = starts + t[:, :, None] * directions
+        offsets_squared = ((points[:, None, :] - projected) ** 2).sum(axis=2)
+        best = np.argmin(offsets_squared, axis=1)
+        car_index = np.arange(len(points))
+        best_segment = candidates[car_index, best]
+
+        distance = centreline.cumulative[best_segment] + t[car_index, best] * centreline.lengths[best_segment]
+        self.distance[rows] = distance
+        self.fraction[rows] = distance / centreline.total_length
+        self.offset[rows] = np.sqrt(offsets_squared[car_index, best])
+        if timestamp_ms is not None:
+            self._time_mini_sectors(rows, timestamp_ms)
+            self.timestamp_ms[rows] = timestamp_ms
+        return len(rows)
+
+    def _time_mini_sectors(self, rows: 'np.ndarray', timestamp_ms: int):
+        # Time went backwards for these cars (e.g. a replay seek): their entry times are meaningless now
+        rewound = rows[(self.timestamp_ms[rows] != _MISSING_MS) & (self.timestamp_ms[rows] > timestamp_ms)]
+        self.mini_sector_entry_ms[rewound] = _MISSING_MS
+        new_sector = np.minimum((self.fraction[rows] * self.mini_sectors).astype(np.int32), self.mini_sectors - 1)
+        old_sector = self.mini_sector[rows]
+        # Forward by one sector (including across the line) completes the old sector; anything else restarts timing
+        completed = (old_sector >= 0) & (new_sector == (old_sector + 1) % self.mini_sectors)
+        changed = new_sector != old_sector
+        timed_rows = rows[completed]
+        entry_ms = self.mini_sector_entry_ms[timed_rows]
+        has_entry = (entry_ms != _MISSING_MS) & (timestamp_ms - entry_ms > 0)
+        self.mini_sector_times_ms[timed_rows[has_entry], old_sector[completed][has_entry]] = timestamp_ms - entry_ms[has_entry]
+        self.mini_sector_entry_ms[rows[completed]] = timestamp_ms
+        self.mini_sector_entry_ms[rows[changed & ~completed]] = _MISSING_MS  # Entered mid-sector or jumped
+        self.mini_sector[rows] = new_sector
+
+    # --- Queries ---
+
+    def gap_ahead_m(self, car_number: str, car_ahead_number: str) -> Optional[float]:
+        """Track distance in metres from car_number forward to car_ahead_number (wrapping at the line)."""
+        if self._centreline is None or car_number not in self.rows or car_ahead_number not in self.rows:
+            return None
+        gap = self.distance[self.rows[car_ahead_number]] - self.distance[self.rows[car_number]]
+        if np.isnan(gap):
+            return None
+        return float(gap % self._centreline.total_length) / config.TRACK_COORDINATE_UNITS_PER_METRE
+
+    def cars_near(self, car_number: str, within_m: float) -> List[Tuple[str, float]]:
+        """Cars within within_m metres along the track, as (car, signed metres: + ahead, - behind), nearest first."""
+        if self._centreline is None or car_number not in self.rows:
+            return []
+        total_length = self._centreline.total_length
+        row_count = len(self.rows)
+        signed = (self.distance[:row_count] - self.distance[self.rows[car_number]] + total_length / 2) \
+            % total_length - total_length / 2
+        signed_m = signed / config.TRACK_COORDINATE_UNITS_PER_METRE
+        cars_by_row = list(self.rows)
+        near = [(cars_by_row[row], float(signed_m[row])) for row in np.flatnonzero(np.abs(signed_m) <= within_m)
+                if cars_by_row[row] != car_number]
+        return sorted(near, key=lambda entry: abs(entry[1]))
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Plain per-car values: distance_m, fraction, offset_m, mini_sector and the last mini-sector times (ms)."""
+        if np is None:
+            return {}
+        units = config.TRACK_COORDINATE_UNITS_PER_METRE
+        result = {}
+        for car_number, row in self.rows.items():
+            if np.isnan(self.distance[row]):
+                continue
+            result[car_number] = {
+                "distance_m": float(self.distance[row]) / units,
+                "fraction": float(self.fraction[row]),
+                "offset_m": float(self.offset[row]) / units,
+                "mini_sector": int(self.mini_sector[row]),
+                "mini_sector_times_ms": [None if value == _MISSING_MS else int(value)
+                                         for value in self.mini_sector_times_ms[row]],
+                "timestamp_ms": None if self.timestamp_ms[row] == _MISSING_MS else int(self.timestamp_ms[row]),
+            }
+        return result
+
+
+print("DEBUG: track_projection module loaded")
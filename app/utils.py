@@ -11,7 +11,6 @@ import datetime  # Use direct import
 from datetime import timezone  # Use direct import
 import re
 from pathlib import Path
-import requests
 from typing import Dict, Optional, List, Any, Tuple  # For type hints
 
 # Import for F1 Schedule / Data (conditionally)
@@ -27,6 +26,8 @@ except ImportError:
 # Import config for constants and app_state for SessionState type hint
 import config
 import app_state  # Required for app_state.SessionState type hint
+import circuit_geometry
+import downsample
 
 # Shapely and numpy are for track map processing
 try:
@@ -39,18 +40,31 @@ except ImportError:
     np = None  # type: ignore
 
 import plotly.graph_objects as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 
 logger = logging.getLogger("F1App.Utils")
 
 # --- Utility Functions (Many can remain as is if they are pure or use config) ---
 
-def create_telemetry_comparison_chart(session, driver1_tla, lap1_num, driver2_tla, lap2_num, use_mph=False):
+def _telemetry_trace(trace_class, x, y, indices, **kwargs):
+    """One telemetry trace with only the downsampled samples (indices) of its x/y arrays."""
+    return trace_class(x=x[indices], y=y[indices], **kwargs)
+
+
+def create_telemetry_comparison_chart(session, driver1_tla, lap1_num, driver2_tla, lap2_num, use_mph=False,
+                                      max_points=None, use_webgl=None):
     """
     Creates a detailed, multi-panel telemetry comparison chart between two laps.
+
+    Every trace is limited to max_points samples (default TELEMETRY_CHART_MAX_POINTS; 0 keeps
+    full resolution): continuous channels with LTTB, gear, brake and DRS by their change
+    points (downsample.py). use_webgl (default TELEMETRY_CHART_WEBGL) draws them with Scattergl.
     """
     try:
+        max_points = config.TELEMETRY_CHART_MAX_POINTS if max_points is None else max_points
+        use_webgl = config.TELEMETRY_CHART_WEBGL if use_webgl is None else use_webgl
+        trace_class = go.Scattergl if use_webgl else go.Scatter
+
         lap1 = session.laps.pick_driver(driver1_tla).pick_lap(lap1_num)
         lap2 = session.laps.pick_driver(driver2_tla).pick_lap(lap2_num)
 
@@ -67,48 +81,60 @@ def create_telemetry_comparison_chart(session, driver1_tla, lap1_num, driver2_tl
         color1 = get_color_from_team_name(team_name1)
         color2 = get_color_from_team_name(team_name2)
         # --- END: THE FINAL, CORRECTED COLOR LOGIC ---
+
+        # --- Channels as arrays, transformed in one vectorised step each ---
+        speed_factor = config.KPH_TO_MPH_FACTOR if use_mph else 1.0
+        channels = []
+        for tel in (tel1, tel2):
+            distance = tel['Distance'].to_numpy(dtype=float)
+            channel = {
+                'Distance': distance,
+                'Speed': tel['Speed'].to_numpy(dtype=float) * speed_factor,
+                'Throttle': tel['Throttle'].to_numpy(dtype=float),
+                'Brake': tel['Brake'].to_numpy(dtype=float),
+                'nGear': tel['nGear'].to_numpy(dtype=float),
+                'RPM': tel['RPM'].to_numpy(dtype=float),
+                'DRS': np.isin(tel['DRS'].to_numpy(), (10, 12, 14)).astype(np.int8),  # Open flap states
+            }
+            channel['smooth'] = {name: downsample.lttb_indices(distance, channel[name], max_points)
+                                 for name in ('Speed', 'Throttle', 'RPM')}
+            channel['steps'] = {name: downsample.step_indices(channel[name], max_points, distance)
+                                for name in ('Brake', 'nGear', 'DRS')}
+            channels.append(channel)
         
         fig = make_subplots(rows=7, cols=1, shared_xaxes=True, vertical_spacing=0.03,
                             subplot_titles=("Speed", "Throttle", "Brake", "Gear", "RPM", "DRS", "Time Delta"))
 
-        # --- Speed Trace (Row 1) ---
+        lap_labels = (f"{driver1_tla} (Lap {lap1_num})", f"{driver2_tla} (Lap {lap2_num})")
+        for channel, color, lap_label in zip(channels, (color1, color2), lap_labels):
+            distance, smooth, steps = channel['Distance'], channel['smooth'], channel['steps']
+            # --- Speed Trace (Row 1) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['Speed'], smooth['Speed'], mode='lines', name=lap_label, line=dict(color=color, width=0.75)), row=1, col=1)
+            # --- Throttle Trace (Row 2) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['Throttle'], smooth['Throttle'], mode='lines', line=dict(color=color, width=0.75), showlegend=False), row=2, col=1)
+            # --- Brake Trace (Row 3) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['Brake'], steps['Brake'], mode='lines', line=dict(color=color, width=0.75, shape='hv'), showlegend=False), row=3, col=1)
+            # --- Gear Trace (Row 4) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['nGear'], steps['nGear'], mode='lines', line=dict(color=color, width=0.75, shape='hv'), showlegend=False), row=4, col=1)
+            # --- RPM Trace (Row 5) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['RPM'], smooth['RPM'], mode='lines', line=dict(color=color, width=0.75), showlegend=False), row=5, col=1)
+            # --- DRS Trace (Row 6) ---
+            fig.add_trace(_telemetry_trace(trace_class, distance, channel['DRS'], steps['DRS'], mode='lines', line=dict(color=color, shape='hv', width=0.75), showlegend=False), row=6, col=1)
+
         speed_unit = "MPH" if use_mph else "KPH"
-        speed1 = convert_kph_to_mph(tel1['Speed']) if use_mph else tel1['Speed']
-        speed2 = convert_kph_to_mph(tel2['Speed']) if use_mph else tel2['Speed']
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=speed1, mode='lines', name=f"{driver1_tla} (Lap {lap1_num})", line=dict(color=color1, width=0.75)), row=1, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=speed2, mode='lines', name=f"{driver2_tla} (Lap {lap2_num})", line=dict(color=color2, width=0.75)), row=1, col=1)
         fig.update_yaxes(title_text=speed_unit, row=1, col=1, title_standoff=10)
-
-        # --- Throttle Trace (Row 2) ---
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=tel1['Throttle'], mode='lines', line=dict(color=color1, width=0.75), showlegend=False), row=2, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=tel2['Throttle'], mode='lines', line=dict(color=color2, width=0.75), showlegend=False), row=2, col=1)
         fig.update_yaxes(title_text="%", range=[0, 105], row=2, col=1, title_standoff=25)
-
-        # --- Brake Trace (Row 3) ---
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=tel1['Brake'], mode='lines', line=dict(color=color1, width=0.75), showlegend=False), row=3, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=tel2['Brake'], mode='lines', line=dict(color=color1, width=0.75), showlegend=False), row=3, col=1)
         fig.update_yaxes(title_text="%", range=[0, 1.1], row=3, col=1, title_standoff=25, tickvals=[0, 1], ticktext=["OFF", "ON"])
-
-        # --- Gear Trace (Row 4) ---
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=tel1['nGear'], mode='lines', line=dict(color=color1,width=0.75, shape='hv'), showlegend=False), row=4, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=tel2['nGear'], mode='lines', line=dict(color=color2, width=0.75, shape='hv'), showlegend=False), row=4, col=1)
         fig.update_yaxes(title_text="Gear", row=4, col=1, title_standoff=20)
-
-        # --- RPM Trace (Row 5) ---
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=tel1['RPM'], mode='lines', line=dict(color=color1, width=0.75), showlegend=False), row=5, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=tel2['RPM'], mode='lines', line=dict(color=color2, width=0.75), showlegend=False), row=5, col=1)
         fig.update_yaxes(title_text="RPM", row=5, col=1, title_standoff=15)
-
-        # --- DRS Trace (Row 6) ---
-        drs1 = [1 if val in [10, 12, 14] else 0 for val in tel1['DRS']]
-        drs2 = [1 if val in [10, 12, 14] else 0 for val in tel2['DRS']]
-        fig.add_trace(go.Scatter(x=tel1['Distance'], y=drs1, mode='lines', line=dict(color=color1, shape='hv', width=0.75), showlegend=False), row=6, col=1)
-        fig.add_trace(go.Scatter(x=tel2['Distance'], y=drs2, mode='lines', line=dict(color=color2, shape='hv', width=0.75), showlegend=False), row=6, col=1)
         fig.update_yaxes(tickvals=[0, 1], ticktext=["Off", "On"], row=6, col=1, title_standoff=20)
 
         # --- Delta Time Trace (Row 7) ---
         delta_time, ref_tel, comp_tel = fastf1.utils.delta_time(lap1, lap2)
-        fig.add_trace(go.Scatter(x=ref_tel['Distance'], y=delta_time, mode='lines', name='Time Delta', line=dict(color='white')), row=7, col=1)
+        delta_distance = ref_tel['Distance'].to_numpy(dtype=float)
+        delta_values = np.asarray(delta_time, dtype=float)
+        delta_indices = downsample.lttb_indices(delta_distance, delta_values, max_points)
+        fig.add_trace(_telemetry_trace(trace_class, delta_distance, delta_values, delta_indices, mode='lines', name='Time Delta', line=dict(color='white')), row=7, col=1)
         fig.update_yaxes(title_text="Delta (s)", row=7, col=1, title_standoff=10)
         
         # --- Final Layout Updates ---
@@ -130,59 +156,43 @@ def create_telemetry_comparison_chart(session, driver1_tla, lap1_num, driver2_tl
         return go.Figure(layout={'template': 'plotly_dark', 'annotations': [{'text': 'Could not generate telemetry comparison.', 'showarrow': False}]})
 
 
-def create_tyre_degradation_chart(stint_laps_df: pd.DataFrame):
+def create_tyre_degradation_chart(stint: Optional[Dict[str, Any]]):
     """
     Creates a scatter plot of lap times within a single stint to visualize
-    tyre degradation, including a trend line calculated manually with NumPy.
+    tyre degradation, with the stint's trend line (historical_analytics stint summary).
     """
-    if stint_laps_df.empty or len(stint_laps_df) < 2:
+    if not stint or len(stint['lap_seconds']) < 2:
         return go.Figure(layout={
             'template': 'plotly_dark',
             'annotations': [{'text': 'Not enough valid laps for this stint.', 'showarrow': False, 'font': {'size': 12}}]
         })
 
-    # Get stint info from the first lap
-    driver = stint_laps_df['Driver'].iloc[0]
-    compound = stint_laps_df['Compound'].iloc[0]
-    stint_num = stint_laps_df['Stint'].iloc[0]
-    team_name = stint_laps_df['Team'].iloc[0]
-    color = get_color_from_team_name(team_name)
+    driver = stint['driver']
+    compound = stint['compound']
+    stint_num = int(stint['stint'])
+    color = get_color_from_team_name(stint['team'] or '')
 
     # Create the base scatter plot
-    fig = px.scatter(
-        stint_laps_df,
-        x="TyreLife",
-        y="LapTime",
-    )
-    
-    fig.update_traces(marker=dict(color=color, size=8), hovertemplate="Lap Time: %{y:|.3f}s<br>Laps on Tyre: %{x}<extra></extra>")
-
-    # --- START: Manual Trendline Calculation using NumPy ---
-    try:
-        # Prepare data, ensuring we have at least 2 points for a line
-        valid_laps = stint_laps_df.dropna(subset=['TyreLife', 'LapTime'])
-        if len(valid_laps) >= 2:
-            x_data = valid_laps["TyreLife"].to_numpy(dtype=float)
-            y_data = valid_laps["LapTime"].to_numpy(dtype=float)
-
-            # Use numpy's polyfit to get the slope (m) and intercept (b) of a 1st-degree polynomial
-            slope, intercept = np.polyfit(x_data, y_data, 1)
-
-            # Create the trend line coordinates from the fit
-            x_trend = np.array([x_data.min(), x_data.max()])
-            y_trend = intercept + slope * x_trend
-            
-            # Add the trend line as a new trace
-            fig.add_trace(go.Scatter(
-                x=x_trend,
-                y=y_trend,
-                mode='lines',
-                name=f'Deg: {slope:+.3f}s/lap',
-                line=dict(color='white', width=2, dash='dash')
-            ))
-    except Exception as e:
-        logger.error(f"Could not calculate numpy trend line for {driver} stint {stint_num}: {e}")
-    # --- END: Manual Trendline Calculation ---
+    fig = go.Figure(go.Scatter(
+        x=stint['tyre_life'],
+        y=stint['lap_seconds'],
+        mode='markers',
+        showlegend=False,
+        marker=dict(color=color, size=8),
+        hovertemplate="Lap Time: %{y:.3f}s<br>Laps on Tyre: %{x}<extra></extra>"
+    ))
+
+    # Trend line from the least-squares fit computed when the session was loaded
+    if stint['slope'] is not None:
+        x_trend = np.array([min(stint['tyre_life']), max(stint['tyre_life'])])
+        y_trend = stint['intercept'] + stint['slope'] * x_trend
+        fig.add_trace(go.Scatter(
+            x=x_trend,
+            y=y_trend,
+            mode='lines',
+            name=f"Deg: {stint['slope']:+.3f}s/lap",
+            line=dict(color='white', width=2, dash='dash')
+        ))
 
     fig.update_layout(
         template='plotly_dark',
@@ -208,27 +218,21 @@ def get_color_from_team_name(team_name: str) -> str:
     # Fallback to grey if no match is found
     return '#808080'
 
-def create_lap_position_chart(laps_df: pd.DataFrame, session_year: int):
+def create_lap_position_chart(position_traces: List[Dict[str, Any]]):
     """
-    Creates a line chart showing the position of each driver on every lap.
+    Creates a line chart showing the position of each driver on every lap
+    (historical_analytics position traces, in legend order).
     """
-    if laps_df.empty:
+    if not position_traces:
         return go.Figure(layout={'template': 'plotly_dark', 'annotations': [{'text': 'No lap data available for this session.', 'showarrow': False}]})
 
     fig = go.Figure()
     
-    drivers_by_tla = laps_df.sort_values(by='Position')['Driver'].unique()
-    
     teams_plotted = set()
     marker_symbols = ['circle', 'cross'] # Use different markers for teammatesdriver of a team
 
-    for driver_tla in drivers_by_tla:
-        driver_laps = laps_df[laps_df['Driver'] == driver_tla]
-        
-        if driver_laps.empty:
-            continue
-            
-        team_name = driver_laps['Team'].iloc[0]
+    for trace in position_traces:
+        team_name = trace['team'] or ''
         color = get_color_from_team_name(team_name)
 
         # --- Determine which marker symbol to use ---
@@ -240,9 +244,9 @@ def create_lap_position_chart(laps_df: pd.DataFrame, session_year: int):
         # --- END OF DETERMINING SYMBOL ---
         
         fig.add_trace(go.Scatter(
-            x=driver_laps['LapNumber'],
-            y=driver_laps['Position'],
-            name=driver_tla,
+            x=trace['laps'],
+            y=trace['positions'],
+            name=trace['driver'],
             mode='lines+markers',
             line=dict(color=color), # Line is always solid
             marker=dict(size=5, color=color, symbol=symbol_to_use) # Apply symbol
@@ -465,6 +469,7 @@ def prepare_car_data_updates(actual_data_payload: Dict[str, Any],
     """
     Parses CarData payload and prepares updates for car data and telemetry.
     Relies on timing_state_snapshot_for_laps for NumberOfLaps.
+    Telemetry 'Timestamps' are epoch milliseconds (see telemetry_store.py).
     """
     logger_prep = logging.getLogger("F1App.Utils.PrepCarData")
     car_specific_updates: Dict[str, Any] = {}
@@ -485,6 +490,7 @@ def prepare_car_data_updates(actual_data_payload: Dict[str, Any],
         if not isinstance(entry, dict):
             continue
         utc_time = entry.get('Utc')
+        utc_time_ms = convert_utc_str_to_epoch_ms(utc_time)
         cars_data_from_payload = entry.get('Cars', {})
         if not isinstance(cars_data_from_payload, dict):
             continue
@@ -526,7 +532,7 @@ def prepare_car_data_updates(actual_data_payload: Dict[str, Any],
                 ], **{key: [] for key in config.CHANNEL_MAP.values()}}  # type: ignore
 
             lap_telemetry_update_ref = telemetry_specific_updates[telemetry_key]
-            lap_telemetry_update_ref['Timestamps'].append(utc_time)
+            lap_telemetry_update_ref['Timestamps'].append(utc_time_ms)
             for channel_num_str_cfg, data_key_cfg in config.CHANNEL_MAP.items():
                 value = channels_payload.get(channel_num_str_cfg)
                 if data_key_cfg in ['RPM', 'Speed', 'Gear', 'Throttle', 'Brake', 'DRS']:
@@ -626,10 +632,7 @@ def prepare_session_info_data(raw_session_info_data: Dict[str, Any],
 
 
 def _fetch_track_data_for_cache(session_key: str, year: Optional[str], circuit_key: Optional[str]) -> Optional[Dict[str, Any]]:
-    """ Fetches track data from MultiViewer API. Returns data dict or None. """
-    # (This function's internal logic remains the same as your version, it doesn't use app_state)
-    # Ensure it uses a general logger like 'logger' or 'logging.getLogger("F1App.Utils.TrackFetch")'
-    # Removed 'main_logger' to consolidate.
+    """ Track map cache for a session from the shared circuit geometry cache. Returns data dict or None. """
     fetch_logger = logging.getLogger("F1App.Utils.TrackFetch")
 
     if not year or not circuit_key:
@@ -637,106 +640,14 @@ def _fetch_track_data_for_cache(session_key: str, year: Optional[str], circuit_k
             f"Fetch Helper: Invalid year or circuit key ({year}, {circuit_key}) for {session_key}")
         return None
 
-    api_url = config.MULTIVIEWER_CIRCUIT_API_URL_TEMPLATE.format(
-        circuit_key=str(circuit_key), year=str(year))
-    fetch_logger.info(f"Fetch Helper: API fetch initiated for: {api_url}")
-
-    map_api_data: Optional[Dict[str, Any]] = None
-    track_x_coords, track_y_coords, track_linestring_obj, x_range, y_range = [
-        None]*5
-
-    try:
-        response = requests.get(api_url, headers={'User-Agent': config.MULTIVIEWER_API_USER_AGENT},
-                                timeout=config.REQUESTS_TIMEOUT_SECONDS, verify=False)  # Consider verify=True for production
-        response.raise_for_status()
-        map_api_data = response.json()
-
-        temp_x_api = [float(p) for p in map_api_data.get('x', [])]
-        temp_y_api = [float(p) for p in map_api_data.get('y', [])]
-
-        if temp_x_api and temp_y_api and len(temp_x_api) == len(temp_y_api) and len(temp_x_api) > 1 and LineString and np:
-            _api_ls = LineString(zip(temp_x_api, temp_y_api))
-            if _api_ls.length > 0:
-                track_x_coords, track_y_coords, track_linestring_obj = temp_x_api, temp_y_api, _api_ls
-                x_min, x_max = np.min(track_x_coords), np.max(track_x_coords)
-                y_min, y_max = np.min(track_y_coords), np.max(track_y_coords)
-                pad_x = (x_max - x_min) * 0.05
-                pad_y = (y_max - y_min) * 0.05
-                x_range = [x_min - pad_x, x_max + pad_x]
-                y_range = [y_min - pad_y, y_max + pad_y]
-                fetch_logger.info(
-                    f"Fetch Helper: API SUCCESS for {session_key}. Main track line loaded.")
-            else:
-                fetch_logger.warning(
-                    f"Fetch Helper: API {session_key} provided zero-length main track line.")
-        else:
-            fetch_logger.warning(
-                f"Fetch Helper: API {session_key} no valid x/y for main track line or LineString/np missing.")
-    except Exception as e_api:
+    geometry = circuit_geometry.get_geometry(circuit_key, year)
+    if geometry is None:
         fetch_logger.error(
-            f"Fetch Helper: API FAILED for {session_key} (main track data): {e_api}", exc_info=True)
+            f"Fetch Helper: No geometry for circuit {circuit_key} ({year}), session {session_key}")
         return None
-
-    corners_data_processed, marshal_lights_data_processed, marshal_sector_points_raw, marshal_sector_segments_calculated = [
-        None]*4
-    if map_api_data:
-        # Process Corners
-        if 'corners' in map_api_data and isinstance(map_api_data['corners'], list):
-            corners_data_processed = [{'number': c['number'], 'x': c['trackPosition'].get('x'), 'y': c['trackPosition'].get('y')}
-                                      for c in map_api_data['corners'] if isinstance(c, dict) and 'number' in c and isinstance(c.get('trackPosition'), dict)]
-        # Process Marshal Lights
-        if 'marshalLights' in map_api_data and isinstance(map_api_data['marshalLights'], list):
-            marshal_lights_data_processed = [{'number': l['number'], 'x': l['trackPosition'].get('x'), 'y': l['trackPosition'].get('y')}
-                                             for l in map_api_data['marshalLights'] if isinstance(l, dict) and 'number' in l and isinstance(l.get('trackPosition'), dict)]
-        # Process Marshal Sectors
-        if 'marshalSectors' in map_api_data and isinstance(map_api_data['marshalSectors'], list):
-            marshal_sector_points_raw = map_api_data['marshalSectors']
-            if track_x_coords and track_y_coords and np:  # Ensure numpy is available
-                marshal_sector_segments_calculated = {}
-                sorted_ms_api = sorted([ms for ms in marshal_sector_points_raw if isinstance(
-                    ms, dict) and ms.get('number') is not None], key=lambda s: s['number'])
-                sector_start_indices = {}
-                for sector_info in sorted_ms_api:
-                    s_num = sector_info.get('number')
-                    s_pos_dict = sector_info.get('trackPosition')
-                    if s_num is not None and isinstance(s_pos_dict, dict):
-                        s_x, s_y = s_pos_dict.get('x'), s_pos_dict.get('y')
-                        if s_x is not None and s_y is not None:
-                            closest_idx = find_closest_point_index(
-                                track_x_coords, track_y_coords, s_x, s_y)
-                            if closest_idx is not None:
-                                sector_start_indices[s_num] = closest_idx
-
-                sorted_sector_indices_list = sorted(
-                    sector_start_indices.items())
-                if len(sorted_sector_indices_list) == 1:
-                    s_num, s_idx = sorted_sector_indices_list[0]
-                    marshal_sector_segments_calculated[s_num] = (
-                        0, len(track_x_coords) - 1)
-                elif len(sorted_sector_indices_list) > 1:
-                    for i_ms in range(len(sorted_sector_indices_list)):
-                        curr_s_num, curr_s_idx = sorted_sector_indices_list[i_ms]
-                        end_idx = (max(curr_s_idx, sorted_sector_indices_list[i_ms+1][1] - 1)
-                                   if i_ms + 1 < len(sorted_sector_indices_list)
-                                   else len(track_x_coords) - 1)
-                        if curr_s_idx <= end_idx:
-                            marshal_sector_segments_calculated[curr_s_num] = (
-                                curr_s_idx, end_idx)
-                        else:
-                            marshal_sector_segments_calculated[curr_s_num] = (
-                                curr_s_idx, curr_s_idx)
-
-    cache_update_data = {
-        'session_key': session_key, 'x': track_x_coords, 'y': track_y_coords,
-        'linestring': track_linestring_obj, 'range_x': x_range, 'range_y': y_range,
-        'corners_data': corners_data_processed, 'marshal_lights_data': marshal_lights_data_processed,
-        'marshal_sector_points': marshal_sector_points_raw,
-        'marshal_sector_segments': marshal_sector_segments_calculated,
-        'rotation': map_api_data.get('rotation') if map_api_data else None
-    }
     fetch_logger.info(
-        f"Fetch Helper: Returning data for {session_key}. Points: {len(track_x_coords or [])}")
-    return cache_update_data
+        f"Fetch Helper: Returning data for {session_key}. Points: {len(geometry['x'] or [])}")
+    return circuit_geometry.session_cache(geometry, session_key)
 
 
 def _background_track_fetch_and_update_session(session_key: str, year: Optional[str], circuit_key: Optional[str],
@@ -809,10 +720,45 @@ def _decode_and_decompress(encoded_data: str) -> Optional[Dict[Any, Any]]:
         return None
 
 
+def _parse_feed_timestamp(timestamp_str: str) -> Optional[datetime.datetime]:
+    """
+    Fast path for the feed's own timestamp shapes, 'YYYY-MM-DDTHH:MM:SSZ' and
+    'YYYY-MM-DDTHH:MM:SS.f...Z' (1-7 fraction digits, truncated to microseconds like the
+    general parser). The string is rewritten to the one layout fromisoformat accepts on
+    every supported Python ('...SS.ffffff+00:00'), which is parsed in C.
+    Returns None for anything else.
+    """
+    length = len(timestamp_str)
+    if length < 20 or timestamp_str[-1] != 'Z' or timestamp_str[10] != 'T' \
+            or timestamp_str[13] != ':' or timestamp_str[16] != ':':
+        return None
+    if length == 20:
+        normalised = timestamp_str[:19] + '+00:00'
+    else:
+        fraction = timestamp_str[20:-1]
+        if timestamp_str[19] != '.' or not (fraction.isascii() and fraction.isdigit()):
+            return None
+        if len(fraction) < 6:
+            fraction = fraction.ljust(6, '0')
+        normalised = timestamp_str[:20] + fraction[:6] + '+00:00'
+    try:
+        return datetime.datetime.fromisoformat(normalised)
+    except ValueError:
+        return None
+
+
 def parse_iso_timestamp_safe(timestamp_str: Optional[str], line_num_for_log: str = "?") -> Optional[datetime.datetime]:
-    # (Your existing parse_iso_timestamp_safe - seems okay, ensure it returns Optional[datetime.datetime])
     if not timestamp_str or not isinstance(timestamp_str, str):
         return None
+    # Not memoised: most feed timestamps are distinct (timestamp_bench.py), so an LRU only adds overhead
+    parsed_dt = _parse_feed_timestamp(timestamp_str)
+    if parsed_dt is not None:
+        return parsed_dt
+    return _parse_iso_timestamp_general(timestamp_str, line_num_for_log)
+
+
+def _parse_iso_timestamp_general(timestamp_str: str, line_num_for_log: str = "?") -> Optional[datetime.datetime]:
+    """Any ISO-8601 shape fromisoformat accepts, with fraction padding/truncation and offsets."""
     cleaned_ts = timestamp_str.replace('Z', '+00:00')
     # Microsecond padding/truncating logic from your file
     # (Ensuring it pads to 6 digits for microseconds if present)
@@ -875,7 +821,7 @@ def parse_iso_timestamp_safe(timestamp_str: Optional[str], line_num_for_log: str
 
 # format_seconds_to_time_str, parse_session_time_to_seconds, create_empty_figure_with_message
 # parse_feed_time_to_seconds, parse_lap_time_to_seconds, convert_utc_str_to_epoch_ms
-# find_closest_point_index, get_nested_state, pos_sort_key
+# get_nested_state, pos_sort_key
 # These functions from your utils.py are generally pure or rely on config/inputs only,
 # so they don't need changes for session awareness. I'll include them as they were.
 
@@ -962,15 +908,6 @@ def convert_utc_str_to_epoch_ms(timestamp_str: Optional[str]) -> Optional[int]:
     return None
 
 
-def find_closest_point_index(track_x_coords: List[float], track_y_coords: List[float], point_x: float, point_y: float) -> Optional[int]:
-    if not track_x_coords or not track_y_coords or np is None:
-        return None
-    track_points = np.array(list(zip(track_x_coords, track_y_coords)))
-    target_point = np.array([point_x, point_y])
-    distances_squared = np.sum((track_points - target_point)**2, axis=1)
-    return np.argmin(distances_squared)  # type: ignore
-
-
 def get_nested_state(d: Dict[Any, Any], *keys: Any, default: Any = None) -> Any:
     # (Your existing get_nested_state - seems okay)
     val = d
@@ -1058,6 +995,40 @@ def get_current_or_next_session_info() -> Tuple[Optional[str], Optional[str]]:
         return None, None
 
 
+def build_car_positions(session_timing_state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Map marker data per car ({'x', 'y', 'color', 'tla', 'status'}) for the clientside track map.
+    Cars without a valid position are left out.
+    """
+    processed_car_data = {}
+    for car_num_str, driver_state in session_timing_state.items():
+        if not isinstance(driver_state, dict):
+            continue
+
+        pos_data = driver_state.get('PositionData')
+        if not pos_data or 'X' not in pos_data or 'Y' not in pos_data:
+            continue
+
+        try:
+            x_val = float(pos_data['X'])
+            y_val = float(pos_data['Y'])
+        except (TypeError, ValueError):
+            continue
+
+        team_colour_hex = driver_state.get('TeamColour', '808080')
+        if not team_colour_hex.startswith('#'):
+            team_colour_hex = '#' + team_colour_hex
+
+        processed_car_data[car_num_str] = {
+            'x': x_val,
+            'y': y_val,
+            'color': team_colour_hex,
+            'tla': driver_state.get('Tla', car_num_str),
+            'status': driver_state.get('Status', 'Unknown').lower()
+        }
+    return processed_car_data
+
+
 def generate_driver_options(session_timing_state: Dict[str, Any]) -> List[Dict[str, str]]:
     """
     Generates list of options for driver dropdowns from a session's timing_state.